@@ -0,0 +1,726 @@
+#! /usr/bin/env python3
+
+# Copyright 2023 Hal W Canary III, Lindsay R Saunders PhD.
+# Use of this program is governed by contents of the LICENSE file.
+
+'''
+Measure the throughput of bioscript routines on a synthetic FASTA database.
+
+With --stages, instead write a synthetic database file and ranking CSV file,
+time each stage of processing them separately, and optionally save the
+results as JSON, to compare across versions.
+'''
+
+import argparse
+import bisect
+import collections
+import csv
+import functools
+import gzip
+import io
+import itertools
+import json
+import logging
+import os
+import platform
+import random
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import bestSequenceEachSpecies as bioscript
+import concat_fasta
+import fasta_format
+import ranked_match
+from packed_sequence import PackedSequence
+
+
+def make_random_sequence(r):
+    n = r.randrange(700, 2100)
+    return ''.join(r.choices('ACGTYKRSW', weights=[99, 99, 99, 99, 1, 1, 1, 1, 1], k=n))
+
+
+def make_fasta_database(size, seed=0):
+    '''
+    @param size approximate number of characters to generate.
+    @param seed random seed, so that runs are reproducible.
+    @return string in FASTA format.
+    '''
+    r = random.Random(seed)
+    b = io.StringIO()
+    index = 0
+    while b.tell() < size:
+        description = 'XX%06d.1 Genus%d epithet%d strain S%d 16S ribosomal RNA gene' % (
+            index, r.randrange(20), r.randrange(50), r.randrange(5))
+        fasta_format.print_fasta_description(b, description, make_random_sequence(r))
+        index += 1
+    return b.getvalue()
+
+
+def legacy_parse_fasta_format(f):
+    '''
+    The line-at-a-time parser that `fasta_format.parse_fasta_format`
+    replaced, kept for comparison.
+    '''
+    description, sequence = None, None
+    for line in f:
+        if line.startswith('>'):
+            if description and sequence:
+                yield (description, sequence)
+            description, sequence = line[1:].strip(), ''
+        elif sequence is not None:
+            sequence += line.strip()
+    if description and sequence:
+        yield (description, sequence)
+
+
+def text_file(data):
+    '''
+    @return a text-mode file object reading bytes `data`, which decodes
+            just like a file opened with `open(path)`.
+    '''
+    return io.TextIOWrapper(io.BytesIO(data), encoding='utf-8')
+
+
+def bench_legacy_parse(data):
+    for _ in legacy_parse_fasta_format(text_file(data)):
+        pass
+
+
+def bench_parse(data):
+    for _ in fasta_format.parse_fasta_format(text_file(data)):
+        pass
+
+
+def bench_parse_binary(data):
+    for _ in fasta_format.parse_fasta_format(io.BytesIO(data)):
+        pass
+
+
+@functools.lru_cache(maxsize=2)
+def parsed_records(data, binary=False):
+    '''
+    @return list of (accession, description, sequence) tuples from bytes `data`.
+    '''
+    f = io.BytesIO(data) if binary else text_file(data)
+    return [(description.split()[0], description, sequence)
+            for description, sequence in fasta_format.parse_fasta_format(f)]
+
+
+def legacy_get_score(accession, description, sequence):
+    '''
+    The per-character `get_score` that `bestSequenceEachSpecies.get_score`
+    replaced, kept for comparison.
+    '''
+    agtc_count = sum(1 for c in sequence if c in ['A', 'G', 'T', 'C'])
+    return (
+        1 if ' type strain ' in description else 0,
+        float(agtc_count) / len(sequence),
+        1 if accession.startswith('NR_') else 0,
+        len(sequence),
+    )
+
+
+def bench_legacy_score(data):
+    for v in parsed_records(data):
+        legacy_get_score(*v)
+
+
+def bench_score(data):
+    for v in parsed_records(data):
+        bioscript.get_score(*v)
+
+
+def bench_score_binary(data):
+    for v in parsed_records(data, True):
+        bioscript.get_score(*v)
+
+
+def bench_score_batch(data):
+    records = parsed_records(data, True)
+    for i in range(0, len(records), 1024):
+        bioscript.get_scores(records[i:i + 1024])
+
+
+_legacyStrainRe = re.compile(
+    r'^(\S+) (\S+) (\S+) ((?:.* )?)(strain .*?)( 16S(?: .*)?)$')
+_legacyStrainRe2 = re.compile(
+    r'^(\S+) (\S+) (\S+) ((?:.* )?)\((strain .*?)\)((?: .*)?)$')
+_legacyStrainRe3 = re.compile(
+    r'^(\S+) (\S+) (\S+) ((?:.* )?)(strain \S+(?: \S+)?)((?: .*)??)$')
+
+
+def legacy_process_sequence_description(description):
+    '''
+    The regular-expression version of
+    `bestSequenceEachSpecies.process_sequence_description`, kept for
+    comparison.
+    '''
+    m = _legacyStrainRe.match(description)
+    if m is None:
+        m = _legacyStrainRe2.match(description)
+    if m is None:
+        m = _legacyStrainRe3.match(description)
+    if m is not None:
+        accession, genus, epithet, extra1, strain, extra2 = m.groups()
+        species = genus + '_' + epithet
+        strain = species + '_' + strain.replace(' ', '_')
+        extra = (extra1 if extra1 else '') + extra2.strip()
+    else:
+        fields = description.split()
+        if len(fields) < 3:
+            raise ValueError('Unable to parse description: %r' % description)
+        (accession, genus, epithet), extra = fields[:3], ' '.join(fields[3:])
+        species = genus + '_' + epithet
+        strain = species + '_' + accession
+    new_description = ' '.join([strain, extra, accession])
+    return bioscript.ProcessedDescription(genus, species, strain, accession, new_description)
+
+
+def description_corpus(seed=0):
+    '''
+    @return list of descriptions: typical NCBI forms, and long ones built to
+            make backtracking regular expressions slow.
+    '''
+    r = random.Random(seed)
+    corpus = [
+        'NR_041545.1 Arthrobacter nicotianae strain DSM 20123 16S ribosomal RNA, partial sequence',
+        'KF787109.1 Arthrobacter nicotianae strain BSc 4 16S ribosomal RNA gene, partial sequence',
+        'MT263011.1 Bacillus cereus (strain ATCC 14579) complete genome',
+        'AB123456.1 Bacillus sp. strain X1 16S rRNA',
+        'OQ282964.1 Glutamicibacter arilaitensis isolate 5-2 small subunit ribosomal RNA gene',
+        'CP012345.1 Escherichia coli strain K-12 substr. MG1655 chromosome, complete genome',
+    ]
+    words = ['strain', 'strain', '16S', '(strain', 'x)', 'ribosomal', 'RNA', 'type', 'NR_']
+    for _ in range(200):
+        corpus.append('XX%d.1 Genus epithet %s' % (
+            r.randrange(1000), ' '.join(r.choice(words) for _ in range(r.randrange(1, 30)))))
+    for n in [10, 100, 1000]:
+        corpus.append('XX1.1 Genus epithet ' + 'isolate strain ' * n)
+        corpus.append('XX1.1 Genus epithet ' + '(strain x ' * n)
+        corpus.append('XX1.1 Genus epithet ' + 'x ' * (20 * n) + '16S')
+    return corpus
+
+
+def synthetic_records(count, seed=0):
+    '''
+    @yield `count` (description, sequence, payload) tuples, each of a
+           different strain, so that all of them are retained.  All share one
+           sequence, so only the memory used per record is measured.
+    '''
+    r = random.Random(seed)
+    sequence = b'ACGT' * 250
+    for index in range(count):
+        yield ('XX%07d.1 Genus%d epithet%d strain S%d 16S ribosomal RNA gene' % (
+            index, r.randrange(20), r.randrange(500), index), sequence, index)
+
+
+def legacy_collect_each_species(records):
+    '''
+    The map of lists of every record that
+    `bestSequenceEachSpecies.select_best_each_species` replaced, kept for
+    comparison.
+    '''
+    speciesSequenceListMap = collections.defaultdict(lambda: collections.defaultdict(list))
+    for description, sequence, payload in records:
+        info = legacy_process_sequence_description(description)
+        speciesSequenceListMap[info.species][info.strain].append(
+            (info.accession, info.description, payload))
+    return speciesSequenceListMap
+
+
+def select_each_species(records):
+    return bioscript.select_best_each_species(records, None, logging.getLogger('benchmark'), 0)
+
+
+def select_each_species_with_sequences(records, pack=None):
+    '''
+    Retains a copy of each sequence as its payload, as when reading a text
+    file.
+    '''
+    return bioscript.select_best_each_species(
+        ((description, sequence, sequence.decode()) for description, sequence, _ in records),
+        None, logging.getLogger('benchmark'), 0, pack=pack)
+
+
+MEMORY_BENCHMARKS = [
+    ('retained records (legacy)', legacy_collect_each_species),
+    ('retained records', select_each_species),
+    ('retained records with sequences', select_each_species_with_sequences),
+    ('retained records with sequences (packed)',
+     functools.partial(select_each_species_with_sequences, pack=PackedSequence)),
+]
+
+
+def run_memory(count, output):
+    '''
+    Reports the memory held per record by each way of retaining `count`
+    records, as measured by `tracemalloc`.
+    '''
+    for name, function in MEMORY_BENCHMARKS:
+        tracemalloc.start()
+        result = function(synthetic_records(count))
+        size, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del result
+        output.write('%-48s %10.1f bytes/record\n' % (name, size / count))
+
+
+###################################################################################################
+# Stages
+###################################################################################################
+
+# Forms of description, as (weight, format).  Most name a strain in one of the
+# ways `process_sequence_description` recognizes.
+DESCRIPTION_FORMS = [
+    (50, '{accession} {genus} {epithet} strain {strain} 16S ribosomal RNA gene, partial sequence'),
+    (10, '{accession} {genus} {epithet} strain {strain} 16S ribosomal RNA, type strain'),
+    (10, '{accession} {genus} {epithet} (strain {strain}) complete genome'),
+    (10, '{accession} {genus} {epithet} strain {strain} substr. X1 chromosome'),
+    (10, '{accession} {genus} {epithet} isolate {strain} 16S rRNA gene'),
+    (5, '{accession} {genus} sp. strain {strain} 16S ribosomal RNA gene'),
+    (5, '{accession} {genus} {epithet} 16S rRNA'),
+]
+
+
+def _zipf_weights(n, skew):
+    return list(itertools.accumulate(1.0 / (k + 1) ** skew for k in range(n)))
+
+
+def _choose(r, cumulativeWeights):
+    return bisect.bisect(cumulativeWeights, r.random() * cumulativeWeights[-1])
+
+
+def synthetic_database(size, seed=0, skew=1.0, genera=200, species=50, strains=20):
+    '''
+    @param size approximate number of bytes of FASTA to produce.
+    @param skew exponent of the Zipf-like distributions from which genera,
+           species, and strains are drawn; 0 draws them evenly.
+    @yield (description, sequence) records, reproducibly for each `seed`.
+           Descriptions take the forms of DESCRIPTION_FORMS.  Sequences are
+           drawn from a pool, at random lengths, so that generating even
+           10 GB takes minutes.
+    '''
+    r = random.Random(seed)
+    pool = [make_random_sequence(r).encode() for _ in range(256)]
+    forms = [form for _, form in DESCRIPTION_FORMS]
+    formWeights = list(itertools.accumulate(w for w, _ in DESCRIPTION_FORMS))
+    genusWeights = _zipf_weights(genera, skew)
+    speciesWeights = _zipf_weights(species, skew)
+    strainWeights = _zipf_weights(strains, skew)
+    produced, index = 0, 0
+    while produced < size:
+        genus = _choose(r, genusWeights)
+        description = forms[_choose(r, formWeights)].format(
+            accession='%s%08d.1' % ('NR_' if r.random() < 0.2 else 'XX', index),
+            genus='Genus%d' % genus,
+            epithet='epithet%d' % _choose(r, speciesWeights),
+            strain='S%d' % _choose(r, strainWeights))
+        sequence = r.choice(pool)
+        sequence = sequence[r.randrange(len(sequence) // 2):]
+        yield description, sequence
+        produced += len(description) + len(sequence) + len(sequence) // 70 + 4
+        index += 1
+
+
+def write_synthetic_database(path, size, seed=0, skew=1.0):
+    with open(path, 'wb') as o, fasta_format.FastaWriter(o) as writer:
+        for description, sequence in synthetic_database(size, seed, skew):
+            writer.write(description, sequence)
+
+
+def write_ranking_csv(path, rows, columns, seed=0, skew=1.0):
+    '''
+    Writes a ranking CSV file for `ranked_match`: a row of `columns` names,
+    then `rows` rows of topic numbers, in which popular topics come up more
+    often.
+    '''
+    r = random.Random(seed)
+    topics = range(max(rows, columns))
+    topicWeights = _zipf_weights(len(topics), skew)
+    with open(path, 'w', newline='') as o:
+        writer = csv.writer(o)
+        writer.writerow(['Name%d' % i for i in range(columns)])
+        for _ in range(rows):
+            writer.writerow(r.choices(topics, cum_weights=topicWeights, k=columns))
+
+
+class CountingSink(io.RawIOBase):
+    '''
+    A binary file object that discards what is written, counting its bytes.
+    '''
+    def __init__(self):
+        super().__init__()
+        self.size = 0
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self.size += len(b)
+        return len(b)
+
+
+def _parsed_batches(path, size=1024):
+    with open(path, 'rb') as f:
+        records = fasta_format.parse_fasta_format(f)
+        while True:
+            batch = list(itertools.islice(records, size))
+            if not batch:
+                return
+            yield batch
+
+
+def stage_parse(paths, count):
+    start, records = time.perf_counter(), 0
+    with open(paths.fasta, 'rb') as f:
+        for _ in fasta_format.parse_fasta_format(f):
+            records += 1
+    return time.perf_counter() - start, os.path.getsize(paths.fasta), records
+
+
+def stage_describe(paths, count):
+    '''
+    Times only `process_sequence_description`, on batches of parsed records.
+    '''
+    elapsed, size, records = 0.0, 0, 0
+    for batch in _parsed_batches(paths.fasta):
+        start = time.perf_counter()
+        for description, _ in batch:
+            bioscript.process_sequence_description(description)
+        elapsed += time.perf_counter() - start
+        size += sum(len(description) for description, _ in batch)
+        records += len(batch)
+    return elapsed, size, records
+
+
+def stage_score(paths, count):
+    '''
+    Times only `get_scores`, on batches of parsed records.
+    '''
+    elapsed, size, records = 0.0, 0, 0
+    for batch in _parsed_batches(paths.fasta):
+        values = [(description.split(' ', 1)[0], description, sequence)
+                  for description, sequence in batch]
+        start = time.perf_counter()
+        bioscript.get_scores(values)
+        elapsed += time.perf_counter() - start
+        size += sum(len(sequence) for _, sequence in batch)
+        records += len(batch)
+    return elapsed, size, records
+
+
+def _select(paths, count):
+    with open(paths.fasta, 'rb') as f:
+        records = ((description, sequence, sequence)
+                   for description, sequence in fasta_format.parse_fasta_format(f))
+        return bioscript.select_best_each_species(
+            records, None, logging.getLogger('benchmark'), count)
+
+
+def stage_select(paths, count):
+    '''
+    Times `select_best_each_species`, less the time taken to parse.
+    '''
+    start = time.perf_counter()
+    sourceCount, _, _ = _select(paths, count)
+    elapsed = time.perf_counter() - start
+    parseElapsed, size, _ = stage_parse(paths, count)
+    return max(elapsed - parseElapsed, 0.0), size, sourceCount
+
+
+def stage_write(paths, count):
+    '''
+    Times `write_best_each_species`, writing the selected records.
+    '''
+    selection = _select(paths, count)
+    sink = CountingSink()
+    start = time.perf_counter()
+    bioscript.write_best_each_species(
+        sink, None, logging.getLogger('benchmark'), *selection[:2], selection[2])
+    return time.perf_counter() - start, sink.size, sum(
+        len(bestStrains.strains) for bestStrains in selection[2].values())
+
+
+def stage_end_to_end(paths, count):
+    sink = CountingSink()
+    start = time.perf_counter()
+    with open(paths.fasta, 'rb') as f:
+        bioscript.get_best_sequence_each_species(
+            f, sink, None, logging.getLogger('benchmark'), count)
+    return time.perf_counter() - start, os.path.getsize(paths.fasta), None
+
+
+def stage_concat(paths, count):
+    sink = CountingSink()
+    start = time.perf_counter()
+    concat_fasta.concat([paths.fasta], sink, logging.getLogger('benchmark'))
+    return time.perf_counter() - start, os.path.getsize(paths.fasta), None
+
+
+def stage_ranked_match(paths, count):
+    '''
+    Times `rankedMatch`, after the file is parsed.
+    '''
+    with open(paths.ranking, newline='') as f:
+        data = ranked_match.parseCSVFile(f)
+    start = time.perf_counter()
+    ranked_match.rankedMatch(*ranked_match.getPrefs(data))
+    return time.perf_counter() - start, os.path.getsize(paths.ranking), len(data)
+
+
+def stage_parse_ranking(paths, count):
+    start = time.perf_counter()
+    with open(paths.ranking, newline='') as f:
+        rows = len(ranked_match.parseCSVFile(f))
+    return time.perf_counter() - start, os.path.getsize(paths.ranking), rows
+
+
+STAGES = [
+    ('parse', stage_parse),
+    ('process descriptions', stage_describe),
+    ('score', stage_score),
+    ('select', stage_select),
+    ('write', stage_write),
+    ('get_best_sequence_each_species', stage_end_to_end),
+    ('concat', stage_concat),
+    ('parse ranking CSV', stage_parse_ranking),
+    ('rankedMatch', stage_ranked_match),
+]
+
+StagePaths = collections.namedtuple('StagePaths', ['fasta', 'ranking'])
+
+
+def _git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def time_stages(paths, count, repeat):
+    '''
+    Runs each of STAGES `repeat` times on the files named by `paths`.
+    @return list of dicts, one per stage, of the best time and the rates.
+    '''
+    results = []
+    for name, function in STAGES:
+        best = None
+        for _ in range(repeat):
+            elapsed, size, records = function(paths, count)
+            best = elapsed if best is None else min(best, elapsed)
+        results.append({
+            'stage': name, 'seconds': best, 'bytes': size, 'records': records,
+            'MB/s': size / best / 1e6 if best else None,
+            'records/s': records / best if records is not None and best else None})
+    return results
+
+
+def run_stages(args):
+    directory = args.directory or tempfile.mkdtemp()
+    try:
+        os.makedirs(directory, exist_ok=True)
+        paths = StagePaths(os.path.join(directory, 'synthetic.fasta'),
+                           os.path.join(directory, 'ranking.csv'))
+        start = time.perf_counter()
+        write_synthetic_database(paths.fasta, args.size * 1000000, args.seed, args.skew)
+        write_ranking_csv(paths.ranking, args.ranking_rows, args.ranking_columns, args.seed,
+                          args.skew)
+        sys.stderr.write('Wrote synthetic files in %.1f s\n' % (time.perf_counter() - start))
+        results = time_stages(paths, args.count, args.repeat)
+    finally:
+        if not args.directory:
+            shutil.rmtree(directory)
+    for result in results:
+        sys.stdout.write('%-48s %10s %12s %10.4f s\n' % (
+            result['stage'],
+            '' if result['MB/s'] is None else '%.1f MB/s' % result['MB/s'],
+            '' if result['records/s'] is None else '%.0f rec/s' % result['records/s'],
+            result['seconds']))
+    if args.json:
+        with args.json:
+            json.dump({
+                'revision': _git_revision(),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'numpy': bioscript.numpy is not None,
+                'parameters': {
+                    'size': args.size, 'seed': args.seed, 'skew': args.skew,
+                    'count': args.count, 'repeat': args.repeat,
+                    'rankingRows': args.ranking_rows, 'rankingColumns': args.ranking_columns},
+                'stages': results,
+            }, args.json, indent=2)
+            args.json.write('\n')
+
+
+def bench_print(data):
+    with open(os.devnull, 'wb') as o:
+        for _, description, sequence in parsed_records(data, True):
+            fasta_format.print_fasta_description(o, description, sequence)
+
+
+def bench_writer(data):
+    with open(os.devnull, 'wb') as o, fasta_format.FastaWriter(o) as writer:
+        for _, description, sequence in parsed_records(data, True):
+            writer.write(description, sequence)
+
+
+@functools.lru_cache(maxsize=1)
+def gzip_compressed(data):
+    return gzip.compress(data, 6)
+
+
+def _best_each_species(data, pipeline):
+    with open(os.devnull, 'wb') as o:
+        bioscript.get_best_sequence_each_species(
+            gzip.GzipFile(fileobj=io.BytesIO(gzip_compressed(data))), o, None,
+            logging.getLogger('benchmark'), 2, pipeline=pipeline)
+
+
+def bench_best_each_species(data):
+    _best_each_species(data, False)
+
+
+def bench_best_each_species_pipeline(data):
+    _best_each_species(data, True)
+
+
+@functools.lru_cache(maxsize=1)
+def _description_corpus():
+    return description_corpus()
+
+
+def bench_legacy_descriptions(data):
+    for description in _description_corpus():
+        legacy_process_sequence_description(description)
+    return sum(map(len, _description_corpus()))
+
+
+def bench_descriptions(data):
+    for description in _description_corpus():
+        bioscript.process_sequence_description(description)
+    return sum(map(len, _description_corpus()))
+
+
+BENCHMARKS = [
+    ('parse_fasta_format (legacy)', bench_legacy_parse),
+    ('parse_fasta_format', bench_parse),
+    ('parse_fasta_format (binary)', bench_parse_binary),
+    ('get_score (legacy)', bench_legacy_score),
+    ('get_score', bench_score),
+    ('get_score (binary)', bench_score_binary),
+    ('get_scores (batch%s)' % ('' if bioscript.numpy else ', no NumPy'), bench_score_batch),
+    ('print_fasta_description', bench_print),
+    ('FastaWriter', bench_writer),
+    ('get_best_sequence_each_species (gzip)', bench_best_each_species),
+    ('get_best_sequence_each_species (gzip, pipeline)', bench_best_each_species_pipeline),
+    ('process_sequence_description corpus (legacy)', bench_legacy_descriptions),
+    ('process_sequence_description corpus', bench_descriptions),
+]
+
+
+def run(data, repeat, output):
+    '''
+    Runs each benchmark `repeat` times and reports the best throughput.
+    @param data bytes of a FASTA database.
+
+    A benchmark that processes something other than `data` returns the
+    number of bytes it processed.
+    '''
+    # Parse outside of the timed loops, for the benchmarks that need records.
+    parsed_records(data)
+    parsed_records(data, True)
+    gzip_compressed(data)
+    for name, function in BENCHMARKS:
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            size = function(data)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        size = len(data) if size is None else size
+        output.write('%-48s %10.1f MB/s %10.4f s\n' % (name, size / best / 1e6, best))
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        exit_on_error=False, description=__doc__)
+    parser.add_argument(
+        '--size',
+        type=int,
+        default=64,
+        help='Size of synthetic database in megabytes. (default: 64)')
+    parser.add_argument(
+        '--repeat',
+        type=int,
+        default=3,
+        help='Number of times to run each benchmark. (default: 3)')
+    parser.add_argument(
+        '--seed',
+        type=int,
+        default=0,
+        help='Random seed for synthetic data. (default: 0)')
+    parser.add_argument(
+        '--memory-records',
+        type=int,
+        default=0,
+        help='Also measure the memory used to retain this many records. (default: 0)')
+    parser.add_argument(
+        '--stages',
+        action='store_true',
+        help='Time each stage on a synthetic database file of --size megabytes, '
+             'rather than measuring throughput in memory.')
+    parser.add_argument(
+        '--skew',
+        type=float,
+        default=1.0,
+        help='With --stages, how unevenly records are spread among genera, '
+             'species, and strains: 0 for evenly, larger for more unevenly. '
+             '(default: 1.0)')
+    parser.add_argument(
+        '--count',
+        type=int,
+        default=1,
+        help='With --stages, how many strains to select for each species. (default: 1)')
+    parser.add_argument(
+        '--ranking-rows',
+        type=int,
+        default=10000,
+        help='With --stages, number of rows of the ranking CSV file. (default: 10000)')
+    parser.add_argument(
+        '--ranking-columns',
+        type=int,
+        default=100,
+        help='With --stages, number of names in the ranking CSV file. (default: 100)')
+    parser.add_argument(
+        '--directory',
+        help='With --stages, where to write the synthetic files, which are kept. '
+             '(default: a temporary directory, removed afterwards)')
+    parser.add_argument(
+        '--json',
+        type=argparse.FileType('w'),
+        help='With --stages, also write the results to this file as JSON.')
+    return parser.parse_args(argv)
+
+
+def main():
+    args = parse_args(sys.argv[1:])
+    if args.stages:
+        logging.basicConfig(format='%(levelname)s:  %(message)s', level='WARNING')
+        run_stages(args)
+        return
+    data = make_fasta_database(args.size * 1000000, args.seed).encode()
+    run(data, args.repeat, sys.stdout)
+    if args.memory_records:
+        run_memory(args.memory_records, sys.stdout)
+
+
+if __name__ == '__main__':
+    main()
@@ -29,69 +29,64 @@ fields in the description.
 
 import argparse
 import collections
+import concurrent.futures
+import contextlib
+import hashlib
+import heapq
+import io
+import itertools
 import logging
+import mmap
 import os
+import pickle
 import re
+import stat
+import struct
 import sys
+import tempfile
+import zlib
 
-_noSpeciesRe = re.compile(r'^\S+ \S+ sp. ')
-_strainRe = re.compile(
-    r'^(\S+) (\S+) (\S+) ((?:.* )?)(strain .*?)( 16S(?: .*)?)$')
-_strainRe2 = re.compile(
-    r'^(\S+) (\S+) (\S+) ((?:.* )?)\((strain .*?)\)((?: .*)?)$')
-_strainRe3 = re.compile(
-    r'^(\S+) (\S+) (\S+) ((?:.* )?)(strain \S+(?: \S+)?)((?: .*)??)$')
-
-###################################################################################################
-# FASTA file format parsing functions
-# These may be moved to another package at a later time.
-###################################################################################################
-
-
-def parse_fasta_format(f):
-    '''
-    @param f file object open for reading in FASTA format.
-    @yield tuples of form (description, sequence)
-
-    Ignores data before the first description.
-    '''
-    description, sequence = None, None
-    for line in f:
-        if line.startswith('>'):
-            if description and sequence:
-                yield (description, sequence)
-            # Remove '>' character
-            description, sequence = line[1:].strip(), ''
-        elif sequence is not None:
-            sequence += line.strip()
-    if description and sequence:
-        yield (description, sequence)
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
+from compressed_io import compressed_output, is_compressed, open_input
+from fasta_format import (
+    BLOCK_SIZE, FastaWriter, FileRange, LineLengthError, chunk_fasta_file, fetch_sequence,
+    index_fasta, parse_fasta_format, print_fasta_description, read_fasta_index,
+    read_indexed_description, read_sequence, scan_fasta_format, split_fasta_file, split_str,
+    write_fasta_index, write_indexed_record)
+from packed_sequence import PackedSequence
+from progress import ProgressReporter
+from result_cache import ResultCache, cache_key
+from run_stats import RunStats, stage
+from score_index import (
+    IndexedRecord, open_score_index, query_records, record_count, write_score_index)
+from sequence_database import (
+    NO_SPECIES, REFSEQ, TYPE_STRAIN, SequenceDatabase, SequenceDatabaseWriter,
+    is_sequence_database)
+from threaded_io import ReadAheadReader, WriteBehindWriter
 
-def print_fasta_description(o, description, sequence):
-    '''
-    @param o file object open for writing.
-    @param description string describing the sequence.
-           The '>' character is prepended.
-    @param sequence string in FASTA Sequence Representation.
-    '''
-    o.write('>%s\n%s\n\n' % (description, split_str(sequence, 70)))
+# Changed whenever cached results would differ from new ones.
+CACHE_VERSION = 2
 
+# Size of the parts of a file whose best records are cached separately.
+CACHE_CHUNK_SIZE = 1 << 24
 
-def split_str(s, n):
-    '''
-    Inserts newlines into string `s` so that lines are no longer than
-    `n` characters long.
-    '''
-    return '\n'.join(s[i:i+n] for i in range(0, len(s), n))
-
-
-###################################################################################################
+_noSpeciesRe = re.compile(r'^\S+ \S+ sp. ')
+_whitespaceRe = re.compile(r'\s')
+_tokenRe = re.compile(r'\S+')
 
 
 ProcessedDescription = collections.namedtuple(
     'ProcessedDescription', ['genus', 'species', 'strain', 'accession', 'description'])
 
+if numpy is not None:
+    # Lookup table: 1 for each of 'A', 'G', 'T', 'C', otherwise 0.
+    _numpyAgtc = numpy.zeros(256, dtype=numpy.int64)
+    _numpyAgtc[list(b'AGTC')] = 1
+
 
 def process_sequence_description(description):
     '''
@@ -105,41 +100,200 @@ def process_sequence_description(description):
     New description is:
     "GENUS_..._strain [MORE...] ACCESSION"
     '''
-    m = _strainRe.match(description)
-    if m is None:
-        m = _strainRe2.match(description)
-    if m is None:
-        m = _strainRe3.match(description)
+    fields = description.split(' ', 3)
+    m = None
+    if len(fields) == 4 and all(_is_token(f) for f in fields[:3]):
+        m = _split_strain(fields[3])
     if m is not None:
-        accession, genus, epithet, extra1, strain, extra2 = m.groups()
-        species = genus + '_' + epithet
+        (accession, genus, epithet), (extra1, strain, extra2) = fields[:3], m
+        # Interned, so that all records of a species share one copy of each name.
+        genus, species = sys.intern(genus), sys.intern(genus + '_' + epithet)
         strain = species + '_' + strain.replace(' ', '_')
-        extra = (extra1 if extra1 else '') + extra2.strip()
+        extra = extra1 + extra2.strip()
     else:
         fields = description.split()
         if len(fields) < 3:
             # `description` is missing an epithet; this is an error.
             raise ValueError('Unable to parse description: %r' % description)
         (accession, genus, epithet), extra = fields[:3], ' '.join(fields[3:])
-        species = genus + '_' + epithet
+        genus, species = sys.intern(genus), sys.intern(genus + '_' + epithet)
         strain = species + '_' + accession
     new_description = ' '.join([strain, extra, accession])
     return ProcessedDescription(genus, species, strain, accession, new_description)
 
 
+def _is_token(s):
+    return bool(s) and _whitespaceRe.search(s) is None
+
+
+def _split_strain(rest):
+    '''
+    @param rest the part of a description after "ACCESSION GENUS EPITHET ".
+    @return tuple (extra1, strain, extra2) of the text before, of, and after
+            the strain, or None if `rest` names no strain.
+
+    In order of preference, the strain is one of:
+        "... strain NAME 16S ..."
+        "... (strain NAME) ..."
+        "... strain WORD [WORD] ..."
+    For each form, the last "strain" that fits is used.
+
+    The string is scanned with find() and rfind(), so the time taken is
+    linear in its length even when "strain" appears many times.
+    '''
+    return (_split_strain_16s(rest) or _split_strain_parenthesized(rest) or
+            _split_strain_words(rest))
+
+
+def _rfind_word(s, word, end):
+    '''
+    @return the last position, before `end`, of `word` preceded by a space or
+            at the start of `s`, or -1.
+    '''
+    while True:
+        p = s.rfind(word, 0, end)
+        if p <= 0 or s[p - 1] == ' ':
+            return p
+        end = p + len(word) - 1
+
+
+def _find_suffix(s, suffix, start, end=None):
+    '''
+    @return the first (or if `end` is set, the last before `end`) position of
+            `suffix`, at or after `start`, that is followed by a space or the
+            end of `s`, or -1.
+    '''
+    n = len(suffix)
+    while True:
+        if end is None:
+            p = s.find(suffix, start)
+        else:
+            p = s.rfind(suffix, start, end)
+        if p < 0 or p + n == len(s) or s[p + n] == ' ':
+            return p
+        if end is None:
+            start = p + 1
+        else:
+            end = p + n - 1
+
+
+def _split_strain_16s(rest):
+    last16s = _find_suffix(rest, ' 16S', 0, len(rest))
+    if last16s < 0:
+        return None
+    p = _rfind_word(rest, 'strain ', last16s)
+    if p < 0:
+        return None
+    q = _find_suffix(rest, ' 16S', p + 7)
+    return rest[:p], rest[p:q], rest[q:]
+
+
+def _split_strain_parenthesized(rest):
+    lastParen = _find_suffix(rest, ')', 0, len(rest))
+    if lastParen < 0:
+        return None
+    p = _rfind_word(rest, '(strain ', lastParen)
+    if p < 0:
+        return None
+    q = _find_suffix(rest, ')', p + 8)
+    return rest[:p], rest[p + 1:q], rest[q + 1:]
+
+
+def _split_strain_words(rest):
+    end = len(rest)
+    while True:
+        p = _rfind_word(rest, 'strain ', end)
+        if p < 0:
+            return None
+        end = p + 6
+        word = _tokenRe.match(rest, p + 7)
+        if word is None:
+            continue
+        i = word.end()
+        if i == len(rest):
+            return rest[:p], rest[p:], ''
+        if rest[i] != ' ':
+            continue
+        word = _tokenRe.match(rest, i + 1)
+        if word is not None:
+            j = word.end()
+            if j == len(rest) or rest[j] == ' ':
+                return rest[:p], rest[p:j], rest[j:]
+        return rest[:p], rest[p:i], rest[i:]
+
+
 def get_score(accession, description, sequence):
     '''
     Returns a comparable 4-tuple of non-negative numbers.
+
+    `sequence` may be a string or bytes-like.
     '''
-    agtc_count = sum(1 for c in sequence if c in ['A', 'G', 'T', 'C'])
+    return _make_score(accession, description, count_agtc(sequence), len(sequence))
+
+
+def _make_score(accession, description, agtc_count, length):
     return (
         1 if ' type strain ' in description else 0,
-        float(agtc_count) / len(sequence),
+        float(agtc_count) / length,
         1 if accession.startswith('NR_') else 0,
-        len(sequence),
+        length,
     )
 
 
+_double = struct.Struct('<d')
+
+
+def pack_score(score):
+    '''
+    @param score tuple returned by `get_score`.
+    @return one int that orders exactly as `score` does, and takes about a
+            third of the memory.  The bit pattern of a non-negative double
+            orders as its value does.
+    '''
+    typeStrain, fraction, refseq, length = score
+    fractionBits = int.from_bytes(_double.pack(fraction), 'little')
+    return (((typeStrain << 64 | fractionBits) << 1 | refseq) << 64) | length
+
+
+def count_agtc(sequence):
+    '''
+    @return the number of 'A', 'G', 'T' and 'C' characters in `sequence`,
+            counted by C loops rather than by iterating in Python.
+    '''
+    if isinstance(sequence, PackedSequence):
+        return sequence.agtcCount
+    if isinstance(sequence, str):
+        if not sequence.isascii():
+            return (sequence.count('A') + sequence.count('G') +
+                    sequence.count('T') + sequence.count('C'))
+        # Encoding ASCII is a copy, and one translate() beats four count()s.
+        sequence = sequence.encode('ascii')
+    elif not isinstance(sequence, bytes):
+        sequence = bytes(sequence)
+    return len(sequence) - len(sequence.translate(None, b'AGTC'))
+
+
+def get_scores(values):
+    '''
+    @param values list of (accession, description, sequence) tuples.
+    @return list of `get_score` results for each of `values`.
+
+    If NumPy is installed, the bases of the whole batch are counted at once.
+    '''
+    if numpy is None or not values:
+        return [get_score(*v) for v in values]
+    sequences = [v[2].encode() if isinstance(v[2], str) else v[2] for v in values]
+    lengths = [len(v[2]) for v in values]
+    if sum(lengths) != sum(map(len, sequences)) or not all(lengths):
+        # Non-ASCII or empty sequences; let `get_score` handle them.
+        return [get_score(*v) for v in values]
+    offsets = numpy.cumsum([0] + lengths[:-1])
+    bases = numpy.frombuffer(b''.join(sequences), dtype=numpy.uint8)
+    counts = numpy.add.reduceat(_numpyAgtc[bases], offsets).tolist()
+    return [_make_score(accession, description, agtc_count, length)
+            for (accession, description, _), agtc_count, length in zip(values, counts, lengths)]
+
+
 def get_best_sequence(values, count=1):
     '''
     @param values nonempty list of (accession, description, sequence) tuples.
@@ -151,56 +305,972 @@ def get_best_sequence(values, count=1):
     return sorted(values, key=lambda v: get_score(*v))[-min(len(values), count):]
 
 
-# TODO(halcanry): Add unit tests for this function.
-def get_best_sequence_each_species(infile, outfile, genus, logger, count=1, skipNoSpecies=False):
-    if genus:
-        logger.info('Filtering by Genus %r', genus)
+class Candidate(object):
+    '''
+    A record retained by `BestStrains`.
+
+    @param score comparable score, such as `pack_score(get_score(...))`.
+    @param description processed description, which ends with the accession.
+    @param payload what to write if the record is selected: its sequence,
+           or a reference to it.
+    '''
+    __slots__ = ('score', 'description', 'payload')
+
+    def __init__(self, score, description, payload):
+        self.score, self.description, self.payload = score, description, payload
+
+    @property
+    def accession(self):
+        return self.description.rsplit(' ', 1)[-1]
 
-    sourceCount, speciesSequenceListMap = 0, collections.defaultdict(
-        lambda: collections.defaultdict(list))
-    for (description, sequence) in parse_fasta_format(infile):
+
+class BestStrains(object):
+    '''
+    Retains, while records stream in, the best record of each of the best
+    `count` strains of one species.  Memory is bounded by `count`, not by the
+    number of records.
+
+    Strains are ranked by (score, strain name), and a record replaces an
+    earlier record of the same strain with an equal score, so the result is
+    the same as sorting every record with `get_best_sequence`.  A strain that
+    falls out of the best `count` can be forgotten: any later record good
+    enough to bring it back is also better than everything it had before.
+    '''
+    __slots__ = ('count', 'strains', 'recordCount')
+
+    def __init__(self, count=1):
+        '''
+        @param count number of strains to retain; if less than one, retain all.
+        '''
+        self.count, self.strains, self.recordCount = count, {}, 0
+
+    def add(self, strain, candidate):
+        '''
+        @param candidate Candidate.
+        '''
+        self.recordCount += 1
+        strains = self.strains
+        current = strains.get(strain)
+        if current is not None:
+            if candidate.score >= current.score:
+                strains[strain] = candidate
+        elif self.count < 1 or len(strains) < self.count:
+            strains[strain] = candidate
+        else:
+            worst = min(strains, key=lambda s: (strains[s].score, s))
+            if (candidate.score, strain) > (strains[worst].score, worst):
+                del strains[worst]
+                strains[strain] = candidate
+
+    def merge(self, other):
+        '''
+        Adds the records retained by `other`, which saw records that came
+        after all of those seen by `self`.
+        '''
+        recordCount = self.recordCount + other.recordCount
+        for strain, candidate in other.strains.items():
+            self.add(strain, candidate)
+        self.recordCount = recordCount
+
+    def best(self):
+        '''
+        @return list of retained Candidates, ordered as `get_best_sequence`
+                orders them.
+        '''
+        return [c for _, c in sorted(self.strains.items(), key=lambda sc: (sc[1].score, sc[0]))]
+
+
+def select_best_each_species(records, genus, logger, count=1, skipNoSpecies=False,
+                             fetch=None, pack=None):
+    '''
+    @param records iterable of (description, sequence, payload) tuples.
+           Each sequence is scored as it arrives; only the payloads of the
+           current best records are kept, so `records` is read only once.
+    @param fetch if not None, each `sequence` of `records` is instead
+           something that `fetch(sequence)` turns into a sequence.  It is
+           called only for records that pass the filters.
+    @param pack if not None, the payload of each record retained is
+           replaced by `pack(payload)`, such as a PackedSequence.
+    @return tuple (sourceCount, matchCount, speciesMap), where `speciesMap`
+            maps each species to its BestStrains.
+    '''
+    sourceCount, genusMap = select_best_each_genus(
+        records, [genus] if genus else None, logger, count, skipNoSpecies, fetch, pack)
+    speciesMap = genusMap.get(genus or None, {})
+    return sourceCount, sum(b.recordCount for b in speciesMap.values()), speciesMap
+
+
+def select_best_each_genus(records, genera, logger, count=1, skipNoSpecies=False,
+                           fetch=None, pack=None, runs=None, stats=None):
+    '''
+    Like `select_best_each_species`, but keeps the records of each of
+    `genera` apart, in one pass over `records`.
+    @param genera collection of genus names, or None to keep every record,
+           all together.
+    @param runs if not None, a SpeciesRuns to which the retained records are
+           moved whenever they take up too much memory.  The returned
+           `genusMap` holds only the records retained since.
+    @param stats if not None, a RunStats to which the time spent reading
+           records ('parse'), processing descriptions ('describe'), and
+           fetching and scoring sequences ('score') is added.
+    @return tuple (sourceCount, genusMap), where `genusMap` maps each genus
+            that matched (or None, if `genera` is None) to a map of each
+            species to its BestStrains.
+    '''
+    if genera is not None:
+        genera = frozenset(genera)
+    describe, score = process_sequence_description, get_score
+    if stats is not None:
+        records = stats.timed_iter('parse', records)
+        describe = stats.timed_describe(describe)
+        score = stats.timed('score', score)
+        if fetch is not None:
+            fetch = stats.timed('score', fetch)
+    sourceCount, genusMap = 0, {}
+    for (description, sequence, payload) in records:
         sourceCount += 1
         if skipNoSpecies and _noSpeciesRe.match(description):
             logger.debug('NO SPECIES:  %s', description)
             continue
-        info = process_sequence_description(description)
+        info = describe(description)
 
-        if genus and info.genus != genus:
+        if genera is not None and info.genus not in genera:
             logger.debug('BAD MATCH:  %s', description)
             continue
         logger.debug('good match: %s', description)
 
-        speciesSequenceListMap[info.species][info.strain].append(
-            (info.accession, info.description, sequence))
+        if fetch is not None:
+            sequence = fetch(sequence)
+        candidate = Candidate(
+            pack_score(score(info.accession, info.description, sequence)), info.description,
+            payload)
+        _retain(genusMap, None if genera is None else info.genus, info.species, info.strain,
+                candidate, count, runs, pack)
+    return sourceCount, genusMap
+
+
+def _retain(genusMap, group, species, strain, candidate, count, runs, pack=None):
+    '''
+    Adds `candidate`, a record of `strain`, to the BestStrains of `species`
+    in `genusMap[group]`, creating either as needed.
+    @param runs if not None, the SpeciesRuns to which the records of
+           `genusMap` are moved when they take up too much memory.
+    @param pack if not None, the payload of `candidate` is replaced by
+           `pack(payload)` if it is retained.
+    '''
+    speciesMap = genusMap.get(group)
+    if speciesMap is None:
+        speciesMap = genusMap[group] = {}
+    bestStrains = speciesMap.get(species)
+    if bestStrains is None:
+        bestStrains = speciesMap[species] = BestStrains(count)
+    bestStrains.add(strain, candidate)
+    if pack is not None and bestStrains.strains.get(strain) is candidate:
+        candidate.payload = pack(candidate.payload)
+    if runs is not None and runs.account(candidate):
+        runs.spill(genusMap)
+
+
+def select_best_each_genus_from_database(database, genera, logger, count=1,
+                                         skipNoSpecies=False, runs=None):
+    '''
+    Like `select_best_each_genus`, but over a SequenceDatabase, whose
+    descriptions are already processed and whose scores need no bases: only
+    the table, and the strings of the records that pass the filters, are
+    read.  The payload of each record is its index in `database`.
+
+    If `database.index_genera` has been called, only the entries of
+    `genera` are read (unless debug messages, which name every record, are
+    enabled).
+    '''
+    names = database.names
+    genusIds = None
+    if genera is not None:
+        genera = frozenset(genera)
+        genusIds = frozenset(i for i, name in enumerate(names) if name in genera)
+    debug = logger.isEnabledFor(logging.DEBUG)
+    if genusIds is not None and database.genusIndex is not None and not debug:
+        indices = sorted(i for g in genusIds for i in database.genusIndex.get(g, ()))
+        entries = ((i, database.entry(i)) for i in indices)
+    else:
+        entries = enumerate(database.entries())
+    sourceCount, genusMap = len(database), {}
+    for index, entry in entries:
+        if skipNoSpecies and entry.flags & NO_SPECIES:
+            if debug:
+                logger.debug('NO SPECIES:  %s', database.strings(entry)[0])
+            continue
+        if genusIds is not None and entry.genus not in genusIds:
+            if debug:
+                logger.debug('BAD MATCH:  %s', database.strings(entry)[0])
+            continue
+        description, processedDescription, strain = database.strings(entry)
+        logger.debug('good match: %s', description)
+
+        score = pack_score((
+            1 if entry.flags & TYPE_STRAIN else 0,
+            float(entry.agtcCount) / entry.length,
+            1 if entry.flags & REFSEQ else 0,
+            entry.length))
+        _retain(genusMap, None if genera is None else names[entry.genus], names[entry.species],
+                strain, Candidate(score, processedDescription, index), count, runs)
+    return sourceCount, genusMap
+
+
+def make_sequence_database(infile, outfile, logger):
+    '''
+    Converts a FASTA file into a sequence database, from which
+    `get_best_sequence_each_species` selects without parsing descriptions or
+    counting bases.
+    @param infile file object open for reading in binary mode.
+    @param outfile seekable file object open for writing in binary mode.
+    '''
+    with SequenceDatabaseWriter(outfile) as writer:
+        for description, sequence in parse_fasta_format(infile):
+            info = process_sequence_description(description)
+            packed = PackedSequence(sequence)
+            typeStrain, _, refseq, _ = _make_score(
+                info.accession, info.description, packed.agtcCount, packed.length)
+            flags = ((TYPE_STRAIN if typeStrain else 0) | (REFSEQ if refseq else 0) |
+                     (NO_SPECIES if _noSpeciesRe.match(description) else 0))
+            writer.add(info.genus, info.species, info.strain, description, info.description,
+                       flags, packed)
+    logger.info('Wrote %d sequences.', writer.count)
+
+
+def select_best_each_genus_from_index(connection, genera, logger, count=1,
+                                      skipNoSpecies=False, runs=None, species=None):
+    '''
+    Like `select_best_each_genus`, but over the records of a score index
+    (see `make_score_index`), of which only those that pass the filters
+    are read.  The payload of each record is the location of its sequence,
+    (start, end).
+    @param connection sqlite3.Connection from `score_index.open_score_index`.
+    @param species if not None, a collection of the only species to select.
+    '''
+    genusMap = {}
+    for record in query_records(connection, genera, species, skipNoSpecies):
+        score = pack_score((record.typeStrain, record.agtcFraction, record.refseq, record.length))
+        _retain(genusMap, None if genera is None else sys.intern(record.genus),
+                sys.intern(record.species), record.strain,
+                Candidate(score, record.description, (record.start, record.end)), count, runs)
+    return record_count(connection), genusMap
+
+
+def make_score_index(infile, path, logger):
+    '''
+    Writes to `path` a SQLite index of FASTA file `infile`, from which
+    `get_best_sequence_each_species` selects without parsing `infile`.
+    @param infile binary file object of a regular, uncompressed file.
+    '''
+    if not _is_mappable(infile):
+        raise RuntimeError('Only a regular, uncompressed file can be indexed.')
+    with mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        def records():
+            for description, start, end in scan_fasta_format(data):
+                info = process_sequence_description(description)
+                score = get_score(
+                    info.accession, info.description, read_sequence(data, start, end))
+                yield IndexedRecord(
+                    info.genus, info.species, info.strain, info.accession, info.description,
+                    1 if _noSpeciesRe.match(description) else 0, *score, start, end)
+        count = write_score_index(path, records(), os.fstat(infile.fileno()))
+    logger.info('Indexed %d sequences.', count)
+
+
+class SpeciesRuns(object):
+    '''
+    Bounds the memory used by `select_best_each_genus`.  The records it
+    retains are written, sorted by genus and species, to a temporary file (a
+    "run") whenever they take more than about `maxMemory` bytes.  `merge`
+    then combines the runs species by species, in the order the records were
+    read, so that the result is the same as if nothing had been written out.
+    Use it as a context manager, so that the runs are removed.
+    '''
+    # Memory used by each retained record apart from its description and
+    # payload; see `benchmark.py --memory-records`.
+    RECORD_OVERHEAD = 400
+
+    def __init__(self, maxMemory, directory=None):
+        '''
+        @param directory where to write runs. (default: the system default)
+        '''
+        self.maxMemory, self.directory = maxMemory, directory
+        self.added, self.recordCount, self.runs = 0, 0, []
+
+    @classmethod
+    def _size(cls, candidate):
+        payload = candidate.payload
+        if isinstance(payload, PackedSequence):
+            payload = payload.data
+        return (cls.RECORD_OVERHEAD + len(candidate.description) +
+                (len(payload) if isinstance(payload, (bytes, str)) else 0))
+
+    def account(self, candidate):
+        '''
+        @return True if the records added since the last spill, counting
+                `candidate`, may take more than `maxMemory` bytes.
+        '''
+        self.added += self._size(candidate)
+        return self.added > self.maxMemory
+
+    def spill(self, genusMap):
+        '''
+        Writes the records of `genusMap` to a new run and clears it, unless
+        records that have been replaced leave it well under `maxMemory`.
+        '''
+        retained = sum(self._size(c) for speciesMap in genusMap.values()
+                       for bestStrains in speciesMap.values()
+                       for c in bestStrains.strains.values())
+        self.added = retained
+        if retained < self.maxMemory // 2:
+            return
+        run = tempfile.TemporaryFile(dir=self.directory)
+        for genus, speciesMap in sorted(genusMap.items()):
+            for species, bestStrains in sorted(speciesMap.items()):
+                pickle.dump((genus, species, bestStrains), run, pickle.HIGHEST_PROTOCOL)
+                self.recordCount += bestStrains.recordCount
+        run.seek(0)
+        self.runs.append(run)
+        genusMap.clear()
+        self.added = 0
+
+    @staticmethod
+    def _read_run(run):
+        while True:
+            try:
+                yield pickle.load(run)
+            except EOFError:
+                return
 
-    if len(speciesSequenceListMap) == 0:
+    def merge(self, genusMap):
+        '''
+        @param genusMap the records retained after the last spill.
+        @yield (genus, species, BestStrains) for each species, sorted by genus
+               and species, combining every run and `genusMap`.
+        '''
+        last = [(genus, species, bestStrains)
+                for genus, speciesMap in sorted(genusMap.items())
+                for species, bestStrains in sorted(speciesMap.items())]
+        # heapq.merge is stable, so each species' parts come out in run order.
+        merged = heapq.merge(*map(self._read_run, self.runs), last, key=lambda t: t[:2])
+        for (genus, species), parts in itertools.groupby(merged, key=lambda t: t[:2]):
+            _, _, bestStrains = next(parts)
+            for _, _, later in parts:
+                bestStrains.merge(later)
+            yield genus, species, bestStrains
+
+    def close(self):
+        for run in self.runs:
+            run.close()
+        self.runs = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def write_best_each_species(outfile, genus, logger, sourceCount, matchCount, speciesMap,
+                            write=None):
+    '''
+    Writes the records retained by `select_best_each_species`, sorted by
+    species.
+    @param speciesMap map of each species to its BestStrains, or an iterable
+           of (species, BestStrains) pairs already sorted by species, such as
+           `SpeciesRuns.merge` produces.
+    @param write function called as `write(description, payload)` for each
+           record selected. (default: write the payload as a sequence to a
+           FastaWriter on `outfile`)
+    '''
+    if write is None:
+        with FastaWriter(outfile) as writer:
+            return write_best_each_species(
+                outfile, genus, logger, sourceCount, matchCount, speciesMap, writer.write)
+
+    if matchCount == 0:
         raise RuntimeError(
             'None of %d sequences match given genus %r.' % (sourceCount, genus))
 
-    if logger.isEnabledFor(logging.INFO):
-        matchCount = sum(len(v) for v in speciesSequenceListMap.values())
-        logger.info('Matched %d of %d sequences.', matchCount, sourceCount)
+    logger.info('Matched %d of %d sequences.', matchCount, sourceCount)
 
-    taxaTotalCount = 0
-    # Sort output by sepcies for reproducability.
-    for species, strainMap in sorted(speciesSequenceListMap.items()):
-        values = []
-        for sequence, strainValues in sorted(strainMap.items()):
-            values.extend(get_best_sequence(strainValues))
-        try:
-            best = get_best_sequence(values, count=count)
-        except Exception as e:
-            raise RuntimeError("Error with species %s. %r" %
-                               (species, e)) from e
-        for accession, description, sequence in best:
-            print_fasta_description(outfile, description, sequence)
+    if isinstance(speciesMap, dict):
+        # Sort output by sepcies for reproducability.
+        speciesMap = sorted(speciesMap.items())
+    speciesCount, taxaTotalCount = 0, 0
+    for species, bestStrains in speciesMap:
+        for candidate in bestStrains.best():
+            write(candidate.description, candidate.payload)
             taxaTotalCount += 1
-        logger.debug('Best of %3d for species %r', len(values), species)
+        logger.debug('Best of %3d for species %r', bestStrains.recordCount, species)
+        speciesCount += 1
 
-    logger.info('%d different species processed.', len(speciesSequenceListMap))
+    logger.info('%d different species processed.', speciesCount)
     logger.info('%d total taxa output.', taxaTotalCount)
 
 
+def write_best_sequence_each_species(records, outfile, genus, logger, count=1,
+                                     skipNoSpecies=False, write=None, fetch=None, pack=None):
+    '''
+    @param records iterable of (description, sequence, payload) tuples.
+    @param write as for `write_best_each_species`.
+    @param fetch, pack as for `select_best_each_species`.
+    '''
+    if genus:
+        logger.info('Filtering by Genus %r', genus)
+    write_best_each_species(
+        outfile, genus, logger,
+        *select_best_each_species(records, genus, logger, count, skipNoSpecies, fetch, pack),
+        write=write)
+
+
+# TODO(halcanry): Add unit tests for this function.
+def get_best_sequence_each_species(
+        infile, outfile, genus, logger, count=1, skipNoSpecies=False, pipeline=False,
+        maxMemory=None, index=None, stats=None, progress=None):
+    '''
+    @param infile file object, or an open SequenceDatabase.
+    @param pipeline if True, `infile` and `outfile` must be binary.  `infile`
+           is read ahead on one background thread and `outfile` written
+           behind on another, so that reading, parsing, and writing overlap.
+    @param maxMemory if not None, about how many bytes the retained records
+           may take before they are moved to temporary files; see
+           SpeciesRuns.  The output is the same.
+    @param index if not None, the path of a score index of `infile` (see
+           `make_score_index`), from which the records are selected.  Only
+           the selected sequences are read from `infile`.
+    @param stats if not None, a RunStats to which the time of each stage,
+           and the number of records and bytes read, are added.
+    @param progress if not None, a ProgressReporter on `infile` that reports
+           as records are read.  Not used for a sequence database or with
+           `index`, which are not read record by record.
+    '''
+    if pipeline:
+        # A sequence database, an indexed file, or a regular uncompressed file is
+        # memory-mapped, not read.
+        mapped = (index is not None or isinstance(infile, SequenceDatabase) or
+                  is_sequence_database(infile) or _is_mappable(infile))
+        reader = contextlib.nullcontext(infile) if mapped else ReadAheadReader(infile)
+        with reader as reader, WriteBehindWriter(outfile) as writer:
+            get_best_sequence_each_species(
+                reader, writer, genus, logger, count, skipNoSpecies, maxMemory=maxMemory,
+                index=index, stats=stats, progress=progress)
+        if stats is not None:
+            stats.bytes = _bytes_read(infile)
+        return
+    if genus:
+        logger.info('Filtering by Genus %r', genus)
+    with contextlib.ExitStack() as stack:
+        runs = None if maxMemory is None else stack.enter_context(SpeciesRuns(maxMemory))
+        with stage(stats, 'select'):
+            sourceCount, genusMap, decode = stack.enter_context(_select_records(
+                infile, [genus] if genus else None, logger, count, skipNoSpecies, runs, index,
+                stats, progress))
+        if stats is not None:
+            stats.records, stats.bytes = sourceCount, _bytes_read(infile)
+        speciesMap = genusMap.get(genus or None, {})
+        matchCount = sum(b.recordCount for b in speciesMap.values())
+        with stage(stats, 'sort'):
+            if runs is not None:
+                logger.info('Wrote %d temporary runs.', len(runs.runs))
+                matchCount += runs.recordCount
+                speciesMap = ((species, b) for _, species, b in runs.merge(genusMap))
+            else:
+                speciesMap = sorted(speciesMap.items())
+        with stage(stats, 'write'), FastaWriter(outfile) as writer:
+            write_best_each_species(outfile, genus, logger, sourceCount, matchCount, speciesMap,
+                                    _fetching_writer(writer, decode))
+
+
+def _bytes_read(infile):
+    '''
+    @return how many bytes of input have been read from `infile`: the size
+            of a memory-mapped file, or the position in any other, or None
+            if that is not known.
+    '''
+    try:
+        if isinstance(infile, SequenceDatabase):
+            return len(infile.map)
+        if _is_mappable(infile) or is_sequence_database(infile):
+            return os.fstat(infile.fileno()).st_size
+        return infile.tell()
+    except (AttributeError, OSError, ValueError):
+        return None
+
+
+@contextlib.contextmanager
+def _select_records(infile, genera, logger, count, skipNoSpecies, runs=None, index=None,
+                    stats=None, progress=None):
+    '''
+    Runs `select_best_each_genus` over the records of `infile`,
+    `select_best_each_genus_from_database` if it is a sequence database or
+    an open SequenceDatabase, or `select_best_each_genus_from_index` if
+    `index` is not None.
+    @param stats passed to `select_best_each_genus`.
+    @param progress if not None, a ProgressReporter that tracks the records
+           passed to `select_best_each_genus`.
+    @yield (sourceCount, genusMap, decode), where `decode(payload)` returns
+           the sequence of a retained record.
+    '''
+    if index is not None:
+        if not _is_mappable(infile):
+            raise RuntimeError('An index can only be used with a regular, uncompressed file.')
+        with open_score_index(index, os.fstat(infile.fileno())) as connection, \
+                mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            yield select_best_each_genus_from_index(
+                connection, genera, logger, count, skipNoSpecies, runs) + (
+                    lambda span: read_sequence(data, *span),)
+        return
+    if isinstance(infile, SequenceDatabase):
+        yield select_best_each_genus_from_database(
+            infile, genera, logger, count, skipNoSpecies, runs) + (infile.sequence,)
+        return
+    if is_sequence_database(infile):
+        with SequenceDatabase(infile) as database:
+            yield select_best_each_genus_from_database(
+                database, genera, logger, count, skipNoSpecies, runs) + (database.sequence,)
+        return
+    with _scan_records(infile) as (records, fetch, pack):
+        if progress is not None:
+            # A memory-mapped file is not read through its descriptor, so
+            # its progress is the end of each record's sequence.
+            records = progress.track(
+                records, None if fetch is None else lambda record: record[1][1])
+        yield select_best_each_genus(
+            records, genera, logger, count, skipNoSpecies, fetch, pack, runs, stats) + (
+                fetch if fetch is not None else PackedSequence.unpack,)
+
+
+@contextlib.contextmanager
+def _scan_records(infile):
+    '''
+    @yield (records, fetch, pack) for `select_best_each_genus`, read from
+           `infile`.
+
+    If `infile` is a regular, uncompressed file open in binary mode, it is
+    memory-mapped and scanned with `scan_fasta_format`: the sequence of a
+    record is only read if the record passes the filters, and the payload of
+    each record is the location of its sequence.  Otherwise `infile` is
+    parsed, `fetch` is None, and the sequences retained are held as
+    PackedSequences.
+    '''
+    if not _is_mappable(infile):
+        yield ((description, sequence, sequence)
+               for description, sequence in parse_fasta_format(infile)), None, PackedSequence
+        return
+    with mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        def fetch(span):
+            return read_sequence(data, *span)
+        yield ((description, (start, end), (start, end))
+               for description, start, end in scan_fasta_format(data)), fetch, None
+
+
+def _is_mappable(f):
+    '''
+    @return True if `f` reads a nonempty, regular, uncompressed file directly,
+            rather than through a decompressor that also has a `fileno`.
+    '''
+    if not isinstance(getattr(f, 'raw', f), io.FileIO):
+        return False
+    fileStat = os.fstat(f.fileno())
+    return (stat.S_ISREG(fileStat.st_mode) and fileStat.st_size > 0
+            and not is_compressed(f))
+
+
+def _fetching_writer(writer, fetch):
+    '''
+    @return a `write` function for `write_best_each_species` that writes each
+            payload, passed through `fetch` unless it is None, to `writer`.
+    '''
+    if fetch is None:
+        return writer.write
+    return lambda description, payload: writer.write(description, fetch(payload))
+
+
+def get_best_sequence_each_genus(
+        infile, outfileTemplate, genera, logger, count=1, skipNoSpecies=False, shards=1,
+        index=None, progress=None):
+    '''
+    Like `get_best_sequence_each_species` for each of `genera`, but reads
+    `infile` only once.  The records of each genus are written to the file
+    named by `outfileTemplate.format(genus=genus, shard=0)`, compressed
+    according to its extension.  A genus without any matching records is
+    skipped with a warning.
+
+    @param infile file object open for reading in binary mode.
+    @param genera list of genus names, or None to select from every genus.
+    @param shards number of files to divide the species of each genus
+           among, by `shard_of`.  Each is named with its shard number in
+           place of "{shard}" in `outfileTemplate`, and written even if none
+           of the species falls in it.
+    @param index, progress as for `get_best_sequence_each_species`.
+    @return list of the names of the files written.
+    '''
+    if genera is not None:
+        logger.info('Filtering by %d genera', len(genera))
+    with _select_records(infile, genera, logger, count, skipNoSpecies, index=index,
+                         progress=progress) as (sourceCount, genusMap, decode):
+        return _write_best_each_genus(
+            outfileTemplate, genera, logger, sourceCount, genusMap, decode, shards)
+
+
+def _write_best_each_genus(outfileTemplate, genera, logger, sourceCount, genusMap, decode,
+                           shards):
+    if not genusMap:
+        if genera is None:
+            raise RuntimeError('None of %d sequences could be read.' % sourceCount)
+        raise RuntimeError(
+            'None of %d sequences match any of %d genera.' % (sourceCount, len(genera)))
+    paths = []
+    for genus in genera or [None]:
+        speciesMap = genusMap.get(genus)
+        if speciesMap is None:
+            logger.warning('None of %d sequences match given genus %r.', sourceCount, genus)
+            continue
+        shardMaps = [{} for _ in range(shards)]
+        for species, bestStrains in speciesMap.items():
+            shardMaps[shard_of(species, shards)][species] = bestStrains
+        for shard, shardMap in enumerate(shardMaps):
+            paths.append(outfileTemplate.format(genus=genus, shard=shard))
+            logger.info('Writing %r', paths[-1])
+            matchCount = sum(b.recordCount for b in shardMap.values())
+            with open(paths[-1], 'wb') as o, compressed_output(o) as outfile, \
+                    FastaWriter(outfile) as writer:
+                if matchCount:
+                    write_best_each_species(
+                        outfile, genus, logger, sourceCount, matchCount, shardMap,
+                        _fetching_writer(writer, decode))
+    return paths
+
+
+def shard_of(species, shards):
+    '''
+    @return the shard, in range(shards), to which `species` belongs.  It
+            depends only on the name, so it is the same in every run and on
+            every machine (unlike `hash`).
+    '''
+    return zlib.crc32(species.encode('utf-8', 'surrogateescape')) % shards
+
+
+def read_genus_list(f):
+    '''
+    @param f file object open for reading in text mode, listing genera
+           separated by whitespace.  Text following '#' on a line is ignored.
+    @return list of genus names.
+    '''
+    genera = []
+    for line in f:
+        genera.extend(line.split('#', 1)[0].split())
+    return genera
+
+
+def get_best_sequence_each_species_two_pass(
+        infile, outfile, genus, logger, count=1, skipNoSpecies=False):
+    '''
+    Like `get_best_sequence_each_species`, but memory-maps `infile` and keeps
+    only the index entry of each candidate record.  The chosen records are
+    copied from the map at output time.  If `infile` can not be indexed,
+    because the sequence lines of a record differ in length, it is parsed
+    with `get_best_sequence_each_species` instead.
+
+    @param infile binary file object of a regular file.
+    @param outfile file object open for writing in binary mode.
+    '''
+    if not stat.S_ISREG(os.fstat(infile.fileno()).st_mode):
+        raise RuntimeError('Unable to memory-map %r: not a regular file.' % infile.name)
+    if is_compressed(infile):
+        raise RuntimeError('Unable to memory-map %r: it is compressed.' % infile.name)
+    with mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        records = ((description, entry, entry)
+                   for description, entry in _indexed_records(infile.name, data, logger)
+                   if description and entry.length)
+        try:
+            # Nothing is written until every record has been indexed.
+            write_best_sequence_each_species(
+                records, outfile, genus, logger, count, skipNoSpecies,
+                lambda description, entry: write_indexed_record(outfile, data, entry, description),
+                lambda entry: fetch_sequence(data, entry))
+            return
+        except LineLengthError as e:
+            logger.warning('Unable to index %r (%s); parsing it instead.', infile.name, e)
+    get_best_sequence_each_species(infile, outfile, genus, logger, count, skipNoSpecies)
+
+
+def get_best_sequence_each_species_cached(
+        infile, outfile, genus, logger, count=1, skipNoSpecies=False, cache=None):
+    '''
+    Like `get_best_sequence_each_species`, but keeps results in `cache`, a
+    ResultCache, keyed by the contents of `infile` and the options.
+
+    A regular, uncompressed `infile` is hashed in chunks of about
+    `CACHE_CHUNK_SIZE` bytes, and the best records of each chunk are cached
+    too, so that after records are appended only the last chunks are
+    processed again.  Other files are cached as a whole; input that can not
+    be read twice, such as a pipe, is not cached.
+
+    @param infile file object open for reading in binary mode; it may be
+           compressed.
+    '''
+    options = (CACHE_VERSION, genus or '', count, bool(skipNoSpecies))
+    if not _is_mappable(infile):
+        try:
+            fileStat = os.fstat(infile.fileno())
+        except (AttributeError, OSError, io.UnsupportedOperation):
+            fileStat = None
+        if fileStat is None or not stat.S_ISREG(fileStat.st_mode):
+            logger.warning('Not caching: input is not a regular file.')
+            get_best_sequence_each_species(
+                open_input(infile), outfile, genus, logger, count, skipNoSpecies)
+            return
+        digest = hashlib.sha256()
+        for block in iter(lambda: infile.read(BLOCK_SIZE), b''):
+            digest.update(block)
+        key = cache_key('result', digest.digest(), *options)
+        if not _write_cached(cache, key, outfile, logger):
+            infile.seek(0)
+            buffer = io.BytesIO()
+            get_best_sequence_each_species(
+                open_input(infile), buffer, genus, logger, count, skipNoSpecies)
+            _write_and_cache(cache, key, outfile, buffer.getvalue())
+        return
+    with mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        chunks = chunk_fasta_file(infile, CACHE_CHUNK_SIZE)
+        with memoryview(data) as view:
+            digests = [hashlib.sha256(view[start:end]).digest() for start, end in chunks]
+        key = cache_key('result', *digests, *options)
+        if _write_cached(cache, key, outfile, logger):
+            return
+        if genus:
+            logger.info('Filtering by Genus %r', genus)
+        selection = merge_selections(
+            _select_best_in_chunk(cache, data, start, end, digest, genus, logger, count,
+                                  skipNoSpecies, options)
+            for (start, end), digest in zip(chunks, digests))
+    buffer = io.BytesIO()
+    write_best_each_species(buffer, genus, logger, *selection)
+    _write_and_cache(cache, key, outfile, buffer.getvalue())
+
+
+def _select_best_in_chunk(cache, data, start, end, digest, genus, logger, count,
+                          skipNoSpecies, options):
+    '''
+    @return `select_best_each_species` result for bytes [start, end) of
+            `data`, whose hash is `digest`, from `cache` if it is there.
+            The payload of each record is its sequence.
+    '''
+    key = cache_key('chunk', digest, *options)
+    cached = cache.get(key)
+    selection = None if cached is None else _decode_selection(cached, count)
+    if selection is not None:
+        logger.debug('Using cached chunk [%d, %d)', start, end)
+        return selection
+    logger.debug('Processing chunk [%d, %d)', start, end)
+    records = ((description, (s, e), (s, e))
+               for description, s, e in scan_fasta_format(data, start, end))
+    selection = select_best_each_species(
+        records, genus, logger, count, skipNoSpecies, lambda span: read_sequence(data, *span))
+    for bestStrains in selection[2].values():
+        for candidate in bestStrains.strains.values():
+            candidate.payload = read_sequence(data, *candidate.payload)
+    cache.put(key, _encode_selection(selection))
+    return selection
+
+
+_fieldLength = struct.Struct('<Q')
+
+
+def _encode_selection(selection):
+    '''
+    @param selection `select_best_each_species` result whose payloads are
+           sequences, as bytes.
+    @return `selection` as a series of length-prefixed fields: the counts,
+            then for each species its name, record count, and number of
+            strains, then for each strain its name, score, description, and
+            sequence.  Only plain data is stored, so that any process can
+            read it back with `_decode_selection`.
+    '''
+    sourceCount, matchCount, speciesMap = selection
+    fields = [b'%d' % sourceCount, b'%d' % matchCount, b'%d' % len(speciesMap)]
+    for species, bestStrains in speciesMap.items():
+        fields += [species.encode('utf-8', 'surrogateescape'),
+                   b'%d' % bestStrains.recordCount, b'%d' % len(bestStrains.strains)]
+        for strain, candidate in bestStrains.strains.items():
+            fields += [strain.encode('utf-8', 'surrogateescape'), b'%d' % candidate.score,
+                       candidate.description.encode('utf-8', 'surrogateescape'),
+                       bytes(candidate.payload)]
+    return b''.join(_fieldLength.pack(len(field)) + field for field in fields)
+
+
+def _decode_selection(data, count):
+    '''
+    @return the selection encoded in `data` by `_encode_selection`, with a
+            BestStrains of `count` for each species, or None if `data` can
+            not be decoded.
+    '''
+    def read_fields():
+        offset = 0
+        while offset < len(data):
+            start = offset + _fieldLength.size
+            end = start + _fieldLength.unpack_from(data, offset)[0]
+            if end > len(data):
+                raise ValueError('truncated field')
+            yield data[start:end]
+            offset = end
+
+    def number():
+        field = next(fields)
+        if not field.isdigit():
+            raise ValueError('not a number: %r' % field)
+        return int(field)
+
+    def string():
+        return next(fields).decode('utf-8', 'surrogateescape')
+
+    fields = read_fields()
+    try:
+        sourceCount, matchCount, speciesMap = number(), number(), {}
+        for _ in range(number()):
+            species = string()
+            bestStrains = speciesMap[species] = BestStrains(count)
+            bestStrains.recordCount = number()
+            for _ in range(number()):
+                strain = string()
+                bestStrains.strains[strain] = Candidate(number(), string(), next(fields))
+        if next(fields, None) is not None:
+            raise ValueError('trailing data')
+    except (StopIteration, ValueError, struct.error):
+        return None
+    return sourceCount, matchCount, speciesMap
+
+
+def _write_cached(cache, key, outfile, logger):
+    '''
+    @return True if the result stored under `key` was found and written.
+    '''
+    cached = cache.get(key)
+    if cached is None:
+        return False
+    logger.info('Using cached result %s', key)
+    outfile.write(cached)
+    return True
+
+
+def _write_and_cache(cache, key, outfile, result):
+    outfile.write(result)
+    cache.put(key, result)
+
+
+def get_best_sequence_each_species_parallel(
+        infile, outfile, genus, logger, count=1, skipNoSpecies=False, jobs=1):
+    '''
+    Like `get_best_sequence_each_species`, but splits `infile` at record
+    boundaries and selects the best records of each part in a pool of `jobs`
+    processes.  The output is identical.
+
+    @param infile binary file object of a regular file, opened by its path.
+    '''
+    fileStat = os.fstat(infile.fileno())
+    if not stat.S_ISREG(fileStat.st_mode):
+        raise RuntimeError('Unable to split %r: not a regular file.' % infile.name)
+    if not _names_file(infile.name, fileStat):
+        # Such as STDIN redirected from a file; each process opens the file by name.
+        raise RuntimeError('Unable to split %r: give the path of the file.' % infile.name)
+    if is_compressed(infile):
+        raise RuntimeError('Unable to split %r: it is compressed.' % infile.name)
+    if genus:
+        logger.info('Filtering by Genus %r', genus)
+    # More parts than processes, so that one slow part does not hold up the rest.
+    ranges = split_fasta_file(infile, jobs * 4)
+    logger.info('Processing %d parts with %d processes.', len(ranges), jobs)
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = [executor.submit(_select_best_in_range, infile.name, start, end,
+                                   genus, count, skipNoSpecies)
+                   for start, end in ranges]
+        selection = merge_selections(future.result() for future in futures)
+    write_best_each_species(outfile, genus, logger, *selection)
+
+
+def _names_file(name, fileStat):
+    '''
+    @return True if `name` is the path of the file with `fileStat`, rather
+            than a descriptor number or a placeholder such as '<stdin>'.
+    '''
+    if not isinstance(name, str):
+        return False
+    try:
+        return os.path.samestat(os.stat(name), fileStat)
+    except OSError:
+        return False
+
+
+def merge_selections(selections):
+    '''
+    @param selections iterable of `select_best_each_species` results for
+           consecutive parts of a file, in file order, so that ties are
+           broken as in a single pass.
+    @return tuple (sourceCount, matchCount, speciesMap) for the whole file.
+    '''
+    sourceCount, matchCount, speciesMap = 0, 0, {}
+    for partSourceCount, partMatchCount, partSpeciesMap in selections:
+        sourceCount += partSourceCount
+        matchCount += partMatchCount
+        for species, bestStrains in partSpeciesMap.items():
+            if species in speciesMap:
+                speciesMap[species].merge(bestStrains)
+            else:
+                speciesMap[species] = bestStrains
+    return sourceCount, matchCount, speciesMap
+
+
+def _select_best_in_range(path, start, end, genus, count, skipNoSpecies):
+    '''
+    Runs `select_best_each_species` over bytes [start, end) of `path`, in a
+    worker process.
+    '''
+    with open(path, 'rb') as f:
+        records = ((description, sequence, sequence)
+                   for description, sequence in parse_fasta_format(FileRange(f, start, end)))
+        return select_best_each_species(
+            records, genus, logging.getLogger(), count, skipNoSpecies)
+
+
+def _indexed_records(path, data, logger):
+    '''
+    @yield (description, FastaIndexEntry) for each record of `data`, the
+           mapped contents of `path`.  Uses `path + '.fai'` if it is newer
+           than `path`, otherwise writes it.
+    '''
+    if not os.path.isfile(path):
+        # Such as STDIN redirected from a file.
+        yield from index_fasta(data)
+        return
+    faiPath = path + '.fai'
+    if os.path.exists(faiPath) and os.path.getmtime(faiPath) >= os.path.getmtime(path):
+        logger.info('Reading index %r', faiPath)
+        with open(faiPath) as f:
+            for entry in read_fasta_index(f):
+                yield read_indexed_description(data, entry), entry
+        return
+    try:
+        o = open(faiPath + '.tmp', 'w')
+    except OSError as e:
+        logger.warning('Unable to write index: %s', e)
+        yield from index_fasta(data)
+        return
+    logger.info('Writing index %r', faiPath)
+    try:
+        with o:
+            for description, entry in index_fasta(data):
+                write_fasta_index(o, [entry])
+                yield description, entry
+    except BaseException:
+        # Such as lines of different lengths; leave no partial index behind.
+        os.remove(faiPath + '.tmp')
+        raise
+    os.replace(faiPath + '.tmp', faiPath)
+
+
 def parse_args(argv):
     parser = argparse.ArgumentParser(
         formatter_class=argparse.RawDescriptionHelpFormatter,
@@ -208,20 +1278,43 @@ def parse_args(argv):
     parser.add_argument(
         'INFILE',
         nargs='?',
-        type=argparse.FileType('r'),
-        default=sys.stdin,
-        help='Path of FASTA file to read. (default: STDIN)')
+        type=argparse.FileType('rb'),
+        default=sys.stdin.buffer,
+        help='Path of FASTA file to read; may be compressed with gzip, bgzip, '
+             'or zstd.  May instead be a sequence database; see --make-database. '
+             '(default: STDIN)')
     parser.add_argument(
         '-o',
         '--outfile',
         nargs='?',
-        type=argparse.FileType('w'),
-        default=sys.stdout,
-        help='Where to write FASTA file. (default: STDOUT)')
+        type=argparse.FileType('wb'),
+        default=sys.stdout.buffer,
+        help='Where to write FASTA file.  Compressed if the name ends with '
+             '".gz", ".bgz" (bgzip), or ".zst". (default: STDOUT)')
     parser.add_argument(
         '-g',
         '--genus',
-        help='Genus to filter on. (default: None)')
+        action='append',
+        help='Genus to filter on.  May be repeated, or given as a comma-separated '
+             'list, to select several genera in one pass; see --outfile-template. '
+             '(default: None)')
+    parser.add_argument(
+        '--genus-file',
+        type=argparse.FileType('r'),
+        help='File listing genera to filter on, separated by whitespace, as with '
+             'several --genus options.')
+    parser.add_argument(
+        '--outfile-template',
+        help='Where to write the FASTA file for each genus, with "{genus}" in '
+             'place of the genus, e.g. "best_{genus}.fasta", and "{shard}" in '
+             'place of the shard number.  Required if more than one genus is '
+             'given, or with --shards; replaces --outfile.')
+    parser.add_argument(
+        '--shards',
+        type=int,
+        default=1,
+        help='Number of output files to divide the species among, by a stable '
+             'hash of the species name; see --outfile-template. (default: 1)')
     parser.add_argument(
         '--loglevel',
         choices=['debug', 'info', 'warning'],
@@ -239,7 +1332,85 @@ def parse_args(argv):
         default=False,
         action='store_true',
         help='if set, skip species with epithet "sp.". (default: False)')
-    return parser.parse_args(argv)
+    parser.add_argument(
+        '--two-pass',
+        default=False,
+        action='store_true',
+        help='if set, memory-map INFILE and keep only file offsets of candidate '
+             'sequences, using or writing a samtools-style INFILE.fai index. '
+             'INFILE must be a regular file. (default: False)')
+    parser.add_argument(
+        '-j',
+        '--jobs',
+        type=int,
+        default=1,
+        help='Number of processes to use.  If more than one, INFILE must be a '
+             'regular file. (default: 1)')
+    parser.add_argument(
+        '--pipeline',
+        action='store_true',
+        help='Read, parse, and write on separate threads, so that they '
+             'overlap.  Can not be combined with --two-pass or --jobs.')
+    parser.add_argument(
+        '--max-memory',
+        type=int,
+        help='About how many megabytes the selected sequences may take in memory '
+             'before they are moved to temporary files (in TMPDIR).  The output '
+             'is the same.  Can not be combined with --two-pass, --jobs, '
+             '--cache-dir, or several genera. (default: no limit)')
+    parser.add_argument(
+        '--cache-dir',
+        help='Directory in which to keep results, keyed by the contents of INFILE '
+             'and the options, so that repeated runs are fast.  Can not be '
+             'combined with --two-pass, --jobs, --pipeline, or several genera. '
+             '(default: no caching)')
+    parser.add_argument(
+        '--cache-size',
+        type=int,
+        default=1024,
+        help='Size in megabytes beyond which the least recently used results '
+             'are removed from --cache-dir. (default: 1024)')
+    parser.add_argument(
+        '--make-database',
+        action='store_true',
+        help='Instead of selecting sequences, convert INFILE to a sequence '
+             'database, written to --outfile, which must be a regular file.  '
+             'Later runs given the database as INFILE skip parsing and scoring.')
+    parser.add_argument(
+        '--index',
+        help='Path of a SQLite index of INFILE, made with --make-index, from '
+             'which to select.  Only the selected sequences are read from INFILE, '
+             'which must be a regular, uncompressed file.  Can not be combined '
+             'with --two-pass, --jobs, or --cache-dir.')
+    parser.add_argument(
+        '--make-index',
+        action='store_true',
+        help='Instead of selecting sequences, write the index given by --index '
+             'for INFILE.')
+    parser.add_argument(
+        '--stats',
+        nargs='?',
+        const='text',
+        choices=['text', 'json'],
+        help='When done, write the time spent in each stage, the records and '
+             'bytes read per second, the peak memory, and the descriptions '
+             'slowest to process to STDERR, as a table or as JSON.  With '
+             '--two-pass, --jobs, --cache-dir, or --outfile-template, only the '
+             'total time and peak memory are measured. (default: text, if given)')
+    parser.add_argument(
+        '--progress',
+        nargs='?',
+        const='line',
+        choices=['line', 'log'],
+        help='Report how much of INFILE has been read, records and megabytes '
+             'per second, and the time left: "line" rewrites one line on STDERR '
+             'a few times a second; "log" logs key=value pairs every 30 seconds, '
+             'for batch jobs.  Can not be combined with --two-pass, --jobs, or '
+             '--cache-dir. (default: line, if given)')
+    args = parser.parse_args(argv)
+    if args.shards < 1:
+        parser.error('--shards must be at least 1.')
+    return args
 
 ###################################################################################################
 
@@ -248,13 +1419,98 @@ def main():
     args = parse_args(sys.argv[1:])
     logging.basicConfig(format='%(levelname)s:  %(message)s',
                         level=args.loglevel.upper())
+    function, options = get_best_sequence_each_species, {}
+    stats = RunStats() if args.stats else None
+    if args.progress:
+        options['progress'] = ProgressReporter(
+            args.INFILE, logging.getLogger(),
+            sys.stderr if args.progress == 'line' else None)
+    if args.two_pass:
+        function = get_best_sequence_each_species_two_pass
+    if args.jobs > 1:
+        function = get_best_sequence_each_species_parallel
+        options['jobs'] = args.jobs
     try:
-        get_best_sequence_each_species(
-            args.INFILE, args.outfile, args.genus, logging.getLogger(),
-            args.count, skipNoSpecies=args.skipnone)
+        if args.progress and (args.two_pass or args.jobs > 1 or args.cache_dir):
+            raise RuntimeError('--progress can not be combined with --two-pass, --jobs, '
+                               'or --cache-dir.')
+        if args.make_database:
+            if not args.outfile.seekable():
+                raise RuntimeError('--make-database requires --outfile to be a regular file.')
+            make_sequence_database(open_input(args.INFILE), args.outfile, logging.getLogger())
+            return
+        if args.make_index:
+            if not args.index:
+                raise RuntimeError('--make-index requires --index.')
+            make_score_index(args.INFILE, args.index, logging.getLogger())
+            return
+        if args.index:
+            if args.two_pass or args.jobs > 1 or args.cache_dir:
+                raise RuntimeError('--index can not be combined with --two-pass, --jobs, '
+                                   'or --cache-dir.')
+            options['index'] = args.index
+        if is_sequence_database(args.INFILE) and (
+                args.two_pass or args.jobs > 1 or args.cache_dir):
+            raise RuntimeError('A sequence database can not be read with --two-pass, --jobs, '
+                               'or --cache-dir.')
+        genera = []
+        for genus in args.genus or []:
+            genera.extend(g for g in genus.split(',') if g)
+        if args.genus_file:
+            with args.genus_file:
+                genera.extend(read_genus_list(args.genus_file))
+        genera = list(dict.fromkeys(genera))
+        if len(genera) > 1 or args.outfile_template or args.shards > 1:
+            template = args.outfile_template or ''
+            if len(genera) > 1 and '{genus}' not in template:
+                raise RuntimeError('With several genera, give --outfile-template '
+                                   'containing "{genus}".')
+            if args.shards > 1 and '{shard' not in template:
+                raise RuntimeError('With --shards, give --outfile-template '
+                                   'containing "{shard}".')
+            if not genera and '{genus}' in template:
+                raise RuntimeError('"{genus}" in --outfile-template requires --genus.')
+            if (args.two_pass or args.jobs > 1 or args.pipeline or args.cache_dir
+                    or args.max_memory):
+                raise RuntimeError('--outfile-template can not be combined with --two-pass, '
+                                   '--jobs, --pipeline, --cache-dir, or --max-memory.')
+            get_best_sequence_each_genus(
+                open_input(args.INFILE), template, genera or None, logging.getLogger(),
+                args.count, skipNoSpecies=args.skipnone, shards=args.shards, **options)
+            return
+        if args.two_pass and args.jobs > 1:
+            raise RuntimeError('--two-pass and --jobs can not be combined.')
+        if args.pipeline:
+            if function is not get_best_sequence_each_species:
+                raise RuntimeError('--pipeline can not be combined with --two-pass or --jobs.')
+            options['pipeline'] = True
+        if args.max_memory:
+            if function is not get_best_sequence_each_species or args.cache_dir:
+                raise RuntimeError('--max-memory can not be combined with --two-pass, '
+                                   '--jobs, or --cache-dir.')
+            options['maxMemory'] = args.max_memory << 20
+        if args.cache_dir:
+            if function is not get_best_sequence_each_species or args.pipeline:
+                raise RuntimeError('--cache-dir can not be combined with --two-pass, '
+                                   '--jobs, or --pipeline.')
+            function = get_best_sequence_each_species_cached
+            options['cache'] = ResultCache(args.cache_dir, args.cache_size << 20)
+        infile = args.INFILE
+        if function is get_best_sequence_each_species:
+            infile = open_input(infile)
+            if stats is not None:
+                options['stats'] = stats
+        with compressed_output(args.outfile) as outfile:
+            function(
+                infile, outfile, genera[0] if genera else None, logging.getLogger(),
+                args.count, skipNoSpecies=args.skipnone, **options)
     except Exception as e:
         logging.error(e)
         sys.exit(1)
+    finally:
+        if stats is not None:
+            stats.finish()
+            stats.report(sys.stderr, args.stats)
 
 
 if __name__ == '__main__':
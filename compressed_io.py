@@ -0,0 +1,261 @@
+# Copyright 2023 Hal W Canary III, Lindsay R Saunders PhD.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+'''
+Transparent reading and writing of compressed files: gzip, BGZF (the
+blocked gzip written by `bgzip`), and Zstandard.
+
+Zstandard requires the `zstandard` package.
+'''
+
+import collections
+import concurrent.futures
+import contextlib
+import gzip
+import io
+import os
+import struct
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Largest amount of data stored in one BGZF block, as chosen by `bgzip`.
+BGZF_BLOCK_SIZE = 0xff00
+
+# The empty block that ends a BGZF file.
+BGZF_EOF = bytes.fromhex('1f8b08040000000000ff0600424302001b0003000000000000000000')
+
+_gzipMagic = b'\x1f\x8b'
+_zstdMagic = b'\x28\xb5\x2f\xfd'
+
+
+def detect_compression(head):
+    '''
+    @param head the first bytes of a file; at least 16 are needed to
+           recognize BGZF.
+    @return 'bgzf', 'gzip', 'zstd', or None.
+    '''
+    if head.startswith(_gzipMagic):
+        # BGZF sets FEXTRA and stores a 'BC' subfield first.
+        if len(head) >= 16 and head[3] & 4 and head[12:14] == b'BC':
+            return 'bgzf'
+        return 'gzip'
+    if head.startswith(_zstdMagic):
+        return 'zstd'
+    return None
+
+
+def _peek(f, size):
+    if hasattr(f, 'peek'):
+        return f.peek(size)[:size]
+    position = f.tell()
+    head = f.read(size)
+    f.seek(position)
+    return head
+
+
+def is_compressed(f):
+    '''
+    @param f file object open for reading in binary mode.
+    '''
+    return detect_compression(_peek(f, 16)) is not None
+
+
+def open_input(f, threads=None):
+    '''
+    @param f file object open for reading in binary mode.
+    @param threads number of threads used to decompress BGZF blocks.
+           (default: number of processors)
+    @return binary file object that reads the decompressed contents of `f`,
+            or `f` itself if it is not compressed.
+    '''
+    compression = detect_compression(_peek(f, 16))
+    if compression == 'bgzf':
+        return io.BufferedReader(BgzfReader(f, threads), 1 << 20)
+    if compression == 'gzip':
+        return gzip.GzipFile(fileobj=f, mode='rb')
+    if compression == 'zstd':
+        if zstandard is None:
+            raise RuntimeError('Reading Zstandard requires `python3 -m pip install zstandard`')
+        return zstandard.ZstdDecompressor().stream_reader(
+            f, read_across_frames=True, closefd=False)
+    return f
+
+
+def open_output(f):
+    '''
+    @param f file object open for writing in binary mode.
+    @return binary file object that compresses what is written to it
+            according to the extension of `f.name` ('.gz', '.bgz', or
+            '.zst'), or `f` itself.  Close it to finish the compressed stream;
+            `f` is left open.
+    '''
+    name = getattr(f, 'name', None)
+    if not isinstance(name, str):
+        return f
+    extension = os.path.splitext(name)[1]
+    if extension == '.gz':
+        return gzip.GzipFile(fileobj=f, mode='wb', compresslevel=6)
+    if extension == '.bgz':
+        return BgzfWriter(f)
+    if extension == '.zst':
+        if zstandard is None:
+            raise RuntimeError('Writing Zstandard requires `python3 -m pip install zstandard`')
+        return zstandard.ZstdCompressor().stream_writer(f, closefd=False)
+    return f
+
+
+@contextlib.contextmanager
+def compressed_output(f):
+    '''
+    Context manager form of `open_output`, which finishes the compressed
+    stream on exit and leaves `f` open.
+    '''
+    o = open_output(f)
+    try:
+        yield o
+    finally:
+        if o is not f:
+            o.close()
+
+
+###################################################################################################
+# BGZF
+###################################################################################################
+
+
+def _read_bgzf_block(f):
+    '''
+    @return (compressed data, crc32, uncompressed size) of the next block of
+            `f`, or None at end of file.
+    '''
+    header = f.read(12)
+    if not header:
+        return None
+    if len(header) < 12 or not header.startswith(_gzipMagic) or not header[3] & 4:
+        raise ValueError('Not a BGZF block')
+    xlen, = struct.unpack('<H', header[10:12])
+    extra = f.read(xlen)
+    blockSize, position = None, 0
+    while position + 4 <= len(extra):
+        subfield, length = extra[position:position + 2], struct.unpack(
+            '<H', extra[position + 2:position + 4])[0]
+        if subfield == b'BC' and length == 2:
+            blockSize, = struct.unpack('<H', extra[position + 4:position + 6])
+        position += 4 + length
+    if blockSize is None:
+        raise ValueError('Not a BGZF block')
+    rest = f.read(blockSize + 1 - 12 - xlen)
+    if len(rest) != blockSize + 1 - 12 - xlen:
+        raise ValueError('Truncated BGZF block')
+    crc, size = struct.unpack('<II', rest[-8:])
+    return rest[:-8], crc, size
+
+
+def _inflate_bgzf_block(data, crc, size):
+    # zlib releases the GIL, so blocks inflate in parallel on threads.
+    result = zlib.decompress(data, -15)
+    if len(result) != size or zlib.crc32(result) != crc:
+        raise ValueError('Corrupt BGZF block')
+    return result
+
+
+class BgzfReader(io.RawIOBase):
+    '''
+    Reads a BGZF file, inflating blocks ahead of the reader on a thread pool.
+    Blocks are returned in file order.
+    '''
+    def __init__(self, f, threads=None):
+        super().__init__()
+        threads = threads or os.cpu_count() or 1
+        self.f = f
+        self.executor = concurrent.futures.ThreadPoolExecutor(threads)
+        # At most `window` blocks (about 64 KB each) are held at once.
+        self.window = threads * 4
+        self.pending = collections.deque()
+        self.current = memoryview(b'')
+        self.eof = False
+
+    def readable(self):
+        return True
+
+    def _fill(self):
+        while not self.eof and len(self.pending) < self.window:
+            block = _read_bgzf_block(self.f)
+            if block is None:
+                self.eof = True
+            else:
+                self.pending.append(self.executor.submit(_inflate_bgzf_block, *block))
+
+    def readinto(self, b):
+        while not self.current:
+            self._fill()
+            if not self.pending:
+                return 0
+            self.current = memoryview(self.pending.popleft().result())
+        n = min(len(b), len(self.current))
+        b[:n] = self.current[:n]
+        self.current = self.current[n:]
+        return n
+
+    def close(self):
+        if not self.closed:
+            self.executor.shutdown(cancel_futures=True)
+        super().close()
+
+
+class BgzfWriter(io.RawIOBase):
+    '''
+    Writes a BGZF file, readable by `bgzip`, `samtools`, and any gzip reader.
+    '''
+    def __init__(self, f, compresslevel=6):
+        super().__init__()
+        self.f, self.compresslevel, self.buffer = f, compresslevel, bytearray()
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self.buffer += b
+        while len(self.buffer) >= BGZF_BLOCK_SIZE:
+            self._write_block(self.buffer[:BGZF_BLOCK_SIZE])
+            del self.buffer[:BGZF_BLOCK_SIZE]
+        return len(b)
+
+    def _write_block(self, data):
+        compressor = zlib.compressobj(self.compresslevel, zlib.DEFLATED, -15)
+        compressed = compressor.compress(data) + compressor.flush()
+        self.f.write(struct.pack(
+            '<4BI2BH2BHH', 0x1f, 0x8b, 8, 4, 0, 0, 0xff, 6, ord('B'), ord('C'), 2,
+            len(compressed) + 25))
+        self.f.write(compressed)
+        self.f.write(struct.pack('<II', zlib.crc32(data), len(data)))
+
+    def close(self):
+        if not self.closed:
+            if self.buffer:
+                self._write_block(self.buffer)
+                self.buffer = bytearray()
+            self.f.write(BGZF_EOF)
+            self.f.flush()
+        super().close()
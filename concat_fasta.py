@@ -25,70 +25,165 @@ Concat a set of FASTA files.
 '''
 
 import argparse
+import collections
+import concurrent.futures
+import io
 import logging
+import mmap
 import os
+import stat
 import sys
 
+from compressed_io import compressed_output, is_compressed, open_input
+from fasta_format import (
+    FastaWriter, fetch_sequence, has_blanks, index_fasta, is_binary, parse_fasta_format,
+    wrapped_span)
+from run_stats import RunStats, stage
+from threaded_io import ReadAheadReader, WriteBehindWriter
 
-###################################################################################################
-# FASTA file format parsing functions
-# These may be moved to another package at a later time.
-###################################################################################################
 
-
-def parse_fasta_format(f):
+def concat_passthrough(f, prefix, writer, logger):
     '''
-    @param f file object open for reading in FASTA format.
-    @yield tuples of form (description, sequence)
+    Copies the records of uncompressed FASTA file `f` to `writer`, rewriting
+    only the description lines.  Sequences already wrapped at the output
+    width are copied unchanged; only the others are rewrapped.
 
-    Ignores data before the first description.
-    '''
-    description, sequence = None, None
-    for line in f:
-        if line.startswith('>'):
-            if description and sequence:
-                yield (description, sequence)
-            # Remove '>' character
-            description, sequence = line[1:].strip(), ''
-        elif sequence is not None:
-            sequence += line.strip()
-    if description and sequence:
-        yield (description, sequence)
-
-
-def print_fasta_description(o, description, sequence):
+    @param f file object open for reading in binary mode.
+    @return the number of records written, or None if `f` cannot be copied
+            this way, in which case nothing was written.
     '''
-    @param o file object open for writing.
-    @param description string describing the sequence.
-           The '>' character is prepended.
-    @param sequence string in FASTA Sequence Representation.
+    try:
+        fileStat = os.fstat(f.fileno())
+    except (AttributeError, io.UnsupportedOperation):
+        return None
+    if not stat.S_ISREG(fileStat.st_mode) or is_compressed(f):
+        return None
+    if fileStat.st_size == 0:
+        return 0
+    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        # Check every record before writing any of them.
+        records = []
+        try:
+            for description, entry in index_fasta(data):
+                if not description or not entry.length:
+                    continue
+                span = wrapped_span(data, entry, writer.width)
+                if span is None and has_blanks(data, entry):
+                    return None
+                records.append((description, entry, span))
+        except ValueError:
+            return None
+        with memoryview(data) as view:
+            for description, entry, span in records:
+                description = prefix + description
+                if span is not None:
+                    writer.write_wrapped(description, view[span[0]:span[1]])
+                else:
+                    writer.write(description, fetch_sequence(data, entry))
+                logger.debug('%s + %d', description, entry.length)
+    return len(records)
+
+
+def concat_file(filename, writer, logger, pipeline=False, stats=None):
     '''
-    o.write('>%s\n%s\n\n' % (description, split_str(sequence, 70)))
+    Writes the records of FASTA file `filename` to `writer`, each description
+    prefixed with the file's name.
 
+    @param pipeline if True, and `writer` is binary, parsed files are read
+           ahead on a background thread.
+    @param stats if not None, a RunStats to which the time spent copying
+           ('copy'), parsing ('parse'), and writing ('write') is added.
 
-def split_str(s, n):
+    @return the number of records written.
+    '''
+    prefix = os.path.basename(filename) + " : "
+    count = 0
+    with open(filename, 'rb') as raw:
+        if writer.binary:
+            with stage(stats, 'copy'):
+                copied = concat_passthrough(raw, prefix, writer, logger)
+            if copied is not None:
+                return copied
+        with open_input(raw) as f:
+            if not writer.binary:
+                f = io.TextIOWrapper(f)
+            elif pipeline:
+                f = ReadAheadReader(f)
+            try:
+                records, write = parse_fasta_format(f), writer.write
+                if stats is not None:
+                    records = stats.timed_iter('parse', records)
+                    write = stats.timed('write', write)
+                for (description, sequence) in records:
+                    description = prefix + description
+                    write(description, sequence)
+                    logger.debug('%s + %d', description, len(sequence))
+                    count += 1
+            finally:
+                if pipeline:
+                    f.close()
+    return count
+
+
+def _format_file(filename, binary, logger):
     '''
-    Inserts newlines into string `s` so that lines are no longer than
-    `n` characters long.
+    @return (formatted records of `filename`, number of records).
     '''
-    return '\n'.join(s[i:i+n] for i in range(0, len(s), n))
+    buffer = io.BytesIO() if binary else io.StringIO()
+    with FastaWriter(buffer) as writer:
+        count = concat_file(filename, writer, logger)
+    return buffer.getvalue(), count
 
 
-###################################################################################################
+def _write_result(outfile, future):
+    formatted, count = future.result()
+    outfile.write(formatted)
+    return count
 
 
-def concat(infilenamess, outfile, logger):
+def concat(infilenamess, outfile, logger, jobs=1, pipeline=False, stats=None):
     '''
     concatinate a set of FASTA files.
+
+    Input files are read in binary mode if `outfile` is open in binary mode.
+    Compressed input files are decompressed.  Well-formed uncompressed input
+    files are copied with `concat_passthrough` rather than parsed.
+
+    @param jobs number of threads reading files.  If more than one, files
+           are read and formatted ahead of the output, at most `jobs * 4` at
+           a time, and written in the order given.
+    @param pipeline if True, and `outfile` is binary, reading, parsing, and
+           writing overlap: files are read ahead on one background thread,
+           and written behind on another.  Ignored if `jobs` is more than one.
+    @param stats if not None, a RunStats to which the time of each stage, as
+           for `concat_file`, and the number of records and bytes read, are
+           added.  If `jobs` is more than one, the files are read and
+           written at once, in one stage ('concat').
     '''
     count = 0
-    for filename in infilenamess:
-        with open(filename) as f:
-            for (description, sequence) in parse_fasta_format(f):
-                description = os.path.basename(filename) + " : " + description
-                print_fasta_description(outfile, description, sequence)
-                logger.debug('%s + %d', description, len(sequence))
-                count += 1
+    if stats is not None:
+        infilenamess = list(infilenamess)
+        stats.bytes = sum(os.path.getsize(filename) for filename in infilenamess)
+    if jobs > 1:
+        binary = is_binary(outfile)
+        with stage(stats, 'concat'), concurrent.futures.ThreadPoolExecutor(jobs) as executor:
+            pending = collections.deque()
+            for filename in infilenamess:
+                if len(pending) >= jobs * 4:
+                    count += _write_result(outfile, pending.popleft())
+                pending.append(executor.submit(_format_file, filename, binary, logger))
+            while pending:
+                count += _write_result(outfile, pending.popleft())
+    elif pipeline and is_binary(outfile):
+        with WriteBehindWriter(outfile) as o, FastaWriter(o) as writer:
+            for filename in infilenamess:
+                count += concat_file(filename, writer, logger, pipeline, stats)
+    else:
+        with FastaWriter(outfile) as writer:
+            for filename in infilenamess:
+                count += concat_file(filename, writer, logger, stats=stats)
+    if stats is not None:
+        stats.records = count
     logger.info('sequence count: %d', count)
 
 
@@ -101,19 +196,40 @@ def parse_args(argv):
         metavar='IN_FILES',
         type=str,
         nargs='+',
-        help='Path of FASTA file(s) to read. Required.')
+        help='Path of FASTA file(s) to read; may be compressed with gzip, '
+             'bgzip, or zstd. Required.')
     parser.add_argument(
         '-o',
         '--outfile',
         nargs='?',
-        type=argparse.FileType('w'),
-        default=sys.stdout,
-        help='Where to write FASTA file. (default: STDOUT)')
+        type=argparse.FileType('wb'),
+        default=sys.stdout.buffer,
+        help='Where to write FASTA file.  Compressed if the name ends with '
+             '".gz", ".bgz" (bgzip), or ".zst". (default: STDOUT)')
     parser.add_argument(
         '--loglevel',
         choices=['debug', 'info', 'warning'],
         default='info',
         help='Verbosity level. (default: info)')
+    parser.add_argument(
+        '-j',
+        '--jobs',
+        type=int,
+        default=1,
+        help='Number of files to read at once. (default: 1)')
+    parser.add_argument(
+        '--pipeline',
+        action='store_true',
+        help='Read, parse, and write on separate threads, so that they '
+             'overlap.  Has no effect with --jobs.')
+    parser.add_argument(
+        '--stats',
+        nargs='?',
+        const='text',
+        choices=['text', 'json'],
+        help='When done, write the time spent in each stage, the records and '
+             'bytes read per second, and the peak memory to STDERR, as a table '
+             'or as JSON. (default: text, if given)')
     return parser.parse_args(argv)
 
 
@@ -123,11 +239,16 @@ def parse_args(argv):
 def main():
     args = parse_args(sys.argv[1:])
     logging.basicConfig(format='%(levelname)s:  %(message)s', level=args.loglevel.upper())
+    stats = RunStats() if args.stats else None
     try:
-        concat(args.infiles, args.outfile, logging.getLogger())
+        with compressed_output(args.outfile) as outfile:
+            concat(args.infiles, outfile, logging.getLogger(), args.jobs, args.pipeline, stats)
     except Exception as e:
         logging.error(e)
         sys.exit(1)
+    if stats is not None:
+        stats.finish()
+        stats.report(sys.stderr, args.stats)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,476 @@
+# Copyright 2023 Hal W Canary III, Lindsay R Saunders PhD.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+'''
+FASTA file format parsing functions, shared by `bestSequenceEachSpecies.py`
+and `concat_fasta.py`.
+'''
+
+import collections
+import io
+import re
+
+# Size of each read() call when parsing.
+BLOCK_SIZE = 1 << 20
+
+# Length of sequence lines written by `print_fasta_description`.
+LINE_WIDTH = 70
+
+# One line of a samtools-style `.fai` index.  `offset` is the position of the
+# first base; `linebases` and `linewidth` are the number of bases and bytes in
+# each full line of the sequence.
+FastaIndexEntry = collections.namedtuple(
+    'FastaIndexEntry', ['name', 'length', 'offset', 'linebases', 'linewidth'])
+
+
+class LineLengthError(ValueError):
+    '''
+    Raised by `index_fasta` when the sequence lines of a record differ in
+    length, so that the record can not be indexed.
+    '''
+
+
+def read_lines(f, blocksize=BLOCK_SIZE):
+    '''
+    @param f file object open for reading, in text or binary mode.
+    @param blocksize number of characters to request with each read().
+    @yield each line of `f`, without its trailing newline.
+
+    Reads `f` in large blocks rather than one line at a time.
+    '''
+    remainder = None
+    while True:
+        block = f.read(blocksize)
+        if not block:
+            break
+        lines = (remainder + block if remainder else block).split(
+            b'\n' if isinstance(block, bytes) else '\n')
+        remainder = lines.pop()
+        yield from lines
+    if remainder:
+        yield remainder
+
+
+def is_binary(f):
+    '''
+    @return True if file object `f` reads or writes `bytes` rather than `str`.
+    '''
+    return not isinstance(f, io.TextIOBase)
+
+
+def decode_description(description):
+    '''
+    Converts a description read in binary mode to a string.  Undecodable
+    bytes are preserved, so that `encode_description` restores them.
+    '''
+    return description.decode('utf-8', 'surrogateescape')
+
+
+def encode_description(description):
+    return description.encode('utf-8', 'surrogateescape')
+
+
+def parse_fasta_format(f, blocksize=BLOCK_SIZE):
+    '''
+    @param f file object open for reading in FASTA format.
+    @yield tuples of form (description, sequence)
+
+    Ignores data before the first description.
+
+    Sequence lines are collected in a list and joined once per record, so
+    parsing is linear in the size of the input.
+
+    If `f` is open in binary mode, only the description is decoded; each
+    sequence is yielded as `bytes`.
+    '''
+    if is_binary(f):
+        marker, join, decode = b'>', b''.join, decode_description
+    else:
+        marker, join, decode = '>', ''.join, str
+    description, fragments = None, None
+    for line in read_lines(f, blocksize):
+        if line.startswith(marker):
+            if description:
+                sequence = join(fragments)
+                if sequence:
+                    yield (description, sequence)
+            # Remove '>' character
+            description, fragments = decode(line[1:].strip()), []
+        elif fragments is not None:
+            fragments.append(line.strip())
+    if description:
+        sequence = join(fragments)
+        if sequence:
+            yield (description, sequence)
+
+
+_nonblankRe = re.compile(rb'\S')
+
+
+def scan_fasta_format(data, start=0, end=None):
+    '''
+    @param data bytes-like FASTA content, such as an `mmap.mmap`.
+    @param start, end range of `data` to scan, such as one returned by
+           `split_fasta_file`.  (default: all of `data`)
+    @yield (description, start, end) for each record that
+           `parse_fasta_format` would yield, where bytes [start, end) of
+           `data` hold its sequence lines.
+
+    Only description lines are read.  Sequences are skipped by searching for
+    the next description, and are not otherwise examined beyond checking that
+    they are not blank; use `read_sequence` to get one.
+    '''
+    size = len(data) if end is None else end
+    if data[start:start + 1] != b'>':
+        start = data.find(b'\n>', start, size)
+        if start < 0:
+            return
+        start += 1
+    while start < size:
+        headerEnd = data.find(b'\n', start, size)
+        if headerEnd < 0:
+            return
+        nextStart = data.find(b'\n>', headerEnd, size)
+        end = size if nextStart < 0 else nextStart + 1
+        description = data[start + 1:headerEnd].strip()
+        if description and _nonblankRe.search(data, headerEnd + 1, end):
+            yield decode_description(description), headerEnd + 1, end
+        start = end
+
+
+def read_sequence(data, start, end):
+    '''
+    @return the sequence held in bytes [start, end) of `data`, as bytes,
+            exactly as `parse_fasta_format` would join it.
+    '''
+    lines = data[start:end]
+    if any(c in lines for c in (b' ', b'\t', b'\r', b'\x0b', b'\x0c')):
+        # The parser strips whitespace from the ends of each line.
+        return b''.join(line.strip() for line in lines.split(b'\n'))
+    return lines.translate(None, b'\n')
+
+
+class FileRange(object):
+    '''
+    Reads bytes [start, end) of a binary file object, so that part of a file
+    can be parsed on its own.
+    '''
+    def __init__(self, f, start, end):
+        f.seek(start)
+        self.f, self.remaining = f, end - start
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.f.read(size)
+        self.remaining -= len(data)
+        return data
+
+
+def split_fasta_file(f, count):
+    '''
+    @param f seekable file object open for reading in binary mode.
+    @param count desired number of parts.
+    @return list of up to `count` (start, end) byte ranges covering `f`.
+            Every range but the first begins with a description line.
+    '''
+    size = f.seek(0, io.SEEK_END)
+    return _split_at(f, size, (size * i // count for i in range(1, count)))
+
+
+def chunk_fasta_file(f, chunkSize):
+    '''
+    Like `split_fasta_file`, but splits `f` into ranges of about `chunkSize`
+    bytes.  Each boundary depends only on the data before it, so appending
+    records to `f` changes only the last range.
+    '''
+    size = f.seek(0, io.SEEK_END)
+    return _split_at(f, size, range(chunkSize, size, chunkSize))
+
+
+def _split_at(f, size, positions):
+    '''
+    @return list of (start, end) byte ranges covering `f`, split at the first
+            description line at or after each of the increasing `positions`.
+    '''
+    boundaries = [0]
+    for position in positions:
+        if position <= boundaries[-1]:
+            continue
+        # Skip the rest of the line containing `position - 1`.
+        f.seek(position - 1)
+        f.readline()
+        while True:
+            position = f.tell()
+            line = f.readline()
+            if not line or line.startswith(b'>'):
+                break
+        if position > boundaries[-1] and position < size:
+            boundaries.append(position)
+    boundaries.append(size)
+    return list(zip(boundaries[:-1], boundaries[1:]))
+
+
+def print_fasta_description(o, description, sequence):
+    '''
+    @param o file object open for writing.
+    @param description string describing the sequence.
+           The '>' character is prepended.
+    @param sequence string in FASTA Sequence Representation.
+           If `sequence` is bytes-like, `o` must be open in binary mode.
+    '''
+    if isinstance(sequence, str):
+        o.write('>%s\n%s\n\n' % (description, split_str(sequence, LINE_WIDTH)))
+    else:
+        o.write(b'>%s\n%s\n\n' % (
+            encode_description(description), split_str(sequence, LINE_WIDTH)))
+
+
+class FastaWriter(object):
+    '''
+    Writes FASTA records to a file object, wrapping sequences at `width`
+    columns.
+
+    Each line is copied from the sequence straight into one reusable buffer,
+    which is handed to `o` whenever it holds `flushThreshold` characters.
+    Unlike `print_fasta_description`, no wrapped or formatted copy of the
+    whole sequence is made, so memory use does not depend on sequence length.
+    Call `flush` (or use a `with` block) when done.
+    '''
+    def __init__(self, o, width=LINE_WIDTH, flushThreshold=1 << 20):
+        '''
+        @param o file object open for writing, in text or binary mode.
+        '''
+        self.o, self.width, self.flushThreshold = o, width, flushThreshold
+        self.binary = is_binary(o)
+        self.buffer = bytearray() if self.binary else []
+        self.size = 0
+
+    def write(self, description, sequence):
+        '''
+        @param description string describing the sequence.
+        @param sequence string, or if `o` is binary, bytes-like.
+        '''
+        buffer, width = self.buffer, self.width
+        if self.binary:
+            buffer += b'>%s\n' % encode_description(description)
+            view = memoryview(sequence)
+            for i in range(0, len(view), width):
+                buffer += view[i:i + width]
+                buffer += b'\n'
+                if len(buffer) >= self.flushThreshold:
+                    self.flush()
+            buffer += b'\n'
+            if len(buffer) >= self.flushThreshold:
+                self.flush()
+        else:
+            buffer.append('>%s\n' % description)
+            for i in range(0, len(sequence), width):
+                buffer.append(sequence[i:i + width])
+                buffer.append('\n')
+            buffer.append('\n')
+            self.size += len(description) + len(sequence) + len(sequence) // width + 4
+            if self.size >= self.flushThreshold:
+                self.flush()
+
+    def write_wrapped(self, description, lines):
+        '''
+        Writes a record whose sequence is already wrapped at `width` columns,
+        such as the span found by `wrapped_span`.
+        @param lines bytes-like sequence lines, without the final newline.
+               `o` must be open in binary mode.
+        '''
+        buffer = self.buffer
+        buffer += b'>%s\n' % encode_description(description)
+        if len(lines) >= self.flushThreshold:
+            # Large sequences go to `o` without being copied.
+            self.flush()
+            self.o.write(lines)
+        else:
+            buffer += lines
+        buffer += b'\n\n'
+        if len(buffer) >= self.flushThreshold:
+            self.flush()
+
+    def flush(self):
+        if self.binary:
+            self.o.write(self.buffer)
+            self.buffer.clear()
+        else:
+            self.o.write(''.join(self.buffer))
+            self.buffer.clear()
+            self.size = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.flush()
+
+
+def split_str(s, n):
+    '''
+    Inserts newlines into string `s` so that lines are no longer than
+    `n` characters long.
+
+    If `s` is bytes-like, returns `bytes`, slicing `s` through a memoryview
+    so that the only copy made is the final join.
+    '''
+    if isinstance(s, str):
+        return '\n'.join(s[i:i+n] for i in range(0, len(s), n))
+    view = memoryview(s)
+    return b'\n'.join(view[i:i+n] for i in range(0, len(view), n))
+
+
+###################################################################################################
+# Indexed access, compatible with `samtools faidx`.
+###################################################################################################
+
+
+def index_fasta(data):
+    '''
+    @param data bytes-like FASTA content, such as an `mmap.mmap`.
+    @yield (description, FastaIndexEntry) tuples, one per record.
+    @raises LineLengthError if the lines of a record's sequence differ in
+            length.
+
+    Only record boundaries are found by scanning; each sequence is examined
+    one record at a time.
+    '''
+    if data[:1] == b'>':
+        start = 0
+    else:
+        start = data.find(b'\n>')
+        if start < 0:
+            return
+        start += 1
+    while True:
+        headerEnd = data.find(b'\n', start)
+        if headerEnd < 0:
+            headerEnd = len(data)
+        nextStart = data.find(b'\n>', headerEnd)
+        end = len(data) if nextStart < 0 else nextStart + 1
+        description = decode_description(data[start + 1:headerEnd].strip())
+        lines = data[headerEnd + 1:end].split(b'\n')
+        while lines and not lines[-1].strip():
+            lines.pop()
+        if lines:
+            linewidth = len(lines[0]) + 1
+            linebases = len(lines[0].rstrip(b'\r'))
+            last = len(lines[-1].rstrip(b'\r'))
+            if set(map(len, lines[:-1])) - {linewidth - 1} or last > linebases:
+                raise LineLengthError('Different line lengths in sequence %r' % description)
+            length = (len(lines) - 1) * linebases + last
+        else:
+            length, linebases, linewidth = 0, 0, 0
+        name = description.split(None, 1)[0] if description else ''
+        yield description, FastaIndexEntry(name, length, headerEnd + 1, linebases, linewidth)
+        if nextStart < 0:
+            return
+        start = nextStart + 1
+
+
+def write_fasta_index(o, entries):
+    '''
+    @param o file object open for writing in text mode.
+    @param entries iterable of FastaIndexEntry.
+    '''
+    for entry in entries:
+        o.write('%s\t%d\t%d\t%d\t%d\n' % entry)
+
+
+def read_fasta_index(f):
+    '''
+    @param f file object open for reading a `.fai` index in text mode.
+    @yield FastaIndexEntry for each line.
+    '''
+    for line in f:
+        name, length, offset, linebases, linewidth = line.rstrip('\n').split('\t')[:5]
+        yield FastaIndexEntry(name, int(length), int(offset), int(linebases), int(linewidth))
+
+
+def read_indexed_description(data, entry):
+    '''
+    @return the description of the record of `data` located by `entry`.
+    '''
+    headerEnd = entry.offset - 1
+    start = data.rfind(b'\n', 0, headerEnd) + 1
+    return decode_description(data[start + 1:headerEnd].strip())
+
+
+def _sequence_end(entry):
+    '''
+    @return the position just after the last base of `entry`.
+    '''
+    if entry.length == 0:
+        return entry.offset
+    lines, remainder = divmod(entry.length - 1, entry.linebases)
+    return entry.offset + lines * entry.linewidth + remainder + 1
+
+
+def fetch_sequence(data, entry):
+    '''
+    @return the sequence of the record of `data` located by `entry`, as bytes,
+            exactly as `parse_fasta_format` would read it.
+    '''
+    return read_sequence(data, entry.offset, _sequence_end(entry))
+
+
+def has_blanks(data, entry):
+    '''
+    @return True if the sequence lines of the record of `data` located by
+            `entry` contain spaces or tabs, which `parse_fasta_format` strips
+            from the ends of each line, so that they can not be copied as
+            they are.
+    '''
+    start, end = entry.offset, _sequence_end(entry)
+    return data.find(b' ', start, end) >= 0 or data.find(b'\t', start, end) >= 0
+
+
+def wrapped_span(data, entry, width=LINE_WIDTH):
+    '''
+    @return (start, end) positions of the sequence lines of the record of
+            `data` located by `entry`, if they are already wrapped at `width`
+            columns exactly as `split_str` would wrap them, or None.
+    '''
+    if entry.length == 0 or entry.linewidth != entry.linebases + 1:
+        return None
+    if entry.linebases != width and not entry.length == entry.linebases <= width:
+        return None
+    if has_blanks(data, entry):
+        return None
+    return entry.offset, _sequence_end(entry)
+
+
+def write_indexed_record(o, data, entry, description):
+    '''
+    Writes the record of `data` located by `entry`, in the same format as
+    `print_fasta_description`.  If the sequence is already wrapped the same
+    way, its bytes are copied unchanged.
+
+    @param o file object open for writing in binary mode.
+    '''
+    span = wrapped_span(data, entry)
+    if span is not None:
+        o.write(b'>%s\n' % encode_description(description))
+        o.write(data[span[0]:span[1]])
+        o.write(b'\n\n')
+    else:
+        print_fasta_description(o, description, fetch_sequence(data, entry))
@@ -0,0 +1,146 @@
+# Copyright 2023 Hal W Canary III, Lindsay R Saunders PhD.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+'''
+Nucleotide sequences packed at two bits per base.
+
+Any character other than 'A', 'C', 'G' and 'T' (IUPAC ambiguity codes such
+as 'N', 'Y' or 'R', lower case bases, or anything else) is kept in a list of
+exceptions, so packing loses nothing.  Nearly every base of a 16S database is
+one of the four, so the list is short.
+'''
+
+import re
+import struct
+
+# The two-bit code of each base; other characters are stored as 'A' (0) and
+# restored from the exceptions.
+_codes = bytes(max(b'ACGT'.find(i), 0) for i in range(256))
+
+# For each phase k, the table that moves a base's code (0 to 3) to bits
+# 2k and 2k+1 of a byte.
+_shifts = [bytes((i << 2 * k) & 0xff for i in range(256)) for k in range(4)]
+
+# For each phase k, the table that turns a packed byte into its kth base.
+_bases = [bytes(b'ACGT'[(i >> 2 * k) & 3] for i in range(256)) for k in range(4)]
+
+_exceptionRe = re.compile(rb'[^ACGT]+')
+_shortSpan, _longSpan = struct.Struct('<HH'), struct.Struct('<II')
+
+
+def _span_format(length):
+    # Sequences shorter than 64 KiB, such as any 16S gene, store each run of
+    # exceptions in four bytes rather than eight.
+    return _shortSpan if length <= 0xffff else _longSpan
+
+
+class PackedSequence(object):
+    '''
+    A sequence of bases packed four to a byte.  The length and the number of
+    'A', 'G', 'T' and 'C' bases are known without unpacking it.
+
+    @param sequence string or bytes-like.  `unpack` returns the same type.
+    '''
+    __slots__ = ('length', 'agtcCount', 'runs', 'data', 'text')
+
+    def __init__(self, sequence):
+        self.text = isinstance(sequence, str)
+        if self.text:
+            # One byte per character, so that positions agree.
+            key = sequence.encode('ascii', 'replace')
+        else:
+            key = bytes(sequence)
+        self.length = len(key)
+        self.agtcCount = self.length - len(key.translate(None, b'AGTC'))
+        codes = key.translate(_codes) + bytes(-len(key) % 4)
+        packed = 0
+        for k in range(4):
+            packed |= int.from_bytes(codes[k::4].translate(_shifts[k]), 'little')
+        self.data = packed.to_bytes(len(codes) // 4, 'little')
+        self.runs = 0
+        if self.agtcCount == self.length:
+            return
+        spans, bases, span = [], [], _span_format(self.length)
+        for m in _exceptionRe.finditer(key):
+            spans.append(span.pack(m.start(), m.end() - m.start()))
+            bases.append(sequence[m.start():m.end()])
+        if self.text:
+            bases = [''.join(bases).encode('utf-8', 'surrogateescape')]
+        self.runs = len(spans)
+        self.data += b''.join(spans) + b''.join(bases)
+
+    @classmethod
+    def from_data(cls, length, agtcCount, runs, data, text=False):
+        '''
+        @return the PackedSequence whose attributes are the arguments, such
+                as one previously stored on disk.
+        '''
+        packed = cls.__new__(cls)
+        packed.length, packed.agtcCount, packed.runs = length, agtcCount, runs
+        packed.data, packed.text = data, text
+        return packed
+
+    def __len__(self):
+        return self.length
+
+    def agtc_fraction(self):
+        '''
+        @return the fraction of bases that are 'A', 'G', 'T' or 'C'.
+        '''
+        return float(self.agtcCount) / self.length
+
+    def exceptions(self):
+        '''
+        @yield (position, bases) for each run of bases other than 'A', 'C',
+               'G' and 'T'.
+        '''
+        data, span = memoryview(self.data), _span_format(self.length)
+        offset = (self.length + 3) // 4
+        position = offset + self.runs * span.size
+        bases = data[position:].tobytes()
+        if self.text:
+            bases = bases.decode('utf-8', 'surrogateescape')
+        i = 0
+        for start, length in span.iter_unpack(data[offset:position]):
+            yield start, bases[i:i + length]
+            i += length
+
+    def unpack(self):
+        '''
+        @return the sequence, as a string if it was packed from one, and as
+                bytes otherwise.
+        '''
+        packed = bytes(memoryview(self.data)[:(self.length + 3) // 4])
+        result = bytearray(len(packed) * 4)
+        for k in range(4):
+            result[k::4] = packed.translate(_bases[k])
+        del result[self.length:]
+        if not self.text:
+            for start, bases in self.exceptions():
+                result[start:start + len(bases)] = bases
+            return bytes(result)
+        text = result.decode('ascii')
+        pieces, position = [], 0
+        for start, bases in self.exceptions():
+            pieces.append(text[position:start])
+            pieces.append(bases)
+            position = start + len(bases)
+        pieces.append(text[position:])
+        return ''.join(pieces)
@@ -0,0 +1,166 @@
+# Copyright 2023 Hal W Canary III, Lindsay R Saunders PhD.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+'''
+Progress reports for long runs: how much of the input has been read, records
+and megabytes per second, and the estimated time left.
+'''
+
+import itertools
+import os
+import stat
+import time
+
+
+def _file_position(f):
+    '''
+    @return (size, position) of the regular file read by `f`, where
+            `position()` is the offset of its descriptor; or (None, None)
+            if `f` does not read a regular file.
+    '''
+    try:
+        fd = f.fileno()
+        fileStat = os.fstat(fd)
+    except (AttributeError, OSError, ValueError):
+        return None, None
+    if not stat.S_ISREG(fileStat.st_mode):
+        return None, None
+    return fileStat.st_size, lambda: os.lseek(fd, 0, os.SEEK_CUR)
+
+
+def _format_duration(seconds):
+    return '%d:%02d:%02d' % (seconds // 3600, seconds // 60 % 60, seconds % 60)
+
+
+class ProgressReporter(object):
+    '''
+    Reports progress through an input file, at most once every `interval`
+    seconds.
+
+    Progress is measured by the offset of the file's descriptor, so a
+    compressed file is measured before decompression, and the time left is
+    estimated from the rate at which the file has been read so far.
+
+    @param infile the file being read, or a decompressor or other reader
+           sharing its descriptor.  If it is not a regular file, such as a
+           pipe, only records are counted.
+    @param logger where reports go, as key=value pairs at the info level, if
+           `stream` is None.
+    @param stream if not None, a text stream, such as `sys.stderr`, on which
+           each report replaces the previous one on a single line.
+    @param interval least number of seconds between reports.  (default: 0.25
+           with `stream`, 30 without)
+    '''
+    def __init__(self, infile, logger, stream=None, interval=None):
+        self.size, self._position = _file_position(infile)
+        self.logger, self.stream = logger, stream
+        if interval is None:
+            interval = 0.25 if stream is not None else 30.0
+        self.interval = interval
+        self.records = 0
+        self.startPosition = self._position() if self._position is not None else 0
+        self.start = self.last = time.monotonic()
+        self.width = 0
+
+    def track(self, records, position=None, every=256):
+        '''
+        @yield the items of `records`, counting them.  The clock is read only
+               once every `every` items, so the cost per item is small.  When
+               `records` is exhausted, a last report is made.
+        @param position if not None, `position(item)` is the offset in the
+               file that reading `item` reached, for a file that is
+               memory-mapped rather than read through its descriptor.
+        '''
+        clock, iterator, offset = time.monotonic, iter(records), None
+        try:
+            while True:
+                batch = list(itertools.islice(iterator, every))
+                if not batch:
+                    return
+                yield from batch
+                self.records += len(batch)
+                if position is not None:
+                    offset = position(batch[-1])
+                now = clock()
+                if now - self.last >= self.interval:
+                    self.report(now, offset)
+        finally:
+            self.finish(offset)
+
+    def values(self, now, offset=None):
+        '''
+        @param offset the offset reached in the file, if not its position.
+        @return a dictionary of the progress so far: 'records', 'seconds',
+                'recordsPerSecond', and, if the file is a regular file,
+                'bytes', 'bytesPerSecond', 'percent' and 'eta' (in seconds).
+        '''
+        elapsed = max(now - self.start, 1e-9)
+        values = {'records': self.records, 'seconds': elapsed,
+                  'recordsPerSecond': self.records / elapsed}
+        if self.size is None:
+            return values
+        if offset is None:
+            offset = self._position()
+        done = min(offset, self.size) - self.startPosition
+        rate = done / elapsed
+        values.update(bytes=done, bytesPerSecond=rate,
+                      percent=100.0 * done / max(self.size - self.startPosition, 1),
+                      eta=(self.size - self.startPosition - done) / rate if rate else None)
+        return values
+
+    def report(self, now=None, offset=None):
+        '''
+        Reports the progress so far.
+        @param offset as for `values`.
+        '''
+        if now is None:
+            now = time.monotonic()
+        self.last = now
+        values = self.values(now, offset)
+        if self.stream is None:
+            self.logger.info('progress %s', ' '.join(
+                '%s=%s' % (key, _format_value(value)) for key, value in values.items()))
+            return
+        line = '%d records, %.0f records/s' % (values['records'], values['recordsPerSecond'])
+        if 'percent' in values:
+            line = '%5.1f%%, %s, %.1f MB/s' % (
+                values['percent'], line, values['bytesPerSecond'] / 1e6)
+            if values['eta'] is not None:
+                line += ', ETA ' + _format_duration(values['eta'])
+        # Pad with spaces to cover the rest of a longer previous line.
+        self.stream.write('\r' + line.ljust(self.width))
+        self.stream.flush()
+        self.width = len(line)
+
+    def finish(self, offset=None):
+        '''
+        Makes a last report, ending the line written to `stream`.
+        '''
+        self.report(offset=offset)
+        if self.stream is not None:
+            self.stream.write('\n')
+            self.stream.flush()
+
+
+def _format_value(value):
+    if isinstance(value, float):
+        return '%.1f' % value
+    return 'none' if value is None else str(value)
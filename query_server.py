@@ -0,0 +1,207 @@
+#! /usr/bin/env python3
+
+# Copyright 2023 Hal W Canary III, Lindsay R Saunders PhD.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+'''
+Serve best-sequence-per-species queries over HTTP on localhost, keeping a
+reference database loaded between requests.
+
+The database is read once, converted to a sequence database if it is a
+FASTA file, and indexed by genus.  It is loaded again whenever the file's
+modification time or size changes.  Ask for
+
+    http://localhost:PORT/best?genus=GENUS&count=COUNT&skipnone=1
+
+(every parameter is optional) to get the FASTA output of
+
+    bestSequenceEachSpecies.py -g GENUS -c COUNT -s DATABASE
+'''
+
+import argparse
+import http.server
+import io
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import urllib.parse
+
+from bestSequenceEachSpecies import get_best_sequence_each_species, make_sequence_database
+from compressed_io import open_input
+from sequence_database import SequenceDatabase, is_sequence_database
+
+
+def load_database(path, logger):
+    '''
+    @return a SequenceDatabase, indexed by genus, of the FASTA file or
+            sequence database at `path`.
+
+    The database is read from an unnamed temporary file, a copy of a
+    sequence database or converted from a FASTA file, so that the file at
+    `path` can be rewritten while it is mapped.  The copy is removed once
+    the database is closed.
+    '''
+    with open(path, 'rb') as f, tempfile.TemporaryFile() as copy:
+        if is_sequence_database(f):
+            shutil.copyfileobj(f, copy)
+        else:
+            logger.info('Converting %r', path)
+            make_sequence_database(open_input(f), copy, logger)
+        copy.flush()
+        database = SequenceDatabase(copy)
+    database.index_genera()
+    return database
+
+
+class ResidentDatabase(object):
+    '''
+    Keeps the database at `path` loaded, and loads it again when the file
+    changes.  If it can not be loaded again (say, because it is being
+    written, or has been removed to be replaced), the last version is kept
+    until the file changes again.
+    '''
+    def __init__(self, path, logger):
+        self.path, self.logger = path, logger
+        self.lock = threading.Lock()
+        self.version = self._version()
+        self.database = load_database(path, logger)
+
+    def _version(self):
+        fileStat = os.stat(self.path)
+        return fileStat.st_mtime_ns, fileStat.st_size
+
+    def get(self):
+        '''
+        @return the current SequenceDatabase.  The one returned before a
+                reload is not closed, so queries using it can finish; it is
+                closed when no longer referenced.
+        '''
+        try:
+            version = self._version()
+        except OSError:
+            return self.database
+        if version != self.version:
+            with self.lock:
+                if version != self.version:
+                    self.version = version
+                    try:
+                        self.database = load_database(self.path, self.logger)
+                        self.logger.info('Reloaded %r', self.path)
+                    except Exception as e:
+                        self.logger.error('Unable to reload %r: %s', self.path, e)
+        return self.database
+
+
+class QueryHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        url = urllib.parse.urlsplit(self.path)
+        if url.path != '/best':
+            self.send_error(404)
+            return
+        query = {k: v[-1] for k, v in urllib.parse.parse_qs(url.query).items()}
+        try:
+            count = int(query.get('count', '1'))
+        except ValueError:
+            self.send_error(400, 'count must be a number')
+            return
+        skipNoSpecies = query.get('skipnone', '0').lower() in ['1', 'true', 'yes']
+        try:
+            body = self.server.query(query.get('genus') or None, count, skipNoSpecies)
+        except RuntimeError as e:
+            self.send_error(404, str(e))
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        self.server.logger.info('%s %s', self.address_string(), format % args)
+
+
+class QueryServer(http.server.ThreadingHTTPServer):
+    '''
+    Answers queries about `resident`, a ResidentDatabase, on `address`.
+    '''
+    daemon_threads = True
+
+    def __init__(self, address, resident, logger):
+        super().__init__(address, QueryHandler)
+        self.resident, self.logger = resident, logger
+
+    def query(self, genus, count, skipNoSpecies):
+        '''
+        @return the output of `get_best_sequence_each_species`, as bytes.
+        '''
+        buffer = io.BytesIO()
+        get_best_sequence_each_species(
+            self.resident.get(), buffer, genus, self.logger, count, skipNoSpecies)
+        return buffer.getvalue()
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        exit_on_error=False, description=__doc__)
+    parser.add_argument(
+        'DATABASE',
+        help='Path of FASTA file, possibly compressed, or sequence database to '
+             'serve. Required.')
+    parser.add_argument(
+        '-p',
+        '--port',
+        type=int,
+        default=8000,
+        help='Port on localhost to listen on. (default: 8000)')
+    parser.add_argument(
+        '--loglevel',
+        choices=['debug', 'info', 'warning'],
+        default='info',
+        help='Verbosity level. (default: info)')
+    return parser.parse_args(argv)
+
+
+###################################################################################################
+
+
+def main():
+    args = parse_args(sys.argv[1:])
+    logging.basicConfig(format='%(levelname)s:  %(message)s', level=args.loglevel.upper())
+    try:
+        resident = ResidentDatabase(args.DATABASE, logging.getLogger())
+        server = QueryServer(('127.0.0.1', args.port), resident, logging.getLogger())
+    except Exception as e:
+        logging.error(e)
+        sys.exit(1)
+    logging.info('Listening on http://127.0.0.1:%d/best', server.server_address[1])
+    with server:
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+# Copyright 2023 Hal W Canary III, Lindsay R Saunders PhD.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+'''
+An on-disk cache of results, addressed by the hash of whatever they were
+computed from, with least-recently-used eviction by total size.
+'''
+
+import hashlib
+import os
+import tempfile
+
+
+def cache_key(*parts):
+    '''
+    @param parts strings, bytes, and numbers that determine a result.
+    @return hex digest identifying `parts`.
+    '''
+    h = hashlib.sha256()
+    for part in parts:
+        if not isinstance(part, bytes):
+            part = repr(part).encode('utf-8', 'surrogateescape')
+        # Length-prefixed, so that different `parts` never collide.
+        h.update(b'%d:' % len(part))
+        h.update(part)
+    return h.hexdigest()
+
+
+class ResultCache(object):
+    '''
+    Stores each result in its own file in `directory`.  Reading a result
+    marks it as recently used by updating its modification time; when the
+    files total more than `maxSize` bytes, the least recently used are
+    removed.
+    '''
+    def __init__(self, directory, maxSize=1 << 30):
+        self.directory, self.maxSize = directory, maxSize
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key)
+
+    def get(self, key):
+        '''
+        @return the bytes stored under `key`, or None.
+        '''
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            os.utime(path)
+        except FileNotFoundError:
+            # Possibly evicted by another process.
+            return None
+        return data
+
+    def put(self, key, data):
+        '''
+        Stores bytes `data` under `key`, then evicts old results if needed.
+        '''
+        fd, temporaryPath = tempfile.mkstemp(dir=self.directory, prefix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as o:
+                o.write(data)
+            os.replace(temporaryPath, self._path(key))
+        except BaseException:
+            os.unlink(temporaryPath)
+            raise
+        self.evict()
+
+    def evict(self):
+        '''
+        Removes the least recently used results until the rest fit in
+        `maxSize` bytes.
+        '''
+        entries = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.is_file() and not entry.name.startswith('.'):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.maxSize:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            total -= size
@@ -0,0 +1,217 @@
+# Copyright 2023 Hal W Canary III, Lindsay R Saunders PhD.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+'''
+Measurements of a run: the time spent in each stage, the number of records
+and bytes read, the peak resident memory, and the descriptions slowest to
+process.
+'''
+
+import contextlib
+import heapq
+import json
+import sys
+import time
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+def peak_rss():
+    '''
+    @return the peak resident memory of this process in bytes, or None where
+            it is not known, such as on Windows.
+    '''
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes.
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def stage(stats, name):
+    '''
+    @return a context manager timing stage `name` of RunStats `stats`, or
+            doing nothing if `stats` is None.
+    '''
+    return contextlib.nullcontext() if stats is None else stats.stage(name)
+
+
+class RunStats(object):
+    '''
+    Cumulative time per stage of a run, and its throughput.
+
+    Pass one as the `stats` argument of `get_best_sequence_each_species` or
+    `concat`; when it returns, call `finish`, then `report` or `as_dict`.
+    The time of each stage excludes that of the stages timed within it, so
+    the stages add up to the time of the run.
+
+    @param slowest how many of the slowest descriptions to keep.
+    '''
+    def __init__(self, slowest=5):
+        self.stageTimes = {}
+        self.recorded = 0.0
+        self.records = 0
+        self.bytes = None
+        self.slowest = slowest
+        self.slowestDescriptions = []
+        self.start = time.perf_counter()
+        self.end = None
+        self.peakRss = None
+
+    def add_time(self, name, seconds):
+        self.stageTimes[name] = self.stageTimes.get(name, 0.0) + seconds
+        self.recorded += seconds
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        '''
+        Times the enclosed block as stage `name`, less the time of the stages
+        timed within it.
+        '''
+        start, nested = time.perf_counter(), self.recorded
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start - (self.recorded - nested))
+
+    def timed(self, name, function):
+        '''
+        @return `function`, with the time of each call added to stage `name`.
+        '''
+        clock, stageTimes = time.perf_counter, self.stageTimes
+        stageTimes.setdefault(name, 0.0)
+
+        def timed(*args):
+            start = clock()
+            try:
+                return function(*args)
+            finally:
+                elapsed = clock() - start
+                stageTimes[name] += elapsed
+                self.recorded += elapsed
+        return timed
+
+    def timed_iter(self, name, iterable):
+        '''
+        @return an iterator over the items of `iterable`, with the time taken
+                to produce each added to stage `name`.
+        '''
+        self.stageTimes.setdefault(name, 0.0)
+        return self._timed_iter(name, iter(iterable))
+
+    def _timed_iter(self, name, iterator):
+        clock, total = time.perf_counter, 0.0
+        try:
+            while True:
+                start = clock()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+                finally:
+                    total += clock() - start
+                yield item
+        finally:
+            self.add_time(name, total)
+
+    def timed_describe(self, function, name='describe'):
+        '''
+        @return `function`, which processes a description, with the time of
+                each call added to stage `name`, keeping the `slowest`
+                descriptions.
+        '''
+        clock, stageTimes, slowest = time.perf_counter, self.stageTimes, self.slowestDescriptions
+        stageTimes.setdefault(name, 0.0)
+
+        def timed(description):
+            start = clock()
+            result = function(description)
+            elapsed = clock() - start
+            stageTimes[name] += elapsed
+            self.recorded += elapsed
+            if len(slowest) < self.slowest:
+                heapq.heappush(slowest, (elapsed, description))
+            elif slowest and elapsed > slowest[0][0]:
+                heapq.heapreplace(slowest, (elapsed, description))
+            return result
+        return timed
+
+    def finish(self):
+        '''
+        Ends the run, recording its time and the peak resident memory.
+        '''
+        self.end = time.perf_counter()
+        self.peakRss = peak_rss()
+
+    def as_dict(self):
+        '''
+        @return the measurements as a dictionary that `json.dump` can write.
+        '''
+        seconds = (self.end or time.perf_counter()) - self.start
+        stages = dict(self.stageTimes)
+        if seconds > self.recorded:
+            stages['other'] = seconds - self.recorded
+        return {
+            'seconds': seconds,
+            'stages': stages,
+            'records': self.records,
+            'recordsPerSecond': self.records / seconds if seconds else None,
+            'bytes': self.bytes,
+            'bytesPerSecond': self.bytes / seconds if seconds and self.bytes else None,
+            'peakRss': self.peakRss,
+            'slowestDescriptions': [
+                {'seconds': t, 'description': d}
+                for t, d in sorted(self.slowestDescriptions, reverse=True)],
+        }
+
+    def report(self, f, format='text'):
+        '''
+        Writes the measurements to text file `f`, as JSON if `format` is
+        'json', and otherwise as a table.
+        '''
+        values = self.as_dict()
+        if format == 'json':
+            json.dump(values, f, indent=2)
+            f.write('\n')
+            return
+        seconds = values['seconds']
+        f.write('%-12s %10.3f s\n' % ('total', seconds))
+        for name, t in values['stages'].items():
+            share = 100.0 * t / seconds if seconds else 0.0
+            f.write('  %-10s %10.3f s %5.1f%%\n' % (name, t, share))
+        f.write('records    %12d' % values['records'])
+        if values['recordsPerSecond']:
+            f.write(' (%.0f/s)' % values['recordsPerSecond'])
+        f.write('\n')
+        if values['bytes'] is not None:
+            f.write('bytes      %12d' % values['bytes'])
+            if values['bytesPerSecond']:
+                f.write(' (%.1f MB/s)' % (values['bytesPerSecond'] / 1e6))
+            f.write('\n')
+        if values['peakRss'] is not None:
+            f.write('peak RSS   %9.1f MB\n' % (values['peakRss'] / 1e6))
+        if values['slowestDescriptions']:
+            f.write('slowest descriptions:\n')
+            for d in values['slowestDescriptions']:
+                f.write('  %9.6f s  %s\n' % (d['seconds'], d['description']))
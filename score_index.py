@@ -0,0 +1,172 @@
+# Copyright 2023 Hal W Canary III, Lindsay R Saunders PhD.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+'''
+A SQLite index of the records of a FASTA file: the fields of each
+description, the parts of each score, and where each sequence is in the
+file.  Selecting from it reads only the chosen sequences from the file.
+
+The index is an ordinary SQLite database, so it can also be queried
+directly.  For example, the three best type-strain records of some species:
+
+    SELECT species, accession, start, end FROM (
+        SELECT *, row_number() OVER (
+            PARTITION BY species
+            ORDER BY agtcFraction DESC, refseq DESC, length DESC) AS rank
+        FROM records WHERE typeStrain AND species IN ('Genus_a', 'Genus_b'))
+    WHERE rank <= 3;
+'''
+
+import collections
+import contextlib
+import os
+import sqlite3
+
+# Changed whenever the schema changes.
+VERSION = 1
+
+# The columns of the records table, besides `id`, which numbers the records
+# in file order.  `start` and `end` are those given by `scan_fasta_format`.
+IndexedRecord = collections.namedtuple('IndexedRecord', [
+    'genus', 'species', 'strain', 'accession', 'description', 'noSpecies',
+    'typeStrain', 'agtcFraction', 'refseq', 'length', 'start', 'end'])
+
+_schema = '''
+CREATE TABLE meta (key TEXT PRIMARY KEY, value);
+CREATE TABLE records (
+    id INTEGER PRIMARY KEY,
+    genus TEXT NOT NULL,
+    species TEXT NOT NULL,
+    strain TEXT NOT NULL,
+    accession TEXT NOT NULL,
+    description TEXT NOT NULL,
+    noSpecies INTEGER NOT NULL,
+    typeStrain INTEGER NOT NULL,
+    agtcFraction REAL NOT NULL,
+    refseq INTEGER NOT NULL,
+    length INTEGER NOT NULL,
+    start INTEGER NOT NULL,
+    end INTEGER NOT NULL);
+'''
+
+# Created after the records are inserted, which is faster than keeping them
+# up to date.
+_indexes = '''
+CREATE INDEX records_genus ON records (genus);
+CREATE INDEX records_species ON records (species);
+CREATE INDEX records_accession ON records (accession);
+'''
+
+_columns = ', '.join(IndexedRecord._fields)
+
+
+def _source_version(fileStat):
+    return [('size', fileStat.st_size), ('mtime', fileStat.st_mtime_ns)]
+
+
+def write_score_index(path, records, fileStat):
+    '''
+    Writes a new index to `path`, replacing any file there only once it is
+    complete.
+    @param records iterable of IndexedRecords (or tuples in the same order),
+           in file order.
+    @param fileStat `os.stat` result of the indexed file, recorded so that
+           an index of an earlier version of the file is not used.
+    @return the number of records.
+    '''
+    temporaryPath = path + '.tmp'
+    if os.path.exists(temporaryPath):
+        os.remove(temporaryPath)
+    try:
+        with contextlib.closing(sqlite3.connect(temporaryPath)) as connection:
+            # The file is only renamed into place once complete, so it needs
+            # neither a journal nor syncing as it is written.
+            connection.executescript('PRAGMA journal_mode = OFF; PRAGMA synchronous = OFF;')
+            connection.executescript(_schema)
+            with connection:
+                connection.executemany(
+                    'INSERT INTO records (%s) VALUES (%s)' % (
+                        _columns, ', '.join('?' * len(IndexedRecord._fields))),
+                    records)
+                count, = connection.execute('SELECT count(*) FROM records').fetchone()
+                connection.executemany(
+                    'INSERT INTO meta VALUES (?, ?)',
+                    [('version', VERSION), ('count', count)] + _source_version(fileStat))
+            connection.executescript(_indexes)
+        os.replace(temporaryPath, path)
+    except BaseException:
+        if os.path.exists(temporaryPath):
+            os.remove(temporaryPath)
+        raise
+    return count
+
+
+@contextlib.contextmanager
+def open_score_index(path, fileStat):
+    '''
+    @param fileStat `os.stat` result of the indexed file.
+    @yield sqlite3.Connection to the index at `path`.
+    @raises RuntimeError if there is no index at `path`, or if it was made
+            by another version of this module or from another version of the
+            file.
+    '''
+    if not os.path.isfile(path):
+        raise RuntimeError('No index at %r.' % path)
+    with contextlib.closing(sqlite3.connect(path)) as connection:
+        try:
+            meta = dict(connection.execute('SELECT key, value FROM meta'))
+        except sqlite3.DatabaseError as e:
+            raise RuntimeError('Unable to read index %r: %s' % (path, e))
+        if meta.get('version') != VERSION:
+            raise RuntimeError('Index %r was made by another version; rebuild it.' % path)
+        if any(meta.get(key) != value for key, value in _source_version(fileStat)):
+            raise RuntimeError('Index %r is out of date; rebuild it.' % path)
+        yield connection
+
+
+def record_count(connection):
+    '''
+    @return the number of records indexed.
+    '''
+    return connection.execute("SELECT value FROM meta WHERE key = 'count'").fetchone()[0]
+
+
+def query_records(connection, genera=None, species=None, skipNoSpecies=False):
+    '''
+    @param genera if not None, a collection of the genera to select.
+    @param species if not None, a collection of the species to select.
+    @param skipNoSpecies if True, skip records that name no species.
+    @yield IndexedRecord for each record selected, in file order.
+    '''
+    conditions, parameters = [], []
+    for column, values in [('genus', genera), ('species', species)]:
+        if values is not None:
+            values = list(values)
+            conditions.append('%s IN (%s)' % (column, ', '.join('?' * len(values))))
+            parameters.extend(values)
+    if skipNoSpecies:
+        conditions.append('NOT noSpecies')
+    query = 'SELECT %s FROM records' % _columns
+    if conditions:
+        query += ' WHERE ' + ' AND '.join(conditions)
+    query += ' ORDER BY id'
+    for row in connection.execute(query, parameters):
+        yield IndexedRecord._make(row)
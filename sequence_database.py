@@ -0,0 +1,239 @@
+# Copyright 2023 Hal W Canary III, Lindsay R Saunders PhD.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+'''
+A binary container for a sequence database, to be read many times.
+
+Parsing each description and scoring each sequence is done once, when the
+database is written.  The file holds, for every record, the genus, species,
+and strain named by its description, the description itself before and
+after processing, the parts of its score that do not depend on the bases,
+and its sequence packed as a PackedSequence.  It is read through a memory
+map, so a query reads the table of records, and the strings and sequences
+of only the records it selects.
+
+    header
+    for each record: description, processed description, strain, and
+        packed sequence, in that order
+    table of fixed-size entries, one per record, in input order
+    genus and species names, separated by newlines
+'''
+
+import collections
+import mmap
+import os
+import struct
+import sys
+
+from packed_sequence import PackedSequence
+
+MAGIC = b'\x89BSDB\r\n\x1a'
+
+VERSION = 1
+
+# Bits of `DatabaseEntry.flags`.
+TYPE_STRAIN = 1  # The processed description contains " type strain ".
+REFSEQ = 2  # The accession starts with "NR_".
+NO_SPECIES = 4  # The description names no species: "ACCESSION GENUS sp. ...".
+
+_header = struct.Struct('<8sIQQQ')
+_entry = struct.Struct('<QIIIIIQQIQB')
+
+# Number of table entries read at a time.
+_ENTRY_BLOCK = 1 << 14
+
+# One record's entry in the table.  `genus` and `species` index
+# `SequenceDatabase.names`; `offset` locates the record's strings and packed
+# sequence, whose sizes in bytes follow.  `length`, `agtcCount`, and `runs`
+# are those of its PackedSequence.
+DatabaseEntry = collections.namedtuple('DatabaseEntry', [
+    'offset', 'genus', 'species', 'descriptionSize', 'processedSize', 'strainSize',
+    'length', 'agtcCount', 'runs', 'dataSize', 'flags'])
+
+
+def _encode(s):
+    return s.encode('utf-8', 'surrogateescape')
+
+
+def _decode(b):
+    return b.decode('utf-8', 'surrogateescape')
+
+
+def is_sequence_database(f):
+    '''
+    @param f file object open for reading in binary mode.
+    @return True if `f` is a regular file that holds a sequence database.
+            The position of `f` is not changed.
+    '''
+    try:
+        return os.pread(f.fileno(), len(MAGIC), 0) == MAGIC
+    except (AttributeError, OSError):
+        # No file descriptor, or one that is not seekable.
+        return False
+
+
+class SequenceDatabaseWriter(object):
+    '''
+    Writes a sequence database to `f`, a seekable file object open for
+    writing in binary mode.  Call `add` for each record, in order, then
+    `close` (or use a `with` block).  `f` is left open.
+    '''
+    def __init__(self, f):
+        self.f, self.table, self.names, self.count = f, bytearray(), {}, 0
+        self.start = f.tell()
+        f.write(bytes(_header.size))
+        self.offset = _header.size
+
+    def _name(self, name):
+        index = self.names.get(name)
+        if index is None:
+            index = self.names[name] = len(self.names)
+        return index
+
+    def add(self, genus, species, strain, description, processedDescription, flags, packed):
+        '''
+        @param flags TYPE_STRAIN, REFSEQ, and NO_SPECIES, or'ed together.
+        @param packed PackedSequence of bytes.
+        '''
+        strings = [_encode(description), _encode(processedDescription), _encode(strain)]
+        self.table += _entry.pack(
+            self.offset, self._name(genus), self._name(species), *map(len, strings),
+            packed.length, packed.agtcCount, packed.runs, len(packed.data), flags)
+        strings.append(packed.data)
+        for s in strings:
+            self.f.write(s)
+            self.offset += len(s)
+        self.count += 1
+
+    def close(self):
+        if self.table is None:
+            return
+        tableOffset = self.offset
+        self.f.write(self.table)
+        names = _encode('\n'.join(self.names))
+        self.f.write(names)
+        end = self.f.tell()
+        self.f.seek(self.start)
+        self.f.write(_header.pack(MAGIC, VERSION, self.count, tableOffset, len(names)))
+        self.f.seek(end)
+        self.f.flush()
+        self.table = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class SequenceDatabase(object):
+    '''
+    Reads a sequence database written by SequenceDatabaseWriter, through a
+    memory map of `f`.  Use it as a context manager, or call `close`.
+    '''
+    def __init__(self, f):
+        '''
+        @param f file object of a regular file, open for reading in binary
+               mode.
+        @raises ValueError if `f` is not a sequence database of this version.
+        '''
+        self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            magic, version, self.count, self.tableOffset, namesSize = _header.unpack(
+                self.map[:_header.size])
+            if magic != MAGIC:
+                raise ValueError('Not a sequence database')
+            if version != VERSION:
+                raise ValueError('Unsupported sequence database version %d' % version)
+            namesOffset = self.tableOffset + self.count * _entry.size
+            if namesOffset + namesSize > len(self.map):
+                raise ValueError('Truncated sequence database')
+            names = _decode(self.map[namesOffset:namesOffset + namesSize])
+        except Exception:
+            self.map.close()
+            raise
+        # Interned, as `process_sequence_description` interns them.
+        self.names = [sys.intern(name) for name in names.split('\n')] if names else []
+        self.genusIndex = None
+
+    def __len__(self):
+        return self.count
+
+    def entries(self, start=0):
+        '''
+        @yield DatabaseEntry for each record from index `start` on, in order.
+        '''
+        for block in range(start, self.count, _ENTRY_BLOCK):
+            offset = self.tableOffset + block * _entry.size
+            end = self.tableOffset + min(block + _ENTRY_BLOCK, self.count) * _entry.size
+            yield from map(DatabaseEntry._make, _entry.iter_unpack(self.map[offset:end]))
+
+    def index_genera(self):
+        '''
+        Builds `genusIndex`, which maps each genus to the list of indices of
+        its records, so that those of a few genera can be read without
+        reading the whole table.
+        '''
+        genusIndex = collections.defaultdict(list)
+        for index, entry in enumerate(self.entries()):
+            genusIndex[entry.genus].append(index)
+        self.genusIndex = dict(genusIndex)
+
+    def entry(self, index):
+        offset = self.tableOffset + index * _entry.size
+        return DatabaseEntry._make(_entry.unpack(self.map[offset:offset + _entry.size]))
+
+    def strings(self, entry):
+        '''
+        @return (description, processed description, strain) of `entry`.
+        '''
+        offset = entry.offset
+        sizes = entry.descriptionSize, entry.processedSize, entry.strainSize
+        result = []
+        for size in sizes:
+            result.append(_decode(self.map[offset:offset + size]))
+            offset += size
+        return tuple(result)
+
+    def packed(self, entry):
+        '''
+        @return the PackedSequence of `entry`.
+        '''
+        offset = (entry.offset + entry.descriptionSize + entry.processedSize +
+                  entry.strainSize)
+        return PackedSequence.from_data(
+            entry.length, entry.agtcCount, entry.runs,
+            self.map[offset:offset + entry.dataSize])
+
+    def sequence(self, index):
+        '''
+        @return the sequence, as bytes, of the record at `index`.
+        '''
+        return self.packed(self.entry(index)).unpack()
+
+    def close(self):
+        self.map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,51 @@
+#! /usr/bin/env python3
+
+# Copyright 2023 Hal W Canary III, Lindsay R Saunders PhD.
+# Use of this program is governed by contents of the LICENSE file.
+
+import collections
+import logging
+import os
+import shutil
+import tempfile
+import unittest
+
+import benchmark
+import bestSequenceEachSpecies as bioscript
+import ranked_match
+
+
+class BenchmarkTestCase(unittest.TestCase):
+    def test_synthetic_database(self):
+        records = list(benchmark.synthetic_database(200000, seed=20))
+        self.assertEqual(records, list(benchmark.synthetic_database(200000, seed=20)))
+        self.assertNotEqual(records, list(benchmark.synthetic_database(200000, seed=21)))
+        genera = collections.Counter()
+        for description, sequence in records:
+            self.assertTrue(sequence)
+            genera[bioscript.process_sequence_description(description).genus] += 1
+        # Skewed: the most common genus is far more common than average.
+        self.assertGreater(genera.most_common(1)[0][1], 5 * len(records) / len(genera))
+
+    def test_time_stages(self):
+        directory = tempfile.mkdtemp()
+        try:
+            paths = benchmark.StagePaths(os.path.join(directory, 'db.fasta'),
+                                         os.path.join(directory, 'ranking.csv'))
+            benchmark.write_synthetic_database(paths.fasta, 100000, seed=22)
+            benchmark.write_ranking_csv(paths.ranking, 50, 7, seed=22)
+            with open(paths.ranking) as f:
+                data = ranked_match.parseCSVFile(f)
+            self.assertEqual((len(data), len(data[0])), (51, 7))
+            results = benchmark.time_stages(paths, 1, 1)
+            self.assertEqual([r['stage'] for r in results], [n for n, _ in benchmark.STAGES])
+            for result in results:
+                self.assertGreaterEqual(result['seconds'], 0)
+                self.assertGreater(result['bytes'], 0)
+        finally:
+            shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(format='%(levelname)s:  %(message)s', level='WARNING')
+    unittest.main()
@@ -4,7 +4,9 @@
 # Use of this program is governed by contents of the LICENSE file.
 
 import collections
+import contextlib
 import glob
+import gzip
 import io
 import logging
 import os
@@ -13,9 +15,16 @@ import shutil
 import sys
 import tempfile
 import unittest
+import unittest.mock
 
+import benchmark
 import bestSequenceEachSpecies as bioscript
+import compressed_io
 import concat_fasta as concat
+import packed_sequence
+import progress
+import run_stats
+import score_index
 
 
 TestSequence = collections.namedtuple(
@@ -42,6 +51,19 @@ def makeRandomSequence(seed):
     return ''.join(r.choices('ACGTYKRSW', weights=[99, 99, 99, 99, 1, 1, 1, 1, 1], k=n))
 
 
+@contextlib.contextmanager
+def temporary_fasta(data, name='example.fasta'):
+    '''
+    Yields the path of a file named `name` holding `data`, str or bytes, in
+    a temporary directory that is removed afterward.
+    '''
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, name)
+        with open(path, 'wb' if isinstance(data, bytes) else 'w') as o:
+            o.write(data)
+        yield path
+
+
 def fasta_string(sequences):
     b = io.StringIO()
     for (description, sequence) in sequences:
@@ -56,6 +78,39 @@ def run_test_get_best_sequence_each_species(data, genus):
     return buffer.getvalue()
 
 
+def reference_best_sequence_each_species(data, count):
+    '''
+    Selects the best sequences by sorting every record, as
+    `get_best_sequence_each_species` once did.
+    '''
+    speciesMap = collections.defaultdict(lambda: collections.defaultdict(list))
+    for description, sequence in bioscript.parse_fasta_format(io.StringIO(data)):
+        info = bioscript.process_sequence_description(description)
+        speciesMap[info.species][info.strain].append((info.accession, info.description, sequence))
+    result = []
+    for species, strainMap in sorted(speciesMap.items()):
+        values = []
+        for strain, strainValues in sorted(strainMap.items()):
+            values.extend(bioscript.get_best_sequence(strainValues))
+        result.extend(bioscript.get_best_sequence(values, count))
+    return fasta_string([(description, sequence) for _, description, sequence in result])
+
+
+def makeRandomDatabase(seed, size):
+    '''
+    Returns FASTA data with few species, strains and distinct sequences, so
+    that scores are often tied.
+    '''
+    r = random.Random(seed)
+    sequences = [makeRandomSequence(seed * 100 + i) for i in range(4)]
+    return fasta_string(
+        ('%s%d.1 Genus %s strain S%d 16S rRNA%s' % (
+            r.choice(['NR_', 'XX']), i, r.choice(['alpha', 'beta', 'gamma']), r.randrange(6),
+            r.choice(['', ', type strain X'])),
+         r.choice(sequences))
+        for i in range(size))
+
+
 TESTDATA_1 = makeTestSequence(
     'KF787109.1', 'Arthrobacter', 'nicotianae', 'strain BSc 4',
     '16S ribosomal RNA gene, partial sequence', makeRandomSequence(1))
@@ -104,6 +159,24 @@ class NewDatabaseOneSequencePerSpeciesTestCase(unittest.TestCase):
             self.assertEqual(value.accession, t.accession)
             self.assertEqual(value.description, t.translated)
 
+    def test_process_sequence_description_matches_regex(self):
+        r = random.Random(7)
+        pieces = ['strain', 'strain ', '(strain ', ')', ') ', ' 16S', '16S', ' ', '  ', '\t',
+                  'x', 'y z', 'sp.', 'type']
+        descriptions = benchmark.description_corpus(seed=7)
+        for _ in range(5000):
+            descriptions.append(''.join(r.choice(pieces) for _ in range(r.randrange(3, 16))))
+            descriptions.append('A B C ' + descriptions[-1])
+        for description in descriptions:
+            try:
+                expected = benchmark.legacy_process_sequence_description(description)
+            except ValueError:
+                with self.assertRaises(ValueError):
+                    bioscript.process_sequence_description(description)
+                continue
+            self.assertEqual(bioscript.process_sequence_description(description), expected,
+                             description)
+
     def test_get_best_sequence_each_species_1(self):
         example = ''.join(t.fasta for t in [
                           TESTDATA_1, TESTDATA_2, TESTDATA_3])
@@ -117,6 +190,46 @@ class NewDatabaseOneSequencePerSpeciesTestCase(unittest.TestCase):
             run_test_get_best_sequence_each_species(example, TESTDATA_3.genus),
             fasta_string([(TESTDATA_3.translated, TESTDATA_3.sequence)]))
 
+    def test_get_best_sequence_each_species_binary(self):
+        example = ''.join(t.fasta for t in [TESTDATA_1, TESTDATA_2, TESTDATA_3])
+        buffer = io.BytesIO()
+        bioscript.get_best_sequence_each_species(
+            io.BytesIO(example.encode()), buffer, None, logging.getLogger())
+        self.assertEqual(buffer.getvalue().decode(),
+                         run_test_get_best_sequence_each_species(example, None))
+
+    def test_get_best_sequence_each_species_matches_sort(self):
+        for seed in range(8):
+            data = makeRandomDatabase(seed, 60)
+            for count in [0, 1, 2, 3, 7]:
+                buffer = io.StringIO()
+                bioscript.get_best_sequence_each_species(
+                    io.StringIO(data), buffer, None, logging.getLogger(), count)
+                self.assertEqual(buffer.getvalue(),
+                                 reference_best_sequence_each_species(data, count))
+
+    def test_best_strains(self):
+        best = bioscript.BestStrains(2)
+        for strain, score in [('a', 1), ('b', 5), ('c', 3), ('a', 4), ('c', 9), ('b', 2)]:
+            best.add(strain, bioscript.Candidate(score, strain, None))
+        self.assertEqual([c.score for c in best.best()], [5, 9])
+        self.assertEqual(len(best.strains), 2)
+        self.assertEqual(best.recordCount, 6)
+
+    def test_pack_score(self):
+        r = random.Random(11)
+        scores = [(r.randrange(2), r.choice([0.0, 1.0, r.random()]), r.randrange(2),
+                   r.randrange(1, 1 << 40)) for _ in range(2000)]
+        scores += [(0, 0.5, 0, 3), (0, 0.5, 1, 3), (1, 0.0, 0, 1), (0, 1.0, 1, 1 << 50)]
+        self.assertEqual(sorted(scores, key=bioscript.pack_score), sorted(scores))
+
+    def test_candidate(self):
+        candidate = bioscript.Candidate(0, 'Genus_epithet_strain_1 extra NR_1.1', None)
+        self.assertEqual(candidate.accession, 'NR_1.1')
+        info1 = bioscript.process_sequence_description(''.join(['XX1.1 Genus', ' epithet']))
+        info2 = bioscript.process_sequence_description(''.join(['XX2.1 Genus', ' epithet']))
+        self.assertIs(info1.species, info2.species)
+
     def test_get_best_sequence_each_species_2(self):
         example = ''.join(t.fasta for t in [
                           TESTDATA_1, TESTDATA_2, TESTDATA_3])
@@ -149,10 +262,439 @@ class NewDatabaseOneSequencePerSpeciesTestCase(unittest.TestCase):
         for t, s in v:
             self.assertEqual(s, bioscript.get_score(
                 t.accession, t.description, t.sequence))
+            self.assertEqual(s, bioscript.get_score(
+                t.accession, t.description, t.sequence.encode()))
+            self.assertEqual(s, bioscript.get_score(
+                t.accession, t.description, memoryview(t.sequence.encode())))
         self.assertTrue(v[1][1] > v[0][1])
         self.assertTrue(v[2][1] > v[0][1])
         self.assertTrue(v[2][1] > v[1][1])
 
+    def test_get_best_sequence_each_species_two_pass(self):
+        example = ''.join(t.fasta for t in [TESTDATA_1, TESTDATA_2, TESTDATA_3])
+        with temporary_fasta(example) as path:
+            for _ in range(2):
+                buffer = io.BytesIO()
+                with open(path, 'rb') as f:
+                    bioscript.get_best_sequence_each_species_two_pass(
+                        f, buffer, None, logging.getLogger())
+                self.assertEqual(buffer.getvalue().decode(),
+                                 run_test_get_best_sequence_each_species(example, None))
+                self.assertTrue(os.path.exists(path + '.fai'))
+
+    def test_get_best_sequence_each_species_two_pass_blanks(self):
+        example = ''.join(t.fasta for t in [TESTDATA_1, TESTDATA_2, TESTDATA_3])
+        # Pad every sequence line, keeping the lines of equal length.
+        padded = '\n'.join(line if line.startswith('>') or not line else ' %s\t' % line
+                           for line in example.split('\n'))
+        with temporary_fasta(padded, 'padded.fasta') as path:
+            buffer = io.BytesIO()
+            with open(path, 'rb') as f:
+                bioscript.get_best_sequence_each_species_two_pass(
+                    f, buffer, None, logging.getLogger())
+            self.assertEqual(buffer.getvalue().decode(),
+                             run_test_get_best_sequence_each_species(example, None))
+
+    def test_get_best_sequence_each_species_two_pass_ragged(self):
+        example = ''.join(t.fasta for t in [TESTDATA_1, TESTDATA_2, TESTDATA_3])
+        # A record whose sequence lines differ in length can not be indexed.
+        ragged = example.replace('\n', '\nAC\n', 2).replace('\nAC\n', '\n', 1)
+        with temporary_fasta(ragged, 'ragged.fasta') as path:
+            buffer = io.BytesIO()
+            with open(path, 'rb') as f, self.assertLogs(level='WARNING'):
+                bioscript.get_best_sequence_each_species_two_pass(
+                    f, buffer, None, logging.getLogger())
+            self.assertEqual(buffer.getvalue().decode(),
+                             run_test_get_best_sequence_each_species(ragged, None))
+            self.assertEqual(os.listdir(os.path.dirname(path)), ['ragged.fasta'])
+
+    def test_get_best_sequence_each_species_two_pass_bad_description(self):
+        with temporary_fasta('>XX1.1 Unparsable\nACGT\n', 'bad.fasta') as path:
+            with open(path, 'rb') as f, self.assertRaisesRegex(ValueError, 'Unable to parse'):
+                bioscript.get_best_sequence_each_species_two_pass(
+                    f, io.BytesIO(), None, logging.getLogger())
+
+    def test_count_agtc(self):
+        for sequence in ['', 'ACGTN', 'AC\u00c7GT', makeRandomSequence(5)]:
+            expected = sum(1 for c in sequence if c in 'AGTC')
+            self.assertEqual(bioscript.count_agtc(sequence), expected)
+            self.assertEqual(bioscript.count_agtc(sequence.encode()), expected)
+            self.assertEqual(bioscript.count_agtc(packed_sequence.PackedSequence(sequence)),
+                             expected)
+
+    def test_get_scores(self):
+        values = [(t.accession, t.description, t.sequence)
+                  for t in [TESTDATA_1, TESTDATA_2, TESTDATA_3]]
+        expected = [bioscript.get_score(*v) for v in values]
+        binary = [(a, d, s.encode()) for a, d, s in values]
+        self.assertEqual(bioscript.get_scores(values), expected)
+        self.assertEqual(bioscript.get_scores(binary), expected)
+        self.assertEqual(bioscript.get_scores([]), [])
+        numpy, bioscript.numpy = bioscript.numpy, None
+        try:
+            self.assertEqual(bioscript.get_scores(binary), expected)
+        finally:
+            bioscript.numpy = numpy
+
+    def test_get_best_sequence_each_species_parallel(self):
+        data = makeRandomDatabase(9, 200)
+        with temporary_fasta(data) as path:
+            for count in [1, 3]:
+                buffer = io.BytesIO()
+                with open(path, 'rb') as f:
+                    bioscript.get_best_sequence_each_species_parallel(
+                        f, buffer, None, logging.getLogger(), count, jobs=3)
+                self.assertEqual(buffer.getvalue().decode(),
+                                 reference_best_sequence_each_species(data, count))
+            # A regular file without a path, such as STDIN redirected from one.
+            with open(path, 'rb') as f, open(f.fileno(), 'rb', closefd=False) as g:
+                self.assertEqual(g.name, f.fileno())
+                with self.assertRaisesRegex(RuntimeError, 'give the path'):
+                    bioscript.get_best_sequence_each_species_parallel(
+                        g, io.BytesIO(), None, logging.getLogger(), jobs=2)
+
+    def test_get_best_sequence_each_species_scan(self):
+        data = makeRandomDatabase(13, 200).replace('Genus', 'Other', 20)
+        with temporary_fasta(data) as path:
+            for genus in [None, 'Genus', 'Other']:
+                expected, buffer = io.BytesIO(), io.BytesIO()
+                bioscript.get_best_sequence_each_species(
+                    io.BytesIO(data.encode()), expected, genus, logging.getLogger(), 2)
+                with open(path, 'rb') as f:
+                    bioscript.get_best_sequence_each_species(
+                        f, buffer, genus, logging.getLogger(), 2)
+                self.assertEqual(buffer.getvalue(), expected.getvalue())
+
+    def test_get_best_sequence_each_species_compressed(self):
+        # The file of a decompressor has a `fileno`, but must not be mapped.
+        data = makeRandomDatabase(20, 200)
+        with tempfile.TemporaryDirectory() as directory:
+            expected = io.BytesIO()
+            bioscript.get_best_sequence_each_species(
+                io.BytesIO(data.encode()), expected, 'Genus', logging.getLogger(), 2)
+            for name in ['example.fasta.gz', 'example.fasta.bgz']:
+                path = os.path.join(directory, name)
+                with open(path, 'wb') as f, compressed_io.compressed_output(f) as o:
+                    o.write(data.encode())
+                with open(path, 'rb') as f, compressed_io.open_input(f) as g:
+                    self.assertFalse(bioscript._is_mappable(g))
+                    buffer = io.BytesIO()
+                    bioscript.get_best_sequence_each_species(
+                        g, buffer, 'Genus', logging.getLogger(), 2)
+                self.assertEqual(buffer.getvalue(), expected.getvalue())
+
+    def test_get_best_sequence_each_species_cached(self):
+        data = benchmark.make_fasta_database(100000, seed=14).encode()
+        chunkSize = bioscript.CACHE_CHUNK_SIZE
+        try:
+            bioscript.CACHE_CHUNK_SIZE = 10000
+            with tempfile.TemporaryDirectory() as directory:
+                cache = bioscript.ResultCache(os.path.join(directory, 'cache'))
+                for content in [data, data + data[:5000] + b'\n']:
+                    expected = io.BytesIO()
+                    bioscript.get_best_sequence_each_species(
+                        io.BytesIO(content), expected, 'Genus1', logging.getLogger(), 2)
+                    for name, compress in [('example.fasta', bytes),
+                                           ('example.fasta.gz', gzip.compress)]:
+                        path = os.path.join(directory, name)
+                        with open(path, 'wb') as o:
+                            o.write(compress(content))
+                        for _ in range(2):
+                            buffer = io.BytesIO()
+                            with open(path, 'rb') as f:
+                                bioscript.get_best_sequence_each_species_cached(
+                                    f, buffer, 'Genus1', logging.getLogger(), 2, cache=cache)
+                            self.assertEqual(buffer.getvalue(), expected.getvalue())
+        finally:
+            bioscript.CACHE_CHUNK_SIZE = chunkSize
+
+    def test_get_best_sequence_each_species_cached_corrupt(self):
+        data = benchmark.make_fasta_database(100000, seed=15).encode()
+        expected = io.BytesIO()
+        bioscript.get_best_sequence_each_species(
+            io.BytesIO(data), expected, 'Genus1', logging.getLogger(), 2)
+        chunkSize = bioscript.CACHE_CHUNK_SIZE
+        try:
+            bioscript.CACHE_CHUNK_SIZE = 10000
+            with tempfile.TemporaryDirectory() as directory:
+                cache = bioscript.ResultCache(os.path.join(directory, 'cache'))
+                path = os.path.join(directory, 'example.fasta')
+                with open(path, 'wb') as o:
+                    o.write(data)
+                with open(path, 'rb') as f:
+                    bioscript.get_best_sequence_each_species_cached(
+                        f, io.BytesIO(), 'Genus1', logging.getLogger(), 2, cache=cache)
+                # Truncate every chunk entry, and drop the whole result, so that
+                # the chunks are read back from the cache.
+                for entry in os.scandir(cache.directory):
+                    with open(entry.path, 'r+b') as o:
+                        if bioscript._decode_selection(o.read(), 2) is None:
+                            os.remove(entry.path)
+                        else:
+                            o.truncate(entry.stat().st_size // 2)
+                buffer = io.BytesIO()
+                with open(path, 'rb') as f:
+                    bioscript.get_best_sequence_each_species_cached(
+                        f, buffer, 'Genus1', logging.getLogger(), 2, cache=cache)
+                self.assertEqual(buffer.getvalue(), expected.getvalue())
+        finally:
+            bioscript.CACHE_CHUNK_SIZE = chunkSize
+
+    def test_encode_selection(self):
+        data = makeRandomDatabase(16, 100)
+        records = [(d, s.encode(), s.encode())
+                   for d, s in bioscript.parse_fasta_format(io.StringIO(data))]
+        selection = bioscript.select_best_each_species(records, None, logging.getLogger(), 2)
+        encoded = bioscript._encode_selection(selection)
+        self.assertNotIn(b'BestStrains', encoded)
+        sourceCount, matchCount, speciesMap = bioscript._decode_selection(encoded, 2)
+        self.assertEqual((sourceCount, matchCount), selection[:2])
+        self.assertEqual(
+            {s: (b.count, b.recordCount, [(c.score, c.description, c.payload) for c in b.best()])
+             for s, b in speciesMap.items()},
+            {s: (b.count, b.recordCount, [(c.score, c.description, c.payload) for c in b.best()])
+             for s, b in selection[2].items()})
+        for size in [0, 5, len(encoded) // 2, len(encoded) - 1]:
+            self.assertIsNone(bioscript._decode_selection(encoded[:size] or b'x', 2))
+        self.assertIsNone(bioscript._decode_selection(encoded + encoded[:9], 2))
+
+    def test_get_best_sequence_each_species_max_memory(self):
+        data = makeRandomDatabase(15, 300)
+        for count in [0, 1, 3]:
+            expected = reference_best_sequence_each_species(data, count)
+            for maxMemory in [1, 3000, 1 << 30]:
+                buffer = io.BytesIO()
+                bioscript.get_best_sequence_each_species(
+                    io.BytesIO(data.encode()), buffer, None, logging.getLogger(), count,
+                    maxMemory=maxMemory)
+                self.assertEqual(buffer.getvalue().decode(), expected)
+
+    def test_select_best_each_species_packed(self):
+        data = makeRandomDatabase(16, 100)
+        records = [(d, s, s) for d, s in bioscript.parse_fasta_format(io.StringIO(data))]
+        _, _, expected = bioscript.select_best_each_species(records, None, logging.getLogger(), 2)
+        _, _, packed = bioscript.select_best_each_species(
+            records, None, logging.getLogger(), 2, pack=packed_sequence.PackedSequence)
+        self.assertEqual(packed.keys(), expected.keys())
+        for species, bestStrains in packed.items():
+            for candidate in bestStrains.best():
+                self.assertIsInstance(candidate.payload, packed_sequence.PackedSequence)
+            self.assertEqual([(c.description, c.payload.unpack()) for c in bestStrains.best()],
+                             [(c.description, c.payload) for c in expected[species].best()])
+
+    def test_species_runs(self):
+        with bioscript.SpeciesRuns(1) as runs:
+            genusMap = {}
+            records = [('b', 'x'), ('a', 'x'), ('b', 'x'), ('b', 'y')]
+            for i, (species, strain) in enumerate(records):
+                bestStrains = genusMap.setdefault(None, {}).setdefault(
+                    species, bioscript.BestStrains(0))
+                candidate = bioscript.Candidate(0, 'record %d' % i, None)
+                bestStrains.add(strain, candidate)
+                self.assertTrue(runs.account(candidate))
+                runs.spill(genusMap)
+                self.assertEqual(genusMap, {})
+            self.assertEqual(len(runs.runs), 4)
+            merged = [(species, [c.description for c in b.best()], b.recordCount)
+                      for _, species, b in runs.merge({})]
+            self.assertEqual(merged, [('a', ['record 1'], 1),
+                                      ('b', ['record 2', 'record 3'], 3)])
+
+    def test_get_best_sequence_each_species_pipeline(self):
+        data = makeRandomDatabase(10, 200)
+        for count in [1, 3]:
+            buffer = io.BytesIO()
+            bioscript.get_best_sequence_each_species(
+                io.BytesIO(data.encode()), buffer, None, logging.getLogger(), count,
+                pipeline=True)
+            self.assertEqual(buffer.getvalue().decode(),
+                             reference_best_sequence_each_species(data, count))
+        # A regular file is memory-mapped, not read ahead.
+        with temporary_fasta(data) as path:
+            buffer = io.BytesIO()
+            with open(path, 'rb') as f, \
+                    unittest.mock.patch.object(bioscript, 'ReadAheadReader') as reader:
+                bioscript.get_best_sequence_each_species(
+                    f, buffer, None, logging.getLogger(), 1, pipeline=True)
+            reader.assert_not_called()
+            self.assertEqual(buffer.getvalue().decode(),
+                             reference_best_sequence_each_species(data, 1))
+
+    def test_get_best_sequence_each_species_stats(self):
+        data = makeRandomDatabase(16, 200)
+        expected = io.BytesIO()
+        bioscript.get_best_sequence_each_species(
+            io.BytesIO(data.encode()), expected, None, logging.getLogger(), 2)
+        for pipeline in [False, True]:
+            stats, buffer = run_stats.RunStats(), io.BytesIO()
+            bioscript.get_best_sequence_each_species(
+                io.BytesIO(data.encode()), buffer, None, logging.getLogger(), 2,
+                pipeline=pipeline, stats=stats)
+            stats.finish()
+            self.assertEqual(buffer.getvalue(), expected.getvalue())
+            self.assertEqual(stats.records, 200)
+            self.assertEqual(stats.bytes, len(data))
+            self.assertEqual(list(stats.stageTimes),
+                             ['parse', 'describe', 'score', 'select', 'sort', 'write'])
+            self.assertEqual(len(stats.slowestDescriptions), stats.slowest)
+
+    def test_get_best_sequence_each_species_progress(self):
+        data = makeRandomDatabase(17, 300)
+        with temporary_fasta(data) as path:
+            compressed = path + '.gz'
+            with open(compressed, 'wb') as o:
+                o.write(gzip.compress(data.encode()))
+            expected = io.BytesIO()
+            bioscript.get_best_sequence_each_species(
+                io.BytesIO(data.encode()), expected, None, logging.getLogger(), 2)
+            for name, pipeline in [(path, False), (compressed, False), (compressed, True)]:
+                buffer, stream = io.BytesIO(), io.StringIO()
+                with open(name, 'rb') as f:
+                    reporter = progress.ProgressReporter(f, logging.getLogger(), stream)
+                    bioscript.get_best_sequence_each_species(
+                        compressed_io.open_input(f), buffer, None, logging.getLogger(), 2,
+                        pipeline=pipeline, progress=reporter)
+                self.assertEqual(buffer.getvalue(), expected.getvalue())
+                self.assertEqual(reporter.records, 300)
+                self.assertTrue(stream.getvalue().split('\r')[-1].startswith(
+                    '100.0%, 300 records, '))
+
+    def test_get_best_sequence_each_species_database(self):
+        data = makeRandomDatabase(17, 300) + fasta_string([
+            ('XX9.1 Genus sp. strain S1 16S rRNA', 'ACGTN'), ('XX8.1 Other beta', 'ACGT')])
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'database')
+            with open(path, 'wb') as o:
+                bioscript.make_sequence_database(
+                    io.BytesIO(data.encode()), o, logging.getLogger())
+            with open(path, 'rb') as f:
+                self.assertTrue(bioscript.is_sequence_database(f))
+                for genus, count, skipNoSpecies, options in [
+                        (None, 1, False, {}), ('Genus', 3, True, {}), (None, 0, False, {}),
+                        ('Other', 1, False, {'pipeline': True}),
+                        (None, 2, True, {'maxMemory': 3000})]:
+                    expected, buffer = io.BytesIO(), io.BytesIO()
+                    bioscript.get_best_sequence_each_species(
+                        io.BytesIO(data.encode()), expected, genus, logging.getLogger(), count,
+                        skipNoSpecies)
+                    bioscript.get_best_sequence_each_species(
+                        f, buffer, genus, logging.getLogger(), count, skipNoSpecies, **options)
+                    self.assertEqual(buffer.getvalue(), expected.getvalue())
+                template = os.path.join(directory, '{genus}.fasta')
+                paths = bioscript.get_best_sequence_each_genus(
+                    f, template, ['Other', 'Genus'], logging.getLogger())
+                for genus, path in zip(['Other', 'Genus'], paths):
+                    expected = io.BytesIO()
+                    bioscript.get_best_sequence_each_species(
+                        io.BytesIO(data.encode()), expected, genus, logging.getLogger())
+                    with open(path, 'rb') as o:
+                        self.assertEqual(o.read(), expected.getvalue())
+            self.assertFalse(bioscript.is_sequence_database(io.BytesIO(data.encode())))
+
+    def test_get_best_sequence_each_species_index(self):
+        data = makeRandomDatabase(19, 300) + fasta_string([
+            ('XX9.1 Genus sp. strain S1 16S rRNA', 'ACGTN'), ('XX8.1 Other beta', 'ACGT')])
+        with temporary_fasta(data, 'data.fasta') as path:
+            index = os.path.join(os.path.dirname(path), 'index')
+            with open(path, 'rb') as f:
+                bioscript.make_score_index(f, index, logging.getLogger())
+                for genus, count, skipNoSpecies, options in [
+                        (None, 1, False, {}), ('Genus', 3, True, {}), (None, 0, False, {}),
+                        ('Other', 1, False, {'pipeline': True}),
+                        (None, 2, True, {'maxMemory': 3000})]:
+                    expected, buffer = io.BytesIO(), io.BytesIO()
+                    bioscript.get_best_sequence_each_species(
+                        io.BytesIO(data.encode()), expected, genus, logging.getLogger(), count,
+                        skipNoSpecies)
+                    bioscript.get_best_sequence_each_species(
+                        f, buffer, genus, logging.getLogger(), count, skipNoSpecies,
+                        index=index, **options)
+                    self.assertEqual(buffer.getvalue(), expected.getvalue())
+                with score_index.open_score_index(index, os.fstat(f.fileno())) as connection:
+                    sourceCount, genusMap = bioscript.select_best_each_genus_from_index(
+                        connection, None, logging.getLogger(), 2, species=['Genus_beta'])
+                self.assertEqual(sourceCount, 302)
+                self.assertEqual(list(genusMap[None]), ['Genus_beta'])
+                self.assertEqual(len(genusMap[None]['Genus_beta'].best()), 2)
+            with open(path, 'ab') as o:
+                o.write(b'>XX7.1 Genus alpha\nACGT\n')
+            with open(path, 'rb') as f, self.assertRaises(RuntimeError):
+                bioscript.get_best_sequence_each_species(
+                    f, io.BytesIO(), None, logging.getLogger(), index=index)
+
+    def test_get_best_sequence_each_genus(self):
+        data = benchmark.make_fasta_database(200000, seed=12).encode()
+        genera = bioscript.read_genus_list(io.StringIO('Genus1 Genus3\n# Genus4\nMissing\n'))
+        self.assertEqual(genera, ['Genus1', 'Genus3', 'Missing'])
+        with tempfile.TemporaryDirectory() as directory:
+            for template in ['{genus}.fasta', '{genus}.fasta.gz']:
+                template = os.path.join(directory, template)
+                paths = bioscript.get_best_sequence_each_genus(
+                    io.BytesIO(data), template, genera, logging.getLogger(), 2)
+                self.assertEqual(paths, [template.format(genus=g) for g in genera[:2]])
+                for genus, path in zip(genera, paths):
+                    expected = io.BytesIO()
+                    bioscript.get_best_sequence_each_species(
+                        io.BytesIO(data), expected, genus, logging.getLogger(), 2)
+                    with open(path, 'rb') as f:
+                        self.assertEqual(compressed_io.open_input(f).read(),
+                                         expected.getvalue())
+            with self.assertRaises(RuntimeError):
+                bioscript.get_best_sequence_each_genus(
+                    io.BytesIO(data), template, ['Missing'], logging.getLogger())
+
+    def test_get_best_sequence_each_genus_shards(self):
+        data = benchmark.make_fasta_database(200000, seed=16).encode()
+        # Shards must not change between versions or machines.
+        self.assertEqual(bioscript.shard_of('Arthrobacter_nicotianae', 16), 10)
+        with tempfile.TemporaryDirectory() as directory:
+            for genera in [None, ['Genus2', 'Genus7']]:
+                template = os.path.join(directory, '{genus}_{shard:02d}.fasta')
+                paths = bioscript.get_best_sequence_each_genus(
+                    io.BytesIO(data), template, genera, logging.getLogger(), 2, shards=4)
+                self.assertEqual(paths, [template.format(genus=g, shard=i)
+                                         for g in genera or [None] for i in range(4)])
+                for n, genus in enumerate(genera or [None]):
+                    expected = io.StringIO()
+                    bioscript.get_best_sequence_each_species(
+                        io.StringIO(data.decode()), expected, genus, logging.getLogger(), 2)
+                    expected = list(bioscript.parse_fasta_format(
+                        io.StringIO(expected.getvalue())))
+                    records = []
+                    for shard, path in enumerate(paths[n * 4:n * 4 + 4]):
+                        with open(path) as f:
+                            shardRecords = list(bioscript.parse_fasta_format(f))
+                        # Each description begins with "Genus_epithet_".
+                        self.assertEqual(shardRecords, [
+                            r for r in expected
+                            if bioscript.shard_of('_'.join(r[0].split('_')[:2]), 4) == shard])
+                        records.extend(shardRecords)
+                    self.assertEqual(sorted(records), sorted(expected))
+
+    def test_parse_args_shards(self):
+        self.assertEqual(bioscript.parse_args(['--shards', '3']).shards, 3)
+        for shards in ['0', '-2']:
+            with self.assertRaises(SystemExit), \
+                    unittest.mock.patch('sys.stderr', io.StringIO()) as stderr:
+                bioscript.parse_args(['--shards', shards])
+            self.assertIn('--shards must be at least 1', stderr.getvalue())
+
+    def test_best_strains_merge(self):
+        values = [('a', 1), ('b', 5), ('c', 3), ('a', 4), ('c', 9), ('b', 2), ('d', 9), ('a', 4)]
+        serial = bioscript.BestStrains(2)
+        for strain, score in values:
+            serial.add(strain, bioscript.Candidate(score, strain, None))
+        for split in range(len(values)):
+            first, second = bioscript.BestStrains(2), bioscript.BestStrains(2)
+            for strain, score in values[:split]:
+                first.add(strain, bioscript.Candidate(score, strain, split))
+            for strain, score in values[split:]:
+                second.add(strain, bioscript.Candidate(score, strain, split))
+            first.merge(second)
+            self.assertEqual([(c.score, c.description) for c in first.best()],
+                             [(c.score, c.description) for c in serial.best()])
+            self.assertEqual(first.recordCount, len(values))
+
 
 class ConcatTestCase(unittest.TestCase):
     @classmethod
@@ -172,6 +714,92 @@ class ConcatTestCase(unittest.TestCase):
         concat.concat(files, buffer, logging.getLogger())
         self.assertEqual(3344, len(buffer.getvalue()))
 
+    def test_concat_binary(self):
+        files = glob.glob(os.path.join(self.directory, '*'))
+        text, binary = io.StringIO(), io.BytesIO()
+        concat.concat(files, text, logging.getLogger())
+        concat.concat(files, binary, logging.getLogger())
+        self.assertEqual(text.getvalue().encode(), binary.getvalue())
+
+    def test_concat_jobs(self):
+        files = sorted(glob.glob(os.path.join(self.directory, '*'))) * 5
+        for output in [io.StringIO, io.BytesIO]:
+            expected = output()
+            concat.concat(files, expected, logging.getLogger())
+            for jobs in [2, 4]:
+                buffer = output()
+                concat.concat(files, buffer, logging.getLogger(), jobs)
+                self.assertEqual(expected.getvalue(), buffer.getvalue())
+        with self.assertRaises(FileNotFoundError):
+            concat.concat(files + ['does-not-exist'], io.BytesIO(), logging.getLogger(), 2)
+
+    def test_concat_pipeline(self):
+        files = sorted(glob.glob(os.path.join(self.directory, '*'))) * 5
+        with tempfile.TemporaryDirectory() as directory:
+            # Compressed files are parsed rather than copied.
+            compressed = os.path.join(directory, 'data.fasta.gz')
+            with open(files[0], 'rb') as f, open(compressed, 'wb') as o:
+                o.write(gzip.compress(f.read()))
+            expected, buffer = io.BytesIO(), io.BytesIO()
+            concat.concat(files + [compressed], expected, logging.getLogger())
+            concat.concat(files + [compressed], buffer, logging.getLogger(), pipeline=True)
+            self.assertEqual(expected.getvalue(), buffer.getvalue())
+
+    def test_concat_stats(self):
+        files = sorted(glob.glob(os.path.join(self.directory, '*')))
+        for output, stages in [(io.StringIO, ['parse', 'write']),
+                               (io.BytesIO, ['copy'])]:
+            stats = run_stats.RunStats()
+            concat.concat(files, output(), logging.getLogger(), stats=stats)
+            self.assertEqual(stats.records, 3)
+            self.assertEqual(stats.bytes, sum(os.path.getsize(f) for f in files))
+            self.assertEqual(list(stats.stageTimes), stages)
+
+    def test_concat_passthrough(self):
+        data = benchmark.make_fasta_database(20000, seed=8)
+        records = list(bioscript.parse_fasta_format(io.StringIO(data)))
+        sixty = ''.join('>%s\n%s\n' % (d, bioscript.split_str(s, 60)) for d, s in records)
+        variants = {
+            'wrapped.fa': 'junk\n' + data + '>empty\n\n>\nACGT\n',
+            'sixty.fa': sixty,
+            'crlf.fa': sixty.replace('\n', '\r\n'),
+            'short.fa': '>a\nACGT\n>b\nAC\n',
+            'padded.fa': '>a\n ACGT\n ACGT\n',
+            'ragged.fa': '>a\nACGT\nAC\nACGT\n',
+            'empty.fa': '',
+        }
+        expectedCounts = {'padded.fa': None, 'ragged.fa': None, 'empty.fa': 0}
+        with tempfile.TemporaryDirectory() as directory:
+            files = []
+            for name, content in variants.items():
+                files.append(os.path.join(directory, name))
+                with open(files[-1], 'w', newline='') as o:
+                    o.write(content)
+                with open(files[-1], 'rb') as f, \
+                        bioscript.FastaWriter(io.BytesIO()) as writer:
+                    count = concat.concat_passthrough(f, '', writer, logging.getLogger())
+                if name in expectedCounts:
+                    self.assertEqual(count, expectedCounts[name])
+                else:
+                    self.assertGreater(count, 0)
+            text, binary = io.StringIO(), io.BytesIO()
+            concat.concat(files, text, logging.getLogger())
+            concat.concat(files, binary, logging.getLogger())
+            self.assertEqual(text.getvalue().encode(), binary.getvalue())
+
+    def test_concat_compressed(self):
+        files = sorted(glob.glob(os.path.join(self.directory, '*')))
+        with tempfile.TemporaryDirectory() as directory:
+            compressedFiles = []
+            for filename in files:
+                compressedFiles.append(os.path.join(directory, os.path.basename(filename)))
+                with open(filename, 'rb') as f, open(compressedFiles[-1], 'wb') as o:
+                    o.write(gzip.compress(f.read()))
+            expected, buffer = io.StringIO(), io.StringIO()
+            concat.concat(files, expected, logging.getLogger())
+            concat.concat(compressedFiles, buffer, logging.getLogger())
+            self.assertEqual(expected.getvalue(), buffer.getvalue())
+
 
 if __name__ == '__main__':
     logging.basicConfig(format='%(levelname)s:  %(message)s', level='WARNING')
@@ -0,0 +1,75 @@
+#! /usr/bin/env python3
+
+# Copyright 2023 Hal W Canary III, Lindsay R Saunders PhD.
+# Use of this program is governed by contents of the LICENSE file.
+
+import gzip
+import io
+import logging
+import unittest
+
+import benchmark
+import compressed_io
+import fasta_format
+
+
+class NamedBytesIO(io.BytesIO):
+    def __init__(self, name):
+        super().__init__()
+        self.name = name
+
+
+def compress(name, data):
+    f = NamedBytesIO(name)
+    with compressed_io.compressed_output(f) as o:
+        o.write(data)
+    return f.getvalue()
+
+
+class CompressedIOTestCase(unittest.TestCase):
+    data = benchmark.make_fasta_database(300000, seed=5).encode()
+
+    def test_detect_compression(self):
+        self.assertEqual(compressed_io.detect_compression(self.data[:16]), None)
+        self.assertEqual(compressed_io.detect_compression(gzip.compress(self.data)), 'gzip')
+        self.assertEqual(
+            compressed_io.detect_compression(compress('x.bgz', self.data)), 'bgzf')
+        self.assertEqual(compressed_io.detect_compression(b'\x28\xb5\x2f\xfd'), 'zstd')
+
+    def test_uncompressed(self):
+        f = NamedBytesIO('x.fasta')
+        self.assertIs(compressed_io.open_output(f), f)
+        self.assertIs(compressed_io.open_input(f), f)
+
+    def test_gzip(self):
+        compressed = compress('x.fa.gz', self.data)
+        self.assertEqual(gzip.decompress(compressed), self.data)
+        self.assertEqual(compressed_io.open_input(io.BytesIO(compressed)).read(), self.data)
+
+    def test_bgzf(self):
+        compressed = compress('x.fa.bgz', self.data)
+        self.assertTrue(compressed.endswith(compressed_io.BGZF_EOF))
+        self.assertEqual(gzip.decompress(compressed), self.data)
+        for threads in [1, 3]:
+            f = compressed_io.open_input(io.BytesIO(compressed), threads)
+            self.assertEqual(
+                list(fasta_format.parse_fasta_format(f, 1000)),
+                list(fasta_format.parse_fasta_format(io.BytesIO(self.data))))
+            f.close()
+
+    def test_bgzf_corrupt(self):
+        compressed = bytearray(compress('x.fa.bgz', self.data))
+        compressed[100] ^= 0xff
+        with self.assertRaises(Exception):
+            compressed_io.open_input(io.BytesIO(compressed)).read()
+
+    @unittest.skipIf(compressed_io.zstandard is None, 'zstandard is not installed')
+    def test_zstd(self):
+        compressed = compress('x.fa.zst', self.data)
+        self.assertEqual(compressed_io.detect_compression(compressed), 'zstd')
+        self.assertEqual(compressed_io.open_input(io.BytesIO(compressed)).read(), self.data)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(format='%(levelname)s:  %(message)s', level='WARNING')
+    unittest.main()
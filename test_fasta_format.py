@@ -0,0 +1,150 @@
+#! /usr/bin/env python3
+
+# Copyright 2023 Hal W Canary III, Lindsay R Saunders PhD.
+# Use of this program is governed by contents of the LICENSE file.
+
+import io
+import logging
+import unittest
+
+import benchmark
+import fasta_format
+
+
+TEST_FASTA = '''ignored line
+>first record
+ACGT
+ACG
+
+>empty record
+>second record
+  TTTT
+GG'''
+
+
+class FastaFormatTestCase(unittest.TestCase):
+    def test_read_lines(self):
+        data = 'a\nbb\n\nccc\ndddd'
+        for blocksize in [1, 2, 3, 5, 100]:
+            self.assertEqual(
+                list(fasta_format.read_lines(io.StringIO(data), blocksize)),
+                ['a', 'bb', '', 'ccc', 'dddd'])
+
+    def test_parse_fasta_format(self):
+        for blocksize in [1, 7, 1 << 20]:
+            self.assertEqual(
+                list(fasta_format.parse_fasta_format(io.StringIO(TEST_FASTA), blocksize)),
+                [('first record', 'ACGTACG'), ('second record', 'TTTTGG')])
+
+    def test_parse_fasta_format_binary(self):
+        data = TEST_FASTA.replace('first', 'f\u00efrst').encode('utf-8') + b'\r\n>\xff bad\nA'
+        self.assertEqual(
+            list(fasta_format.parse_fasta_format(io.BytesIO(data), 7)),
+            [('f\u00efrst record', b'ACGTACG'), ('second record', b'TTTTGG'),
+             ('\udcff bad', b'A')])
+
+    def test_scan_fasta_format(self):
+        for data in [TEST_FASTA.encode(), TEST_FASTA.replace('\n', '\r\n').encode(),
+                     b'>a\n\n  \n>b\nA C\t\n>\nAC\n>c d\nAC\n\nGT\n>e', b'', b'ACGT\n',
+                     benchmark.make_fasta_database(20000, seed=9).encode()]:
+            self.assertEqual(
+                [(d, fasta_format.read_sequence(data, start, end))
+                 for d, start, end in fasta_format.scan_fasta_format(data)],
+                list(fasta_format.parse_fasta_format(io.BytesIO(data))))
+
+    def test_print_fasta_description_binary(self):
+        text, binary = io.StringIO(), io.BytesIO()
+        sequence = benchmark.make_fasta_database(1, seed=2).split('\n', 1)[1]
+        sequence = ''.join(sequence.split())
+        fasta_format.print_fasta_description(text, 'descr\u00efption', sequence)
+        fasta_format.print_fasta_description(
+            binary, 'descr\u00efption', memoryview(sequence.encode()))
+        self.assertEqual(text.getvalue().encode('utf-8'), binary.getvalue())
+        self.assertTrue(fasta_format.is_binary(binary))
+        self.assertFalse(fasta_format.is_binary(text))
+
+    def test_fasta_writer(self):
+        data = benchmark.make_fasta_database(20000, seed=6)
+        records = list(fasta_format.parse_fasta_format(io.StringIO(data)))
+        for flushThreshold in [1, 100, 1 << 20]:
+            text, binary = io.StringIO(), io.BytesIO()
+            with fasta_format.FastaWriter(text, flushThreshold=flushThreshold) as writer:
+                for description, sequence in records:
+                    writer.write(description, sequence)
+            with fasta_format.FastaWriter(binary, flushThreshold=flushThreshold) as writer:
+                for description, sequence in records:
+                    writer.write(description, sequence.encode())
+            self.assertEqual(text.getvalue(), data)
+            self.assertEqual(binary.getvalue(), data.encode())
+
+    def test_fasta_writer_width(self):
+        for width in [1, 7, 80]:
+            binary = io.BytesIO()
+            with fasta_format.FastaWriter(binary, width) as writer:
+                writer.write('d', b'ACGTACGTACGTACGTA')
+            self.assertEqual(
+                binary.getvalue(),
+                b'>d\n%s\n\n' % fasta_format.split_str(b'ACGTACGTACGTACGTA', width))
+
+    def test_parse_fasta_format_matches_legacy(self):
+        data = benchmark.make_fasta_database(100000, seed=1)
+        self.assertEqual(
+            list(fasta_format.parse_fasta_format(io.StringIO(data), 4096)),
+            list(benchmark.legacy_parse_fasta_format(io.StringIO(data))))
+
+    def test_index_fasta(self):
+        data = benchmark.make_fasta_database(20000, seed=3).encode()
+        records = list(fasta_format.parse_fasta_format(io.BytesIO(data)))
+        indexed = list(fasta_format.index_fasta(b'junk\n' + data))
+        self.assertEqual(len(records), len(indexed))
+        for (description, sequence), (indexedDescription, entry) in zip(records, indexed):
+            self.assertEqual(description, indexedDescription)
+            self.assertEqual(entry.name, description.split()[0])
+            self.assertEqual(entry.length, len(sequence))
+            self.assertEqual((entry.linebases, entry.linewidth), (70, 71))
+            self.assertEqual(fasta_format.fetch_sequence(b'junk\n' + data, entry), sequence)
+            self.assertEqual(
+                fasta_format.read_indexed_description(b'junk\n' + data, entry), description)
+            o = io.BytesIO()
+            fasta_format.write_indexed_record(o, b'junk\n' + data, entry, 'x')
+            self.assertEqual(o.getvalue(), b'>x\n%s\n\n' % fasta_format.split_str(sequence, 70))
+
+    def test_index_fasta_format(self):
+        data = b'>a one\r\nACG\r\nTA\r\n>b\n>c\nAC\nGT\nA'
+        entries = [e for _, e in fasta_format.index_fasta(data)]
+        self.assertEqual(entries, [
+            fasta_format.FastaIndexEntry('a', 5, 8, 3, 5),
+            fasta_format.FastaIndexEntry('b', 0, 20, 0, 0),
+            fasta_format.FastaIndexEntry('c', 5, 23, 2, 3)])
+        self.assertEqual([fasta_format.fetch_sequence(data, e) for e in entries],
+                         [b'ACGTA', b'', b'ACGTA'])
+        buffer = io.StringIO()
+        fasta_format.write_fasta_index(buffer, entries)
+        self.assertEqual(buffer.getvalue(), 'a\t5\t8\t3\t5\nb\t0\t20\t0\t0\nc\t5\t23\t2\t3\n')
+        self.assertEqual(
+            list(fasta_format.read_fasta_index(io.StringIO(buffer.getvalue()))), entries)
+        self.assertEqual(list(fasta_format.index_fasta(b'no records')), [])
+        with self.assertRaises(fasta_format.LineLengthError):
+            list(fasta_format.index_fasta(b'>bad\nACGT\nA\nACGT\n'))
+
+    def test_split_fasta_file(self):
+        data = b'junk\n' + benchmark.make_fasta_database(30000, seed=4).encode()
+        expected = list(fasta_format.parse_fasta_format(io.BytesIO(data)))
+        for count in [1, 2, 3, 10, 1000]:
+            f = io.BytesIO(data)
+            ranges = fasta_format.split_fasta_file(f, count)
+            self.assertLessEqual(len(ranges), count)
+            self.assertEqual(ranges[0][0], 0)
+            self.assertEqual(ranges[-1][1], len(data))
+            records = []
+            for start, end in ranges:
+                if start:
+                    self.assertEqual(data[start:start + 1], b'>')
+                records.extend(fasta_format.parse_fasta_format(
+                    fasta_format.FileRange(f, start, end), 100))
+            self.assertEqual(records, expected)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(format='%(levelname)s:  %(message)s', level='WARNING')
+    unittest.main()
@@ -0,0 +1,53 @@
+#! /usr/bin/env python3
+
+# Copyright 2023 Hal W Canary III, Lindsay R Saunders PhD.
+# Use of this program is governed by contents of the LICENSE file.
+
+import logging
+import pickle
+import random
+import unittest
+
+import benchmark
+from packed_sequence import PackedSequence
+
+
+class PackedSequenceTestCase(unittest.TestCase):
+    def test_round_trip(self):
+        r = random.Random(13)
+        sequences = ['', 'A', 'ACG', 'ACGT', 'ACGTA', 'NNNN', 'acgtACGT', 'ACGTYKRSWN',
+                     'ACÇGTÇÇA', 'N' * 70000 + 'ACGT']
+        sequences += [benchmark.make_random_sequence(r) for _ in range(50)]
+        for sequence in sequences:
+            for s in [sequence, sequence.encode('utf-8')]:
+                packed = PackedSequence(s)
+                self.assertEqual(packed.unpack(), s)
+                self.assertEqual(len(packed), len(s))
+                self.assertEqual(packed.agtcCount, sum(1 for c in sequence if c in 'AGTC'))
+                self.assertEqual(pickle.loads(pickle.dumps(packed)).unpack(), s)
+
+    def test_exceptions(self):
+        packed = PackedSequence(b'NACGTYKACGTRRR')
+        self.assertEqual(list(packed.exceptions()), [(0, b'N'), (5, b'YK'), (11, b'RRR')])
+        self.assertEqual(packed.agtc_fraction(), 8 / 14)
+        self.assertEqual(list(PackedSequence('ACGT').exceptions()), [])
+        self.assertEqual(list(PackedSequence('AÇ').exceptions()), [(1, 'Ç')])
+
+    def test_size(self):
+        sequence = b'ACGT' * 250
+        packed = PackedSequence(sequence)
+        self.assertEqual(len(packed.data), len(sequence) // 4)
+        self.assertEqual(packed.agtc_fraction(), 1.0)
+        packed = PackedSequence(sequence + b'N')
+        self.assertEqual(len(packed.data), len(sequence) // 4 + 1 + 4 + 1)
+
+    def test_from_data(self):
+        packed = PackedSequence('ACGTNNA')
+        copy = PackedSequence.from_data(
+            packed.length, packed.agtcCount, packed.runs, memoryview(packed.data), True)
+        self.assertEqual(copy.unpack(), 'ACGTNNA')
+
+
+if __name__ == '__main__':
+    logging.basicConfig(format='%(levelname)s:  %(message)s', level='WARNING')
+    unittest.main()
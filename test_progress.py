@@ -0,0 +1,59 @@
+#! /usr/bin/env python3
+
+# Copyright 2023 Hal W Canary III, Lindsay R Saunders PhD.
+# Use of this program is governed by contents of the LICENSE file.
+
+import io
+import logging
+import tempfile
+import unittest
+
+import progress
+
+
+class ProgressTestCase(unittest.TestCase):
+    def test_track_file(self):
+        with tempfile.TemporaryFile(buffering=0) as f:
+            f.write(b'x' * 1000)
+            f.seek(0)
+            stream = io.StringIO()
+            reporter = progress.ProgressReporter(f, logging.getLogger(), stream, interval=0)
+            records = iter(range(25))
+
+            def read():
+                for record in records:
+                    f.read(40)
+                    yield record
+            self.assertEqual(list(reporter.track(read(), every=10)), list(range(25)))
+        lines = stream.getvalue().split('\r')[1:]
+        # A report after each batch of 10, and a last one.
+        self.assertEqual(len(lines), 4)
+        self.assertTrue(lines[0].startswith(' 40.0%, 10 records, '))
+        self.assertTrue(lines[-1].startswith('100.0%, 25 records, '))
+        self.assertIn('ETA 0:00:00', lines[-1])
+        self.assertTrue(lines[-1].endswith('\n'))
+
+    def test_track_position(self):
+        with tempfile.TemporaryFile() as f:
+            f.write(b'x' * 100)
+            f.seek(0)
+            reporter = progress.ProgressReporter(f, logging.getLogger(), interval=3600)
+            with self.assertLogs(level='INFO') as logs:
+                self.assertEqual(sum(reporter.track(range(10), lambda r: r * 5)), 45)
+        self.assertEqual(len(logs.records), 1)
+        message = logs.records[0].getMessage()
+        self.assertTrue(message.startswith('progress records=10 seconds='))
+        self.assertIn(' bytes=45 ', message)
+        self.assertIn(' percent=45.0 ', message)
+
+    def test_track_stream(self):
+        stream = io.StringIO()
+        reporter = progress.ProgressReporter(io.BytesIO(b'ACGT'), None, stream)
+        self.assertIsNone(reporter.size)
+        self.assertEqual(list(reporter.track('abc')), ['a', 'b', 'c'])
+        self.assertRegex(stream.getvalue(), r'^\r3 records, \d+ records/s\n$')
+
+
+if __name__ == '__main__':
+    logging.basicConfig(format='%(levelname)s:  %(message)s', level='WARNING')
+    unittest.main()
@@ -0,0 +1,82 @@
+#! /usr/bin/env python3
+
+# Copyright 2023 Hal W Canary III, Lindsay R Saunders PhD.
+# Use of this program is governed by contents of the LICENSE file.
+
+import io
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+import urllib.error
+import urllib.request
+
+import benchmark
+import bestSequenceEachSpecies as bioscript
+import query_server
+
+
+def expected_output(data, genus, count=1, skipNoSpecies=False):
+    buffer = io.BytesIO()
+    bioscript.get_best_sequence_each_species(
+        io.BytesIO(data), buffer, genus, logging.getLogger(), count, skipNoSpecies)
+    return buffer.getvalue()
+
+
+class QueryServerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'database.fasta')
+        self.data = benchmark.make_fasta_database(100000, seed=18).encode()
+        with open(self.path, 'wb') as o:
+            o.write(self.data)
+        resident = query_server.ResidentDatabase(self.path, logging.getLogger())
+        self.server = query_server.QueryServer(('127.0.0.1', 0), resident, logging.getLogger())
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.thread.join()
+        self.server.server_close()
+        shutil.rmtree(self.directory)
+
+    def get(self, query):
+        url = 'http://127.0.0.1:%d/best?%s' % (self.server.server_address[1], query)
+        with urllib.request.urlopen(url) as response:
+            return response.read()
+
+    def test_query(self):
+        self.assertEqual(self.get(''), expected_output(self.data, None))
+        self.assertEqual(self.get('genus=Genus4&count=3&skipnone=1'),
+                         expected_output(self.data, 'Genus4', 3, True))
+        for query, status in [('genus=Missing', 404), ('count=x', 400)]:
+            with self.assertRaises(urllib.error.HTTPError) as context:
+                self.get(query)
+            self.assertEqual(context.exception.code, status)
+
+    def test_reload(self):
+        self.assertEqual(self.get('genus=Genus1'), expected_output(self.data, 'Genus1'))
+        data = benchmark.make_fasta_database(50000, seed=19).encode()
+        with open(self.path, 'wb') as o:
+            bioscript.make_sequence_database(io.BytesIO(data), o, logging.getLogger())
+        mtime = os.stat(self.path).st_mtime_ns + 1000000000
+        os.utime(self.path, ns=(mtime, mtime))
+        self.assertEqual(self.get('genus=Genus1'), expected_output(data, 'Genus1'))
+        # A file that can not be loaded leaves the last version in place.
+        with open(self.path, 'wb') as o:
+            o.write(b'>XX1.1 Unparsable\nACGT\n')
+        self.assertEqual(self.get('genus=Genus1'), expected_output(data, 'Genus1'))
+        # So does a file that has been removed, until it is replaced.
+        os.remove(self.path)
+        self.assertEqual(self.get('genus=Genus1'), expected_output(data, 'Genus1'))
+        with open(self.path, 'wb') as o:
+            o.write(self.data)
+        self.assertEqual(self.get('genus=Genus1'), expected_output(self.data, 'Genus1'))
+
+
+if __name__ == '__main__':
+    logging.basicConfig(format='%(levelname)s:  %(message)s', level='WARNING')
+    unittest.main()
@@ -0,0 +1,53 @@
+#! /usr/bin/env python3
+
+# Copyright 2023 Hal W Canary III, Lindsay R Saunders PhD.
+# Use of this program is governed by contents of the LICENSE file.
+
+import logging
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+import result_cache
+
+
+class ResultCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_cache_key(self):
+        key = result_cache.cache_key
+        self.assertEqual(key('a', 1, b'x'), key('a', 1, b'x'))
+        self.assertNotEqual(key('ab', 'c'), key('a', 'bc'))
+        self.assertNotEqual(key(1), key('1'))
+        self.assertNotEqual(key(True), key(1))
+
+    def test_get_put(self):
+        cache = result_cache.ResultCache(os.path.join(self.directory, 'cache'))
+        self.assertIsNone(cache.get('k'))
+        cache.put('k', b'value')
+        self.assertEqual(cache.get('k'), b'value')
+        cache.put('k', b'other')
+        self.assertEqual(cache.get('k'), b'other')
+        self.assertEqual(os.listdir(cache.directory), ['k'])
+
+    def test_evict_least_recently_used(self):
+        cache = result_cache.ResultCache(self.directory, maxSize=250)
+        now = time.time()
+        for i, key in enumerate(['a', 'b']):
+            cache.put(key, b'x' * 100)
+            os.utime(os.path.join(self.directory, key), (now - 100 + i, now - 100 + i))
+        self.assertEqual(cache.get('a'), b'x' * 100)
+        cache.put('c', b'x' * 100)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(sorted(os.listdir(self.directory)), ['a', 'c'])
+
+
+if __name__ == '__main__':
+    logging.basicConfig(format='%(levelname)s:  %(message)s', level='WARNING')
+    unittest.main()
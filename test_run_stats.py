@@ -0,0 +1,73 @@
+#! /usr/bin/env python3
+
+# Copyright 2023 Hal W Canary III, Lindsay R Saunders PhD.
+# Use of this program is governed by contents of the LICENSE file.
+
+import io
+import json
+import logging
+import time
+import unittest
+
+import run_stats
+
+
+class RunStatsTestCase(unittest.TestCase):
+    def test_stages_exclude_nested(self):
+        stats = run_stats.RunStats()
+        with stats.stage('outer'):
+            time.sleep(0.02)
+            with stats.stage('inner'):
+                time.sleep(0.05)
+        with run_stats.stage(None, 'ignored'):
+            pass
+        stats.finish()
+        self.assertEqual(list(stats.stageTimes), ['inner', 'outer'])
+        self.assertGreaterEqual(stats.stageTimes['inner'], 0.05)
+        self.assertLess(stats.stageTimes['outer'], 0.05)
+        values = stats.as_dict()
+        self.assertAlmostEqual(sum(values['stages'].values()), values['seconds'])
+
+    def test_timed(self):
+        stats = run_stats.RunStats(slowest=2)
+        items = list(stats.timed_iter('parse', ['a', 'bb', 'ccc']))
+        self.assertEqual(items, ['a', 'bb', 'ccc'])
+        length = stats.timed('score', len)
+        self.assertEqual([length(s) for s in items], [1, 2, 3])
+
+        def describe(description):
+            time.sleep(0.01 * len(description))
+            return description.upper()
+        describe = stats.timed_describe(describe)
+        self.assertEqual([describe(s) for s in items], ['A', 'BB', 'CCC'])
+        self.assertEqual([d for _, d in sorted(stats.slowestDescriptions)], ['bb', 'ccc'])
+        self.assertEqual(list(stats.stageTimes), ['parse', 'score', 'describe'])
+        self.assertGreaterEqual(stats.stageTimes['describe'], 0.06)
+
+    def test_report(self):
+        stats = run_stats.RunStats()
+        stats.timed_describe(str.upper)('a description')
+        stats.records, stats.bytes = 10, 1000
+        stats.finish()
+        values = json.loads(self._report(stats, 'json'))
+        self.assertEqual(values['records'], 10)
+        self.assertEqual(values['bytes'], 1000)
+        self.assertEqual(values['slowestDescriptions'][0]['description'], 'a description')
+        self.assertEqual(values['peakRss'], run_stats.peak_rss())
+        text = self._report(stats, 'text')
+        self.assertIn('describe', text)
+        self.assertIn('a description', text)
+        if run_stats.resource is not None:
+            self.assertGreater(run_stats.peak_rss(), 1 << 20)
+            self.assertIn('peak RSS', text)
+
+    @staticmethod
+    def _report(stats, format):
+        f = io.StringIO()
+        stats.report(f, format)
+        return f.getvalue()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(format='%(levelname)s:  %(message)s', level='WARNING')
+    unittest.main()
@@ -0,0 +1,64 @@
+#! /usr/bin/env python3
+
+# Copyright 2023 Hal W Canary III, Lindsay R Saunders PhD.
+# Use of this program is governed by contents of the LICENSE file.
+
+import logging
+import os
+import shutil
+import tempfile
+import unittest
+
+import score_index
+
+
+Record = score_index.IndexedRecord
+RECORDS = [
+    Record('A', 'A_x', 'A_x_1', 'XX1.1', 'A_x_1 XX1.1', 0, 1, 0.5, 0, 4, 10, 20),
+    Record('B', 'B_y', 'B_y_2', 'NR_2.1', 'B_y_2 NR_2.1', 1, 0, 1.0, 1, 8, 30, 45),
+    Record('A', 'A_z', 'A_z_3', 'XX3.1', 'A_z_3 XX3.1', 0, 0, 0.25, 0, 2, 50, 60),
+]
+
+
+class ScoreIndexTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'index.sqlite')
+        self.source = os.path.join(self.directory, 'source.fasta')
+        with open(self.source, 'wb') as o:
+            o.write(b'>XX1.1 A x\nACGT\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_query_records(self):
+        fileStat = os.stat(self.source)
+        self.assertEqual(score_index.write_score_index(self.path, RECORDS, fileStat), 3)
+        self.assertFalse(os.path.exists(self.path + '.tmp'))
+        with score_index.open_score_index(self.path, fileStat) as connection:
+            self.assertEqual(score_index.record_count(connection), 3)
+            for genera, species, skipNoSpecies, expected in [
+                    (None, None, False, RECORDS), (['A'], None, False, [RECORDS[0], RECORDS[2]]),
+                    (None, None, True, [RECORDS[0], RECORDS[2]]),
+                    (['A', 'B'], ['B_y', 'A_z'], False, RECORDS[1:]), ([], None, False, [])]:
+                self.assertEqual(list(score_index.query_records(
+                    connection, genera, species, skipNoSpecies)), expected)
+
+    def test_out_of_date(self):
+        score_index.write_score_index(self.path, RECORDS, os.stat(self.source))
+        with open(self.source, 'ab') as o:
+            o.write(b'>XX2.1 A x\nACGT\n')
+        with self.assertRaises(RuntimeError):
+            with score_index.open_score_index(self.path, os.stat(self.source)):
+                pass
+        with self.assertRaises(RuntimeError):
+            with score_index.open_score_index(self.source, os.stat(self.source)):
+                pass
+        with self.assertRaises(RuntimeError):
+            with score_index.open_score_index(self.path + '.missing', os.stat(self.source)):
+                pass
+
+
+if __name__ == '__main__':
+    logging.basicConfig(format='%(levelname)s:  %(message)s', level='WARNING')
+    unittest.main()
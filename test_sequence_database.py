@@ -0,0 +1,86 @@
+#! /usr/bin/env python3
+
+# Copyright 2023 Hal W Canary III, Lindsay R Saunders PhD.
+# Use of this program is governed by contents of the LICENSE file.
+
+import logging
+import os
+import shutil
+import tempfile
+import unittest
+
+import sequence_database
+from packed_sequence import PackedSequence
+
+
+RECORDS = [
+    ('Genus', 'Genus_alpha', 'Genus_alpha_strain_1', 'XX1.1 Genus alpha strain 1 16S',
+     'Genus_alpha_strain_1 16S XX1.1', sequence_database.REFSEQ, b'ACGTNACGT'),
+    ('Other', 'Other_beta', 'Other_beta_XX2.1', 'XX2.1 Other beta café',
+     'Other_beta_XX2.1 café XX2.1', 0, b'A' * 1000),
+    ('Genus', 'Genus_alpha', 'Genus_alpha_XX3.1', 'XX3.1 Genus alpha',
+     'Genus_alpha_XX3.1  XX3.1', sequence_database.NO_SPECIES, b'RYKM'),
+]
+
+
+class SequenceDatabaseTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'database')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, records):
+        with open(self.path, 'wb') as o:
+            o.write(b'junk')
+            o.seek(0)
+            with sequence_database.SequenceDatabaseWriter(o) as writer:
+                for *fields, sequence in records:
+                    writer.add(*fields, PackedSequence(sequence))
+            self.assertEqual(writer.count, len(records))
+
+    def test_round_trip(self):
+        self.write(RECORDS)
+        with open(self.path, 'rb') as f:
+            self.assertTrue(sequence_database.is_sequence_database(f))
+            self.assertEqual(f.tell(), 0)
+            with sequence_database.SequenceDatabase(f) as database:
+                self.assertEqual(len(database), 3)
+                self.assertEqual(database.names, ['Genus', 'Genus_alpha', 'Other', 'Other_beta'])
+                entries = list(database.entries())
+                self.assertEqual(list(database.entries(2)), entries[2:])
+                for index, (entry, record) in enumerate(zip(entries, RECORDS)):
+                    genus, species, strain, description, processed, flags, sequence = record
+                    self.assertEqual(entry, database.entry(index))
+                    self.assertEqual(database.names[entry.genus], genus)
+                    self.assertEqual(database.names[entry.species], species)
+                    self.assertEqual(database.strings(entry), (description, processed, strain))
+                    self.assertEqual(entry.flags, flags)
+                    self.assertEqual(entry.length, len(sequence))
+                    self.assertEqual(entry.agtcCount, PackedSequence(sequence).agtcCount)
+                    self.assertEqual(database.sequence(index), sequence)
+
+    def test_empty(self):
+        self.write([])
+        with open(self.path, 'rb') as f, sequence_database.SequenceDatabase(f) as database:
+            self.assertEqual((len(database), database.names), (0, []))
+            self.assertEqual(list(database.entries()), [])
+
+    def test_invalid(self):
+        with open(self.path, 'wb') as o:
+            o.write(b'>XX1.1 Genus alpha\nACGT\n' * 10)
+        with open(self.path, 'rb') as f:
+            self.assertFalse(sequence_database.is_sequence_database(f))
+            with self.assertRaises(ValueError):
+                sequence_database.SequenceDatabase(f)
+        self.write(RECORDS)
+        with open(self.path, 'r+b') as f:
+            f.truncate(os.path.getsize(self.path) - 1)
+            with self.assertRaises(ValueError):
+                sequence_database.SequenceDatabase(f)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(format='%(levelname)s:  %(message)s', level='WARNING')
+    unittest.main()
@@ -0,0 +1,76 @@
+#! /usr/bin/env python3
+
+# Copyright 2023 Hal W Canary III, Lindsay R Saunders PhD.
+# Use of this program is governed by contents of the LICENSE file.
+
+import io
+import logging
+import unittest
+
+import benchmark
+import fasta_format
+import threaded_io
+
+
+class FailingFile(object):
+    def read(self, size=-1):
+        raise OSError('read failed')
+
+    def write(self, b):
+        raise OSError('write failed')
+
+
+class ThreadedIOTestCase(unittest.TestCase):
+    data = benchmark.make_fasta_database(100000, seed=7).encode()
+
+    def test_read_ahead(self):
+        for blocksize in [1000, 1 << 20]:
+            for size in [1, 100, 1000, 5000, -1]:
+                with threaded_io.ReadAheadReader(io.BytesIO(self.data), blocksize, 2) as f:
+                    chunks = []
+                    while True:
+                        chunk = f.read(size)
+                        if not chunk:
+                            break
+                        self.assertLessEqual(len(chunk), len(self.data) if size < 0 else size)
+                        chunks.append(chunk)
+                    self.assertEqual(b''.join(chunks), self.data)
+                    self.assertEqual(f.read(), b'')
+
+    def test_read_ahead_parse(self):
+        with threaded_io.ReadAheadReader(io.BytesIO(self.data), 777) as f:
+            self.assertEqual(
+                list(fasta_format.parse_fasta_format(f)),
+                list(fasta_format.parse_fasta_format(io.BytesIO(self.data))))
+
+    def test_read_ahead_close_early(self):
+        f = threaded_io.ReadAheadReader(io.BytesIO(self.data), 10, 1)
+        f.read(1)
+        f.close()
+        self.assertFalse(f.thread.is_alive())
+
+    def test_read_ahead_error(self):
+        with threaded_io.ReadAheadReader(FailingFile()) as f:
+            with self.assertRaises(OSError):
+                f.read()
+
+    def test_write_behind(self):
+        o = io.BytesIO()
+        with threaded_io.WriteBehindWriter(o, 2) as w:
+            buffer = bytearray()
+            for i in range(0, len(self.data), 1000):
+                buffer += self.data[i:i + 1000]
+                w.write(buffer)
+                buffer.clear()
+        self.assertEqual(o.getvalue(), self.data)
+
+    def test_write_behind_error(self):
+        w = threaded_io.WriteBehindWriter(FailingFile())
+        w.write(b'x')
+        with self.assertRaises(OSError):
+            w.close()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(format='%(levelname)s:  %(message)s', level='WARNING')
+    unittest.main()
@@ -0,0 +1,149 @@
+# Copyright 2023 Hal W Canary III, Lindsay R Saunders PhD.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+'''
+Background threads for file input and output, so that reading, parsing, and
+writing overlap.  File reads and writes, and zlib and Zstandard
+(de)compression, release the GIL while they work.
+'''
+
+import queue
+import threading
+
+from fasta_format import BLOCK_SIZE
+
+
+class ReadAheadReader(object):
+    '''
+    Reads a binary file object on a background thread, keeping up to `depth`
+    blocks of `blocksize` bytes ready for `read`.  Use it as a context
+    manager, or call `close`, to stop the thread.  `f` is left open.
+    '''
+    def __init__(self, f, blocksize=BLOCK_SIZE, depth=4):
+        self.f, self.blocksize = f, blocksize
+        self.queue = queue.Queue(depth)
+        self.current, self.position = b'', 0
+        self.eof, self.stopped = False, False
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _put(self, item):
+        while not self.stopped:
+            try:
+                self.queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _run(self):
+        try:
+            while True:
+                block = self.f.read(self.blocksize)
+                if not self._put(block) or not block:
+                    return
+        except BaseException as e:
+            self._put(e)
+
+    def _next_block(self):
+        if self.eof:
+            return b''
+        block = self.queue.get()
+        if isinstance(block, BaseException):
+            self.eof = True
+            raise block
+        self.eof = not block
+        return block
+
+    def read(self, size=-1):
+        if self.position == len(self.current):
+            self.current, self.position = self._next_block(), 0
+        if size is None or size < 0:
+            blocks = [self.current[self.position:]]
+            while blocks[-1]:
+                blocks.append(self._next_block())
+            self.current, self.position = b'', 0
+            return b''.join(blocks)
+        if self.position == 0 and size >= len(self.current):
+            # The usual case: hand over a whole block without copying it.
+            result = self.current
+        else:
+            result = self.current[self.position:self.position + size]
+        self.position += len(result)
+        return result
+
+    def close(self):
+        self.stopped = True
+        self.thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class WriteBehindWriter(object):
+    '''
+    Writes to a binary file object on a background thread.  `write` copies
+    its argument and returns at once, unless `depth` earlier writes are still
+    waiting.  Use it as a context manager, or call `close`, to finish writing;
+    an error from the background thread is raised by the next `write` or by
+    `close`.  `o` is left open.
+    '''
+    def __init__(self, o, depth=4):
+        self.o = o
+        self.queue = queue.Queue(depth)
+        self.error = None
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while True:
+            chunk = self.queue.get()
+            if chunk is None:
+                return
+            if self.error is None:
+                try:
+                    self.o.write(chunk)
+                except BaseException as e:
+                    self.error = e
+
+    def write(self, b):
+        if self.error is not None:
+            raise self.error
+        self.queue.put(bytes(b))
+        return len(b)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        if self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join()
+        if self.error is not None:
+            raise self.error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()